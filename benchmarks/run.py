@@ -0,0 +1,228 @@
+"""Offline benchmarks for wtf; prints one JSON document with every measurement.
+
+    python -m benchmarks.run [--suite cli,import,history,config] [--sizes 1000,100000] [-o results.json]
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from .stub_server import StubServer
+
+SUITES = ["import", "config", "history", "cli"]
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+# Temporary home directories created during the run, removed at the end
+_homes: List[Path] = []
+
+def summary(name: str, samples: List[float], **extra) -> Dict:
+    """Summarize timings in seconds"""
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, -(-len(ordered) * p // 100) - 1))]
+
+    return {
+        "name": name,
+        "unit": "s",
+        "samples": len(ordered),
+        "min": ordered[0],
+        "p50": rank(50),
+        "p90": rank(90),
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+        **extra
+    }
+
+def measure(fn: Callable[[], object], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def fresh_home() -> Path:
+    """Point HOME at an empty directory so runs never touch the user's config or history"""
+    home = Path(tempfile.mkdtemp(prefix='wtf-bench-'))
+    _homes.append(home)
+    os.environ['HOME'] = str(home)
+    return home
+
+def bench_import(repeat: int) -> List[Dict]:
+    """Cold interpreter start plus `import wtf`, against a bare interpreter start"""
+    def run(code: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, env=os.environ.copy())
+        return time.perf_counter() - start
+
+    run('import wtf')  # warm the bytecode cache
+    return [
+        summary("import.python", [run('pass') for _ in range(repeat)]),
+        summary("import.wtf", [run('import wtf') for _ in range(repeat)]),
+    ]
+
+def bench_config(repeat: int) -> List[Dict]:
+    from wtf import config as config_module
+
+    fresh_home()
+    cache_file = config_module.Config().cache_file  # also creates config.yaml
+
+    def cold():
+        cache_file.unlink(missing_ok=True)
+        config_module.Config()
+
+    return [
+        summary("config.load_yaml", measure(cold, repeat)),
+        summary("config.load_cached", measure(config_module.Config, repeat)),
+        summary("config.get_config", measure(config_module.get_config, repeat)),
+    ]
+
+def history_entry(i: int, now: datetime) -> Dict:
+    return {
+        "timestamp": (now - timedelta(seconds=i)).isoformat(),
+        "prompt": f"find all files named report-{i}.pdf modified in the last week",
+        "command": f"find . -name 'report-{i}.pdf' -mtime -7",
+        "success": i % 20 != 0,
+        "metadata": {"provider": "openai", "model": "gpt-4o", "latency": 0.5 + (i % 100) / 100, "shell": "zsh",
+                     "cache_hit": False},
+    }
+
+def seed_history(backend: str, size: int):
+    """Write size entries straight to the store, oldest first"""
+    from wtf.history import History
+
+    store = History(backend).store
+    now = datetime.now()
+    chunk = 10000
+    for start in range(size, 0, -chunk):
+        store.append_many([history_entry(i, now) for i in range(start, max(0, start - chunk), -1)])
+    return store
+
+def bench_history(repeat: int, sizes: List[int], backends: List[str]) -> List[Dict]:
+    from rich.console import Console
+    from wtf.config import get_config
+    from wtf.history import History
+
+    results = []
+    for backend in backends:
+        for size in sizes:
+            home = fresh_home()
+            get_config()
+            seed_history(backend, size)
+            size_bytes = sum(path.stat().st_size for path in (home / '.config' / 'wtf').glob('history*'))
+            history = History(backend)
+            devnull = open(os.devnull, 'w')
+            history._console = Console(file=devnull)
+            extra = {"backend": backend, "entries": size, "bytes": size_bytes}
+
+            counter = iter(range(repeat * 2))
+            results += [
+                summary("history.add", measure(
+                    lambda: history.add(f"benchmark prompt {next(counter)}", "true", metadata={"latency": 0.1}),
+                    repeat), **extra),
+                summary("history.load", measure(history.load, repeat), **extra),
+                summary("history.show", measure(lambda: history.show(limit=20), repeat), **extra),
+                summary("history.search", measure(lambda: history.search(text="report-500", limit=20), repeat),
+                        **extra),
+            ]
+            devnull.close()
+            if hasattr(history.store, 'close'):
+                history.store.close()
+    return results
+
+def bench_cli(repeat: int, latency: float, token_delay: float) -> List[Dict]:
+    """End-to-end `wtf <prompt>` runs against the stub server, each in a new interpreter"""
+    results = []
+    with StubServer(latency=latency, token_delay=token_delay) as server:
+        env = {**os.environ, **server.environ(), "HOME": str(fresh_home())}
+
+        def run(*args: str) -> float:
+            code = f"import sys; sys.argv = ['wtf', *{list(args)!r}]; import wtf; wtf.main()"
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True, env=env, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return time.perf_counter() - start
+
+        run('--history')  # create config.yaml and warm bytecode
+        extra = {"stub_latency": latency, "stub_token_delay": token_delay}
+        for provider in ["openai", "anthropic"]:
+            results.append(summary(f"cli.{provider}", [
+                run('-p', provider, '--no-cache', 'list', 'files') for _ in range(repeat)
+            ], **extra))
+            results.append(summary(f"cli.{provider}.stream", [
+                run('-p', provider, '--no-cache', '--stream', 'list', 'files') for _ in range(repeat)
+            ], **extra))
+        run('list', 'files', 'cached')
+        results.append(summary("cli.cache_hit", [run('list', 'files', 'cached') for _ in range(repeat)]))
+    return results
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suite', default=','.join(SUITES), help=f"Comma-separated suites: {', '.join(SUITES)}")
+    parser.add_argument('--repeat', type=int, default=10, help="Samples per measurement")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="History sizes to benchmark")
+    parser.add_argument('--backends', default='jsonl,sqlite', help="History backends to benchmark")
+    parser.add_argument('--latency', type=float, default=0.05, help="Stub server delay before responding (s)")
+    parser.add_argument('--token-delay', type=float, default=0.005, help="Stub server delay between streamed events (s)")
+    parser.add_argument('-o', '--output', help="Write results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    suites = args.suite.split(',')
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(sorted(unknown))}")
+
+    # Every suite runs against a throwaway HOME
+    real_home = os.environ.get('HOME')
+    results = []
+    try:
+        if 'import' in suites:
+            fresh_home()
+            results += bench_import(args.repeat)
+        if 'config' in suites:
+            results += bench_config(args.repeat)
+        if 'history' in suites:
+            results += bench_history(args.repeat, [int(size) for size in args.sizes.split(',')],
+                                     args.backends.split(','))
+        if 'cli' in suites:
+            results += bench_cli(args.repeat, args.latency, args.token_delay)
+    finally:
+        if real_home is not None:
+            os.environ['HOME'] = real_home
+        while _homes:
+            shutil.rmtree(_homes.pop(), ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
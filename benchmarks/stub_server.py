@@ -0,0 +1,172 @@
+"""Local stand-ins for the OpenAI chat-completions and Anthropic messages APIs"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+import json
+import threading
+import time
+
+# Prompt tokens each response reports as served from the provider's prompt cache
+CACHED_TOKENS = 32
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        self.server.requests.append({"path": self.path, "body": body})
+        time.sleep(self.server.latency)
+
+        if self.path.endswith('/chat/completions'):
+            events = self.openai_events(body) if body.get('stream') else None
+            response = None if events else self.openai_response(body)
+        elif self.path.endswith('/messages'):
+            events = self.anthropic_events(body) if body.get('stream') else None
+            response = None if events else self.anthropic_response(body)
+        else:
+            self.send_json(404, {"error": {"type": "not_found", "message": f"No route for {self.path}"}})
+            return
+
+        if response is not None:
+            self.send_json(200, response)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for event in events:
+            self.write_chunk(event.encode())
+            time.sleep(self.server.token_delay)
+        self.write_chunk(b'')
+
+    def send_json(self, status: int, data: Dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def tokens(self) -> List[str]:
+        words = self.server.command.split(' ')
+        return [words[0]] + [' ' + word for word in words[1:]]
+
+    def openai_response(self, body: Dict) -> Dict:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.server.command},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 50, "completion_tokens": len(self.tokens()), "total_tokens": 50 + len(self.tokens()),
+                      "prompt_tokens_details": {"cached_tokens": CACHED_TOKENS}}
+        }
+
+    def openai_events(self, body: Dict) -> List[str]:
+        def chunk(choices: List[Dict], **extra) -> str:
+            data = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get('model'),
+                "choices": choices,
+                **extra
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        def delta(content: Dict, finish_reason=None) -> str:
+            return chunk([{"index": 0, "delta": content, "finish_reason": finish_reason}])
+
+        events = [delta({"role": "assistant", "content": ""})]
+        events += [delta({"content": token}) for token in self.tokens()]
+        events += [delta({}, "stop")]
+        if (body.get('stream_options') or {}).get('include_usage'):
+            events.append(chunk([], usage=self.openai_response(body)['usage']))
+        events.append("data: [DONE]\n\n")
+        return events
+
+    def anthropic_response(self, body: Dict) -> Dict:
+        return {
+            "id": "msg_stub",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get('model'),
+            "content": [{"type": "text", "text": self.server.command}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 50 - CACHED_TOKENS, "cache_read_input_tokens": CACHED_TOKENS,
+                      "cache_creation_input_tokens": 0, "output_tokens": len(self.tokens())}
+        }
+
+    def anthropic_events(self, body: Dict) -> List[str]:
+        def event(data: Dict) -> str:
+            return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n"
+
+        message = {**self.anthropic_response(body), "content": [], "stop_reason": None}
+        message["usage"] = {**message["usage"], "output_tokens": 0}
+        events = [
+            event({"type": "message_start", "message": message}),
+            event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+        ]
+        events += [
+            event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}})
+            for token in self.tokens()
+        ]
+        events += [
+            event({"type": "content_block_stop", "index": 0}),
+            event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                   "usage": {"output_tokens": len(self.tokens())}}),
+            event({"type": "message_stop"}),
+        ]
+        return events
+
+class StubServer(ThreadingHTTPServer):
+    """Answer both APIs with a fixed command after an injected delay, streaming one word per event"""
+    daemon_threads = True
+
+    def __init__(self, command: str = "ls -la", latency: float = 0.0, token_delay: float = 0.0,
+                 port: int = 0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.command = command
+        self.latency = latency
+        self.token_delay = token_delay
+        self.requests: List[Dict] = []
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def environ(self) -> Dict[str, str]:
+        """Environment variables that point both SDKs at this server"""
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_KEY": "sk-stub",
+            "ANTHROPIC_BASE_URL": self.url,
+            "ANTHROPIC_API_KEY": "sk-ant-stub",
+        }
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,90 @@
+import pytest
+import io
+import time
+from wtf.batch import RateLimiter, read_prompts, run_batch
+from wtf.translator import Translator
+
+class FakeProvider:
+    def get_shell_command(self, prompt, model, on_token=None, shell=None, environment=None):
+        if prompt == "fail":
+            raise RuntimeError("provider error")
+        # Later prompts finish first so completion order differs from input order
+        time.sleep(0.05 / len(prompt))
+        return f"echo {prompt}"
+
+@pytest.fixture
+def translator(monkeypatch, tmp_path):
+    """Isolate HOME and use a fake provider"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr('wtf.translator.get_provider', lambda name, config: FakeProvider())
+    return Translator()
+
+def test_read_prompts():
+    """Test that blank lines and comments are skipped but line numbers kept"""
+    source = io.StringIO("list files\n\n# comment\n  show disk usage  \n")
+    assert read_prompts(source) == [(1, "list files"), (4, "show disk usage")]
+
+def test_run_batch_input_order(translator):
+    """Test that results keep input order and errors are reported per prompt"""
+    prompts = [(1, "a"), (2, "fail"), (3, "ccccc")]
+    results = list(run_batch(translator, prompts, "openai", "gpt-4o", "zsh", parallel=3))
+
+    assert [r['line'] for r in results] == [1, 2, 3]
+    assert results[0]['command'] == "echo a"
+    assert results[1]['command'] is None and results[1]['error'] == "provider error"
+    assert all(r['latency'] is not None for r in results)
+
+def test_run_batch_completion_order(translator):
+    """Test that completion order yields faster prompts first"""
+    prompts = [(1, "a"), (2, "bbbbbbbbbb")]
+    results = list(run_batch(translator, prompts, "openai", "gpt-4o", "zsh", parallel=2, ordered=False))
+    assert [r['line'] for r in results] == [2, 1]
+
+def test_run_batch_uses_cache(translator):
+    """Test that repeated prompts are served from the cache"""
+    list(run_batch(translator, [(1, "a")], "openai", "gpt-4o", "zsh"))
+    results = list(run_batch(translator, [(1, "a")], "openai", "gpt-4o", "zsh"))
+    assert results[0]['cache_hit'] is True
+
+def test_rate_limiter():
+    """Test that the token bucket spaces out requests"""
+    limiter = RateLimiter(rate=20)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.14
+
+def test_run_batch_failover(monkeypatch, tmp_path):
+    """Test that results name the failover target that answered and list every attempt"""
+    from wtf.config import Config
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    Config().update(lambda settings: settings['resilience'].update(failover=["anthropic:claude-3-5-haiku-20241022"]))
+    broken = FakeProvider()
+    broken.get_shell_command = lambda *args, **kwargs: (_ for _ in ()).throw(ValueError("bad request"))
+    monkeypatch.setattr('wtf.translator.get_provider',
+                        lambda name, config: broken if name == 'openai' else FakeProvider())
+
+    result, = run_batch(Translator(), [(1, "a")], "openai", "gpt-4o", "zsh")
+    assert result['command'] == "echo a"
+    assert (result['provider'], result['model']) == ("anthropic", "claude-3-5-haiku-20241022")
+    assert [(a['provider'], a['status']) for a in result['attempts']] == [("openai", "error"), ("anthropic", "ok")]
+
+def test_run_batch_rate_limits_every_attempt(monkeypatch, tmp_path):
+    """Test that retries and failover each take a token from the provider they are sent to"""
+    from wtf.config import Config
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    Config().update(lambda settings: settings['resilience'].update(
+        failover=["anthropic:claude-3-5-haiku-20241022"], retries=1, backoff=0))
+    broken = FakeProvider()
+    broken.get_shell_command = lambda *args, **kwargs: (_ for _ in ()).throw(TimeoutError("timed out"))
+    monkeypatch.setattr('wtf.translator.get_provider',
+                        lambda name, config: broken if name == 'openai' else FakeProvider())
+    acquired = []
+    monkeypatch.setattr(RateLimiter, 'acquire', lambda self: acquired.append(self.rate))
+
+    result, = run_batch(Translator(), [(1, "a")], "openai", "gpt-4o", "zsh",
+                        rate_limits={"openai": 5, "anthropic": 2})
+    assert result['provider'] == "anthropic"
+    assert acquired == [5, 5, 2]
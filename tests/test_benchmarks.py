@@ -0,0 +1,41 @@
+import json
+import os
+import pytest
+from benchmarks import run
+from benchmarks.stub_server import CACHED_TOKENS, StubServer
+from wtf.providers import AnthropicProvider, OpenAIProvider
+
+@pytest.fixture
+def stub(monkeypatch):
+    with StubServer(command="find . -name '*.pdf'") as server:
+        for name, value in server.environ().items():
+            monkeypatch.setenv(name, value)
+        yield server
+
+@pytest.mark.parametrize("provider_class,model", [(OpenAIProvider, "gpt-4o"), (AnthropicProvider, "claude-3-5-haiku")])
+def test_stub_server(stub, provider_class, model):
+    """Test that both SDKs talk to the stub server, with and without streaming"""
+    provider = provider_class("sk-stub")
+    assert provider.get_shell_command("find pdfs", model) == "find . -name '*.pdf'"
+
+    usage = {"input_tokens": 50, "cached_tokens": CACHED_TOKENS, "output_tokens": 4}
+    assert provider.request_usage() == usage
+
+    tokens = []
+    assert provider.get_shell_command("find pdfs", model, on_token=tokens.append) == "find . -name '*.pdf'"
+    assert ''.join(tokens) == "find . -name '*.pdf'"
+    assert provider.request_usage() == usage
+    assert len(stub.requests) == 2
+    assert stub.requests[0]['body']['model'] == model
+
+def test_benchmark_report(tmp_path, monkeypatch):
+    """Test that a quick run writes a JSON report and leaves HOME alone"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    output = tmp_path / 'results.json'
+    run.main(['--suite', 'config,history', '--repeat', '2', '--sizes', '50', '--backends', 'jsonl', '-o', str(output)])
+
+    report = json.loads(output.read_text())
+    names = [result['name'] for result in report['results']]
+    assert 'config.load_yaml' in names and 'history.show' in names
+    assert all(result['min'] <= result['p50'] <= result['max'] for result in report['results'])
+    assert os.environ['HOME'] == str(tmp_path)
@@ -0,0 +1,60 @@
+import pytest
+import tempfile
+import os
+import time
+from wtf.cache import ResponseCache
+
+@pytest.fixture
+def temp_cache():
+    """Create a temporary cache directory"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_home = os.environ.get('HOME')
+        os.environ['HOME'] = tmp_dir
+        yield
+        if old_home:
+            os.environ['HOME'] = old_home
+
+def test_cache_roundtrip(temp_cache):
+    """Test storing and retrieving a command"""
+    cache = ResponseCache()
+    key = cache.make_key("list files", "zsh", "openai", "gpt-4o")
+    assert cache.get(key) is None
+    cache.put(key, "ls")
+    assert cache.get(key) == "ls"
+    assert ResponseCache().get(key) == "ls"
+
+def test_cache_key_normalization():
+    """Test that keys ignore case, spacing and trailing punctuation but not context"""
+    key = ResponseCache.make_key("List  files?", "zsh", "openai", "gpt-4o")
+    assert key == ResponseCache.make_key("list files", "zsh", "openai", "gpt-4o")
+    assert key != ResponseCache.make_key("list files", "bash", "openai", "gpt-4o")
+    assert key != ResponseCache.make_key("list files", "zsh", "anthropic", "gpt-4o")
+    assert key != ResponseCache.make_key("list files", "zsh", "openai", "gpt-4")
+
+def test_cache_ttl(temp_cache):
+    """Test that expired entries are not returned"""
+    cache = ResponseCache(ttl=60)
+    cache.put("key", "ls")
+    cache.conn.execute('UPDATE responses SET created = ?', (time.time() - 120,))
+    assert cache.get("key") is None
+
+def test_cache_lru_eviction(temp_cache):
+    """Test that the least recently used entries are evicted first"""
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    time.sleep(0.01)
+    cache.put("b", "2")
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "3")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+
+def test_key_context():
+    """Test that working-directory context separates otherwise identical keys"""
+    key = ResponseCache.make_key("list files", "zsh", "openai", "gpt-4o")
+    assert ResponseCache.make_key("list files", "zsh", "openai", "gpt-4o", None) == key
+    assert ResponseCache.make_key("list files", "zsh", "openai", "gpt-4o", "Project type: go") != key
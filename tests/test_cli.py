@@ -1,7 +1,11 @@
 import pytest
 from click.testing import CliRunner
-from wtf.cli import cli
+from wtf.cli import cli, offer_similar
 import os
+import sys
+from unittest.mock import Mock
+from wtf.history import History
+from wtf import worker
 
 @pytest.fixture
 def runner():
@@ -42,4 +46,239 @@ def test_cli_history(runner):
     """Test history command"""
     result = runner.invoke(cli, ['--history'])
     assert result.exit_code == 0
-    assert 'Command History' in result.output 
\ No newline at end of file
+    assert 'Command History' in result.output 
+def test_cli_history_search(runner):
+    """Test history search and filter options"""
+    result = runner.invoke(cli, ['--history', '--search', 'docker', '--status', 'ok', '--since', '7d'])
+    assert result.exit_code == 0
+    assert 'Command History' in result.output
+
+def test_cli_history_pages(runner, monkeypatch, tmp_path):
+    """Test --page, --offset and tab-separated history output"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    History().add_many([{"prompt": f"prompt {i}", "command": f"echo {i}"} for i in range(10)])
+
+    result = runner.invoke(cli, ['--history', '-n', '3', '--page', '2', '--format', 'tsv'])
+    assert result.exit_code == 0
+    assert [line.split('\t')[-1] for line in result.output.splitlines()] == ["echo 6", "echo 5", "echo 4"]
+
+    result = runner.invoke(cli, ['--history', '-n', '0', '--offset', '8', '--format', 'plain'])
+    assert result.output.splitlines() == ["echo 1  # prompt 1", "echo 0  # prompt 0"]
+
+    result = runner.invoke(cli, ['--pager', '-n', '4'], input='nnpq')
+    assert result.exit_code == 0
+    assert 'Command History (5-8)' in result.output
+
+def test_cli_history_invalid_date(runner):
+    """Test that an invalid date is rejected"""
+    result = runner.invoke(cli, ['--history', '--since', 'someday'])
+    assert result.exit_code != 0
+    assert 'Invalid date' in result.output
+
+def test_cli_response_cache(runner, monkeypatch, tmp_path):
+    """Test that a repeated prompt is served from the cache"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    provider = Mock()
+    provider.get_shell_command.return_value = "docker ps -a"
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    for _ in range(2):
+        result = runner.invoke(cli, ['list', 'all', 'containers'])
+        assert result.exit_code == 0
+        assert result.stdout.strip() == "docker ps -a"
+    assert provider.get_shell_command.call_count == 1
+
+    result = runner.invoke(cli, ['--no-cache', 'list', 'all', 'containers'])
+    assert result.exit_code == 0
+    assert provider.get_shell_command.call_count == 2
+
+    worker.wait()
+    entries = History().load()
+    assert [e['metadata']['cache_hit'] for e in entries] == [False, True, False]
+    assert {"config", "cache", "provider_init", "request", "output"} <= set(entries[0]['metadata']['timings'])
+    assert "request" not in entries[1]['metadata']['timings']
+
+    result = runner.invoke(cli, ['--stats'])
+    assert result.exit_code == 0
+    assert 'Latency by Provider and Model' in result.output
+    assert 'Median Phase Timings' in result.output
+
+def test_offer_similar(monkeypatch, tmp_path):
+    """Test that a near-duplicate prompt offers the earlier command"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    history = History()
+    history.add("list all docker containers including stopped ones", "docker ps -a", metadata={"shell": "zsh"})
+    monkeypatch.setattr('click.confirm', Mock(return_value=True))
+
+    match = offer_similar(history, "list docker containers incl stopped", "zsh", 0.8, Mock())
+    assert match.command == "docker ps -a"
+    assert offer_similar(history, "show disk usage", "zsh", 0.8, Mock()) is None
+
+def test_cli_streaming(runner, monkeypatch, tmp_path):
+    """Test that streamed tokens go to stderr and the final command to stdout"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+
+    def get_shell_command(prompt, model, on_token=None, shell=None, environment=None):
+        for token in ["git", " status", "\n"]:
+            on_token(token)
+        return "git status"
+
+    provider = Mock()
+    provider.get_shell_command.side_effect = get_shell_command
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    result = runner.invoke(cli, ['--stream', '--no-cache', 'show', 'repo', 'state'])
+    assert result.exit_code == 0
+    assert result.stdout.strip() == "git status"
+    assert "git status" in result.stderr
+
+    worker.wait()
+    metadata = History().load()[-1]['metadata']
+    assert 0 <= metadata['ttft'] <= metadata['latency']
+
+def test_cli_race_needs_targets(runner, monkeypatch, tmp_path):
+    """Test that --race without configured targets is rejected"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    result = runner.invoke(cli, ['--race', 'list', 'files'])
+    assert result.exit_code != 0
+    assert 'race.targets' in result.output
+
+def test_cli_batch(runner, monkeypatch, tmp_path):
+    """Test batch mode writes JSON lines and records history in bulk"""
+    import json
+    monkeypatch.setenv('HOME', str(tmp_path))
+    provider = Mock()
+    provider.get_shell_command.side_effect = lambda prompt, model, on_token=None, shell=None, environment=None: f"echo {prompt}"
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    result = runner.invoke(cli, ['--batch', '-', '--parallel', '2'], input="list files\nshow disk usage\n")
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [line['command'] for line in lines] == ["echo list files", "echo show disk usage"]
+    assert [e['prompt'] for e in History().load()] == ["list files", "show disk usage"]
+
+def test_cli_logs(runner, monkeypatch, tmp_path):
+    """Test --logs tails and filters the log file"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    result = runner.invoke(cli, ['--logs'])
+    assert result.exit_code == 0
+    assert 'No logs found' in result.output
+
+    log_file = tmp_path / '.config' / 'wtf' / 'logs' / 'wtf.log'
+    log_file.parent.mkdir(parents=True)
+    log_file.write_text(
+        "2024-01-01 12:00:00,000 - wtf - ERROR - [red]boom[/]\n"
+        "2024-01-01 12:00:01,000 - httpx - DEBUG - request\n"
+    )
+    result = runner.invoke(cli, ['--logs', '-n', '5', '--level', 'error'])
+    assert result.exit_code == 0
+    assert result.output == "2024-01-01 12:00:00,000 - wtf - ERROR - [red]boom[/]\n"
+
+def test_cli_token_usage(runner, monkeypatch, tmp_path):
+    """Test that token usage reported by the provider is recorded in history"""
+    from benchmarks.stub_server import CACHED_TOKENS, StubServer
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    with StubServer(command="ls -la") as server:
+        for name, value in server.environ().items():
+            monkeypatch.setenv(name, value)
+        result = runner.invoke(cli, ['-p', 'anthropic', '--no-cache', 'list', 'files'])
+    assert result.exit_code == 0
+    assert result.stdout.strip() == "ls -la"
+    worker.wait()
+    usage = History().load()[-1]['metadata']['usage']
+    assert usage == {"input_tokens": 50, "cached_tokens": CACHED_TOKENS, "output_tokens": 2}
+    assert server.requests[0]['body']['max_tokens'] == 100
+
+def test_cli_execute(runner, monkeypatch, tmp_path):
+    """Test that an executed command's exit status, duration and usage are recorded and passed on"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    provider = Mock()
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    provider.get_shell_command.return_value = "true"
+    result = runner.invoke(cli, ['-e', 'do', 'nothing'], input='y\n')
+    assert result.exit_code == 0
+
+    provider.get_shell_command.return_value = "exit 3"
+    result = runner.invoke(cli, ['-e', 'fail'], input='y\n')
+    assert result.exit_code == 3
+
+    worker.wait()
+    entries = History().load()
+    assert [e['success'] for e in entries] == [True, False]
+    execution = entries[-1]['metadata']['execution']
+    assert execution['exit_code'] == 3
+    assert execution['duration'] >= 0
+    assert {"user_time", "system_time", "max_rss"} <= set(execution)
+
+    result = runner.invoke(cli, ['--stats'])
+    assert 'Executed Commands' in result.output
+    result = runner.invoke(cli, ['--history'])
+    assert '2 executed, 1 failed' in result.output
+
+def test_cli_context(runner, monkeypatch, tmp_path):
+    """Test that opt-in working-directory context reaches the provider"""
+    from wtf.config import Config
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Makefile').write_text("all:\n")
+    Config().update(lambda settings: settings['context'].update(enabled=True))
+    provider = Mock()
+    provider.get_shell_command.return_value = "make"
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    result = runner.invoke(cli, ['build', 'it'])
+    assert result.exit_code == 0
+    environment = provider.get_shell_command.call_args.kwargs['environment']
+    assert "Project type: make" in environment['context']
+
+    worker.wait()
+    metadata = History().load()[-1]['metadata']
+    assert metadata['context'] == {"cached": False, "timed_out": []}
+    assert 'context' in metadata['timings']
+
+def test_cli_no_clipboard(runner, monkeypatch, tmp_path):
+    """Test that no copy is promised without a clipboard"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    provider = Mock()
+    provider.get_shell_command.return_value = "ls"
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    monkeypatch.setattr('wtf.worker.clipboard_available', Mock(return_value=False))
+    result = runner.invoke(cli, ['list', 'files'])
+    assert result.exit_code == 0
+    assert "copied to clipboard" not in result.stderr
+
+    monkeypatch.setattr('wtf.worker.clipboard_available', Mock(return_value=True))
+    result = runner.invoke(cli, ['list', 'files'])
+    assert "(copied to clipboard)" in result.stderr
+    worker.wait()
+
+def test_cli_context_cache(runner, monkeypatch, tmp_path):
+    """Test that with context on, a cached answer is only reused in a directory with the same context"""
+    from wtf.config import Config
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    Config().update(lambda settings: settings['context'].update(enabled=True))
+    provider = Mock()
+    provider.get_shell_command.return_value = "rm -rf build"
+    monkeypatch.setattr('wtf.translator.get_provider', Mock(return_value=provider))
+
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+    (first / 'Makefile').write_text("all:\n")
+    (second / 'package.json').write_text("{}")
+    for directory in (first, second, first):
+        monkeypatch.chdir(directory)
+        result = runner.invoke(cli, ['delete', 'the', 'build', 'output'])
+        assert result.exit_code == 0
+
+    contexts = [call.kwargs['environment']['context'] for call in provider.get_shell_command.call_args_list]
+    assert len(contexts) == 2
+    assert "Project type: make" in contexts[0]
+    assert "Project type: node" in contexts[1]
+    worker.wait()
+    assert [e['metadata']['cache_hit'] for e in History().load()] == [False, False, True]
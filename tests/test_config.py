@@ -2,7 +2,9 @@ import pytest
 from pathlib import Path
 import tempfile
 import os
-from wtf.config import Config, DEFAULT_CONFIG
+from wtf.config import Config, DEFAULT_CONFIG, get_config
+from unittest.mock import Mock
+import time
 
 @pytest.fixture
 def temp_config():
@@ -74,4 +76,98 @@ def test_env_key_precedence(temp_config):
     config._save_config(config.config)
     
     # Just verify we get a key, don't care about the actual value
-    assert config.get_api_key('openai') is not None 
\ No newline at end of file
+    assert config.get_api_key('openai') is not None 
+def test_config_not_rewritten_on_load(temp_config):
+    """Test that loading a partial config merges in memory without rewriting the file"""
+    config_file = Path(os.environ['HOME']) / '.config' / 'wtf' / 'config.yaml'
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text("default_provider: anthropic\n")
+
+    config = Config()
+    assert config.config['default_provider'] == 'anthropic'
+    assert config.config['providers']['openai']['default_model'] == 'gpt-4o'
+    assert config_file.read_text() == "default_provider: anthropic\n"
+
+def test_default_config_not_mutated(temp_config):
+    """Test that changing a loaded config leaves the defaults alone"""
+    Config().config['providers']['openai']['api_key'] = 'changed'
+    assert DEFAULT_CONFIG['providers']['openai']['api_key'] == ''
+
+    config = Config()
+    config.config['providers']['openai']['api_key'] = 'changed'
+    assert Config().config['providers']['openai']['api_key'] == ''
+
+def test_default_sections_not_shared(temp_config):
+    """Test that nested defaults a partial config.yaml doesn't override are copies"""
+    config_file = Path(os.environ['HOME']) / '.config' / 'wtf' / 'config.yaml'
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text("resilience:\n  deadline: 5\n")
+
+    config = Config()
+    assert config.config['resilience']['deadline'] == 5
+    config.config['resilience']['failover'].append("anthropic:claude")
+    config.config['context']['probes'].append("extra")
+    config.config['batch']['rate_limits']['openai'] = 1
+    assert DEFAULT_CONFIG['resilience']['failover'] == []
+    assert "extra" not in DEFAULT_CONFIG['context']['probes']
+    assert DEFAULT_CONFIG['batch']['rate_limits'] == {}
+
+def test_config_fast_cache(temp_config, monkeypatch):
+    """Test that an unchanged config.yaml is read from the JSON cache"""
+    config = Config()
+    config.config['default_provider'] = 'anthropic'
+    config._save_config(config.config)
+    old = time.time() - 60
+    os.utime(config.config_file, (old, old))
+
+    Config()
+    assert config.cache_file.exists()
+
+    import yaml
+    monkeypatch.setattr(yaml, 'safe_load', Mock(side_effect=AssertionError("YAML parsed")))
+    assert Config().config['default_provider'] == 'anthropic'
+
+    # Saving invalidates the cache
+    config = Config()
+    config._save_config(config.config)
+    assert not config.cache_file.exists()
+
+def test_config_save_conflict(temp_config):
+    """Test that a stale config can't overwrite a newer config.yaml, but update() retries"""
+    from wtf.storage import VersionConflict
+    stale = Config()
+    fresh = Config()
+    fresh.update(lambda settings: settings.update(default_provider='anthropic'))
+
+    stale.config['default_model'] = 'gpt-4'
+    with pytest.raises(VersionConflict):
+        stale._save_config(stale.config)
+
+    stale.update(lambda settings: settings.update(default_model='gpt-4'))
+    config = Config().config
+    assert (config['default_provider'], config['default_model']) == ('anthropic', 'gpt-4')
+
+def test_get_config_shared(temp_config):
+    """Test that get_config is shared until config.yaml changes"""
+    config = get_config()
+    assert get_config() is config
+
+    # Changed by another process
+    Config().update(lambda settings: settings.update(default_provider='anthropic'))
+    reloaded = get_config()
+    assert reloaded is not config
+    assert reloaded.config['default_provider'] == 'anthropic'
+
+def test_user_defined_provider(temp_config):
+    """Test that providers defined only in config.yaml survive the merge with defaults"""
+    import yaml
+    config_file = Path(os.environ['HOME']) / '.config' / 'wtf' / 'config.yaml'
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text(yaml.dump({'providers': {'ollama': {
+        'type': 'openai', 'base_url': 'http://localhost:11434/v1', 'models': ['llama3.2']
+    }}}))
+
+    config = Config()
+    assert config.get_provider_config('ollama')['default_model'] == 'llama3.2'
+    assert config.get_provider_config('ollama')['base_url'] == 'http://localhost:11434/v1'
+    assert 'openai' in config.config['providers']
@@ -0,0 +1,77 @@
+import shutil
+import subprocess
+import time
+import pytest
+import wtf.context as context
+from wtf.config import DEFAULT_CONFIG
+from wtf.context import Collector, clip, collect
+
+SETTINGS = {**DEFAULT_CONFIG['context'], "enabled": True, "timeout": 5}
+
+@pytest.fixture
+def project(monkeypatch, tmp_path):
+    """A small Python project in its own directory, with HOME isolated"""
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    directory = tmp_path / 'project'
+    directory.mkdir()
+    (directory / 'pyproject.toml').write_text("[project]\n")
+    (directory / 'src').mkdir()
+    (directory / '.env').write_text("SECRET=1\n")
+    return directory
+
+def test_collect(project):
+    """Test the file listing, project markers and tools"""
+    text = collect(SETTINGS, project)
+    assert f"Files in {project}: pyproject.toml, src/" in text
+    assert ".env" not in text
+    assert "Project type: python" in text
+    assert "python3" in text
+
+@pytest.mark.skipif(not shutil.which('git'), reason="git not installed")
+def test_collect_git(project):
+    """Test the branch and changed files of a git checkout"""
+    subprocess.run(['git', 'init', '-q', '-b', 'main'], cwd=project, check=True)
+    text = collect(SETTINGS, project)
+    git, = [line for line in text.splitlines() if line.startswith("Git: on ")]
+    assert "main" in git
+    assert git.endswith("2 changed: ?? .env, ?? pyproject.toml")
+
+def test_collect_limits(project):
+    """Test that listings are cut to max_files and every probe to max_bytes"""
+    for i in range(30):
+        (project / f"file{i:02}.txt").write_text("")
+    text = collect({**SETTINGS, "max_files": 3, "probes": ["files"]}, project)
+    assert text.endswith("file00.txt, file01.txt, file02.txt and 29 more")
+    text = collect({**SETTINGS, "max_bytes": 20, "probes": ["files"]}, project)
+    assert len(text.encode()) <= 20
+    assert clip("héllo", 4) == "h..."
+
+def test_collector_cache(project, monkeypatch):
+    """Test that results are reused until the directory changes"""
+    first = Collector(SETTINGS, project).start()
+    first.wait()
+    assert not first.cached
+    second = Collector(SETTINGS, project).start()
+    assert second.cached
+    assert second.wait() == first.wait()
+
+    (project / 'package.json').write_text("{}")
+    third = Collector(SETTINGS, project).start()
+    assert not third.cached
+    assert "node" in third.wait()['project']
+
+def test_collector_budget(project, monkeypatch):
+    """Test that a probe missing the time budget is left out and the result isn't cached"""
+    def slow(cwd, settings):
+        time.sleep(1)
+        return "late"
+
+    monkeypatch.setitem(context.PROBES, 'git', slow)
+    collector = Collector({**SETTINGS, "timeout": 0.1}, project).start()
+    start = time.monotonic()
+    results = collector.wait()
+    assert time.monotonic() - start < 0.5
+    assert 'git' not in results
+    assert collector.timed_out == ['git']
+    assert results['project'] == "Project type: python"
+    assert not Collector(SETTINGS, project).start().cached
@@ -0,0 +1,81 @@
+import pytest
+import threading
+import click
+from unittest.mock import Mock
+from wtf.daemon import DaemonClient, DaemonServer, get_socket_path
+from wtf.translator import Translator
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    """Isolate HOME and replace provider construction with a fake"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+
+    def get_shell_command(prompt, model, on_token=None, shell=None, environment=None):
+        if on_token:
+            for token in ["ls", " -la"]:
+                on_token(token)
+        return f"ls -la # {shell}"
+
+    provider = Mock()
+    provider.get_shell_command.side_effect = get_shell_command
+    factory = Mock(return_value=provider)
+    monkeypatch.setattr('wtf.translator.get_provider', factory)
+    return factory
+
+@pytest.fixture
+def server(provider):
+    """Run a daemon on a temporary socket"""
+    socket_path = get_socket_path()
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    server = DaemonServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_connect_without_daemon(provider):
+    """Test that connecting without a running daemon returns None"""
+    assert DaemonClient.connect() is None
+
+def test_daemon_generate_and_cache(server, provider):
+    """Test generating, streaming and caching through the daemon"""
+    client = DaemonClient.connect()
+    assert client is not None
+
+    assert client.cached("list files", "openai", "gpt-4o", "zsh") is None
+    tokens = []
+    command = client.generate("list files", "openai", "gpt-4o", "zsh", on_token=tokens.append)
+    assert command == "ls -la # zsh"
+    assert tokens == ["ls", " -la"]
+    assert client.cached("list files", "openai", "gpt-4o", "zsh") == "ls -la # zsh"
+
+    # A second request reuses the daemon's provider client and reports its phases
+    timings = {}
+    client.generate("list all files", "openai", "gpt-4o", "bash", timings=timings)
+    assert provider.call_count == 1
+    assert {"provider_init", "request"} <= set(timings)
+    client.close()
+
+def test_daemon_error(server, provider):
+    """Test that provider errors are raised on the client"""
+    provider.side_effect = click.ClickException("No API key found for openai")
+    client = DaemonClient.connect()
+    route = {}
+    with pytest.raises(click.ClickException, match="No API key found"):
+        client.generate("list files", "openai", "gpt-4o", "zsh", route=route)
+    # Attempts are reported even when every one failed
+    assert [a['status'] for a in route['attempts']] == ["error"]
+    client.close()
+
+def test_daemon_fallback(server, provider):
+    """Test that the client translates in-process when the daemon goes away"""
+    client = DaemonClient.connect(fallback=Translator)
+    assert not client.fell_back
+    server.shutdown()
+    server.server_close()
+    # The handler thread would keep serving an accepted connection, so drop ours
+    client.close()
+
+    assert client.generate("list files", "openai", "gpt-4o", "zsh") == "ls -la # zsh"
+    assert client.fell_back
@@ -0,0 +1,61 @@
+import pytest
+import time
+from unittest.mock import Mock
+import wtf.environment as environment
+from wtf.environment import describe, probe
+
+FAKE_ENVIRONMENT = {
+    "shell": "zsh", "shell_version": "5.9", "os": "Darwin", "os_release": "23.1.0",
+    "coreutils": "bsd", "tools": ["git", "jq"]
+}
+
+@pytest.fixture
+def fake_probe(monkeypatch, tmp_path):
+    """Isolate HOME, reset the in-process memo and count real probes"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('SHELL', '/bin/zsh')
+    monkeypatch.setattr(environment, '_probed', None)
+    counter = Mock(side_effect=lambda: {**FAKE_ENVIRONMENT, "probed_at": time.time()})
+    monkeypatch.setattr(environment, '_probe', counter)
+    return counter
+
+def test_probe_cached_on_disk(fake_probe, monkeypatch):
+    """Test that a second process reuses the on-disk probe"""
+    assert probe()['shell'] == "zsh"
+    assert probe()['tools'] == ["git", "jq"]
+    assert fake_probe.call_count == 1
+
+    monkeypatch.setattr(environment, '_probed', None)
+    assert probe()['shell_version'] == "5.9"
+    assert fake_probe.call_count == 1
+    assert environment.get_cache_file().exists()
+
+def test_probe_invalidated_by_path(fake_probe, monkeypatch):
+    """Test that a different PATH triggers a new probe"""
+    probe()
+    monkeypatch.setenv('PATH', '/opt/other/bin')
+    probe()
+    assert fake_probe.call_count == 2
+
+def test_probe_expires(fake_probe, monkeypatch):
+    """Test that stale probes are refreshed"""
+    probe()
+    monkeypatch.setattr(environment, '_probed', None)
+    monkeypatch.setattr(environment, 'PROBE_TTL', -1)
+    probe()
+    assert fake_probe.call_count == 2
+
+def test_real_probe(monkeypatch, tmp_path):
+    """Test the real probe without $SHELL"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.delenv('SHELL', raising=False)
+    monkeypatch.setattr(environment, '_probed', None)
+    result = probe()
+    assert result['shell']
+    assert result['os']
+    assert isinstance(result['tools'], list)
+
+def test_describe():
+    """Test the prompt summary"""
+    assert describe(FAKE_ENVIRONMENT) == "zsh 5.9 on Darwin 23.1.0; BSD coreutils; available tools: git, jq"
+    assert describe({"shell": "bash", "os": "Linux", "coreutils": "unknown", "tools": []}) == "bash on Linux"
@@ -0,0 +1,62 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from wtf.execution import format_bytes, run, summarize
+
+def test_run():
+    """Test exit codes, signals and resource usage of a finished command"""
+    result = run("exit 0", "sh")
+    assert result['exit_code'] == 0
+    assert result['max_rss'] > 0
+
+    assert run("exit 7", "sh")['exit_code'] == 7
+    assert run("kill -TERM $$", "sh")['exit_code'] == -15
+
+    busy = run(f"{sys.executable} -c 'sum(range(3000000))'", "bash")
+    assert busy['user_time'] + busy['system_time'] > 0
+    assert busy['duration'] >= busy['user_time'] * 0.5
+
+INTERRUPTED = """
+import json
+from wtf.execution import run
+print(json.dumps(run("sleep 4; echo finished", "sh")))
+"""
+
+def test_run_interrupted():
+    """Test that Ctrl-C at the terminal stops the command while wtf survives to record it"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, '-c', INTERRUPTED], cwd=root, stdout=subprocess.PIPE,
+                               start_new_session=True)
+    time.sleep(1)
+    start = time.monotonic()
+    # Like the terminal driver, signal the whole foreground process group
+    os.killpg(process.pid, signal.SIGINT)
+    output = process.communicate(timeout=10)[0].decode()
+    assert time.monotonic() - start < 2
+    assert process.returncode == 0
+    assert "finished" not in output
+    assert json.loads(output.splitlines()[-1])['exit_code'] == -signal.SIGINT
+
+def test_summarize():
+    """Test per-command aggregates, slowest first"""
+    def entry(command, exit_code, duration):
+        execution = {"exit_code": exit_code, "duration": duration, "user_time": 0.1, "system_time": 0.1,
+                     "max_rss": 1024 * duration, "read_blocks": 2, "write_blocks": 0}
+        return {"command": command, "metadata": {"execution": execution}}
+
+    entries = [entry("make", 2, 30), entry("make", 0, 10), entry("ls", 0, 0.01), {"command": "ls", "metadata": {}}]
+    make, ls = summarize(entries)
+    assert make['command'] == "make"
+    assert (make['runs'], make['failures'], make['last_exit_code']) == (2, 1, 2)
+    assert make['duration'] == {50: 10, 95: 30}
+    assert make['max_rss'] == 30 * 1024
+    assert ls['runs'] == 1
+    assert summarize(entries, top=1) == [make]
+
+def test_format_bytes():
+    assert format_bytes(None) == "-"
+    assert format_bytes(512) == "512B"
+    assert format_bytes(3 * 1024 ** 2) == "3.0MiB"
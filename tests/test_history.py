@@ -2,7 +2,7 @@ import pytest
 from pathlib import Path
 import tempfile
 import os
-from wtf.history import History
+from wtf.history import History, Retention, format_line, parse_time
 import json
 from datetime import datetime, timedelta
 
@@ -103,4 +103,260 @@ def test_history_success_flag(temp_history):
     
     entries = history.load()
     assert entries[0]['success'] is True
-    assert entries[1]['success'] is False 
\ No newline at end of file
+    assert entries[1]['success'] is False 
+
+def test_history_append_only(temp_history):
+    """Test that entries are appended as one JSON record per line"""
+    history = History()
+    history.add("first", "cmd1")
+    history.add("second", "cmd2")
+
+    lines = history.history_file.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])['prompt'] == "second"
+
+def test_history_compaction(temp_history):
+    """Test that compaction trims the log to the retention policy and archives the rest"""
+    history = History()
+    history.retention = Retention(max_entries=1000)
+    history.save([
+        {"timestamp": datetime.now().isoformat(), "prompt": f"p{i}", "command": f"c{i}", "success": True, "metadata": {}}
+        for i in range(1500)
+    ])
+    assert history.compact() == 500
+
+    lines = history.history_file.read_text().splitlines()
+    assert len(lines) == 1000
+    assert json.loads(lines[-1])['prompt'] == "p1499"
+    assert json.loads(lines[0])['prompt'] == "p500"
+    assert len(history.archive.segments()) == 1
+
+def test_retention_evictions():
+    """Test eviction by count, age and size"""
+    now = datetime.now()
+    records = [((now - timedelta(days=10 - i, hours=-12)).isoformat(), 100) for i in range(10)]
+
+    assert Retention(max_entries=4).evictions(records) == 6
+    assert Retention(max_age="5d").evictions(records) == 5
+    assert Retention(max_bytes=250).evictions(records) == 8
+    assert Retention(max_entries=8, max_bytes=500).evictions(records) == 5
+    assert Retention().evictions(records) == 0
+
+    assert not Retention(max_entries=10).exceeded(10, 0, records[0][0])
+    assert Retention(max_entries=5).exceeded(10, 0, records[0][0])
+    assert Retention(max_age="7d").exceeded(10, 0, records[0][0])
+    assert not Retention(max_age="9d").exceeded(10, 0, records[0][0])
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_history_compaction_thresholds(temp_history, backend):
+    """Test that automatic compaction waits for the headroom and archived entries stay searchable"""
+    history = History(backend=backend)
+    history.retention = Retention(max_entries=20)
+    start = datetime.now() - timedelta(hours=1)
+    history.add_many([
+        {"timestamp": (start + timedelta(seconds=i)).isoformat(), "prompt": f"p{i}", "command": f"echo {i}"}
+        for i in range(22)
+    ])
+    assert history.compact(force=False) == 0
+
+    history.add_many([{"prompt": f"p{i}", "command": f"echo {i}"} for i in range(22, 30)])
+    assert history.compact(force=False) == 10
+    assert len(history.load()) == 20
+
+    assert [e['prompt'] for e in history.search(limit=3, offset=18)] == ["p11", "p10", "p9"]
+    assert [e['prompt'] for e in history.search(text="p3")] == ["p3"]
+    assert len(history.search(limit=None)) == 30
+    assert history.search(text="p3", since=start + timedelta(seconds=5)) == []
+
+def test_history_compaction_check_skips_parsing(temp_history, monkeypatch):
+    """Test that a log within the policy is checked without parsing every entry"""
+    history = History()
+    history.retention = Retention(max_entries=20, max_age="30d")
+    history.add_many([{"prompt": f"p{i}", "command": "ls"} for i in range(10)])
+    parsed = []
+    real_loads = json.loads
+    monkeypatch.setattr('wtf.history.json.loads', lambda data: parsed.append(data) or real_loads(data))
+
+    assert history.compact(force=False) == 0
+    assert len(parsed) == 1
+
+def test_history_compaction_without_archive(temp_history):
+    """Test that evicted entries are dropped when archiving is off"""
+    history = History()
+    history.retention = Retention(max_entries=2)
+    history.archive_evicted = False
+    history.add_many([{"prompt": f"p{i}", "command": "ls"} for i in range(5)])
+
+    assert history.compact() == 3
+    assert history.archive.segments() == []
+    assert len(history.search(limit=None)) == 2
+
+def test_history_auto_compact(temp_history, monkeypatch):
+    """Test that crossing a size boundary starts background compaction"""
+    import wtf.history
+    started = []
+    monkeypatch.setattr(wtf.history, 'compact_in_background', lambda: started.append(True))
+    monkeypatch.setattr(wtf.history, 'COMPACT_EVERY_BYTES', 1024)
+    history = History()
+
+    history.add("small", "ls")
+    assert started == []
+    history.add("x" * 2000, "ls")
+    assert started == [True]
+
+def test_history_migration(temp_history):
+    """Test that a legacy history.json is migrated to the append-only log"""
+    legacy_file = Path(os.environ['HOME']) / '.config' / 'wtf' / 'history.json'
+    legacy_file.parent.mkdir(parents=True, exist_ok=True)
+    legacy_file.write_text(json.dumps([
+        {"timestamp": datetime.now().isoformat(), "prompt": "old", "command": "ls", "success": True, "metadata": {}}
+    ], indent=2))
+
+    history = History()
+    history.add("new", "pwd")
+
+    entries = history.load()
+    assert [e['prompt'] for e in entries] == ["old", "new"]
+    assert not legacy_file.exists()
+    assert legacy_file.with_suffix('.json.bak').exists()
+
+def test_sqlite_history_add(temp_history):
+    """Test adding and loading entries with the SQLite backend"""
+    history = History(backend='sqlite')
+    history.add("test prompt", "test command", metadata={"provider": "test", "model": "m"})
+    history.add("other prompt", "other command", success=False)
+
+    entries = history.load()
+    assert [e['prompt'] for e in entries] == ["test prompt", "other prompt"]
+    assert entries[0]['metadata'] == {"provider": "test", "model": "m"}
+    assert entries[1]['success'] is False
+    assert history.history_file.name == 'history.db'
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_history_search(temp_history, backend):
+    """Test full-text search and filters on both backends"""
+    history = History(backend=backend)
+    history.add("list docker containers", "docker ps -a", metadata={"provider": "openai", "model": "gpt-4o"})
+    history.add("find pdf files", "find . -name '*.pdf'", metadata={"provider": "anthropic", "model": "claude"})
+    history.add("stop docker containers", "docker stop $(docker ps -q)", success=False,
+                metadata={"provider": "anthropic", "model": "claude"})
+
+    assert [e['command'] for e in history.search(text="docker")] == ["docker stop $(docker ps -q)", "docker ps -a"]
+    assert [e['prompt'] for e in history.search(text="dock list")] == ["list docker containers"]
+    assert [e['prompt'] for e in history.search(provider="anthropic", success=True)] == ["find pdf files"]
+    assert len(history.search(model="claude")) == 2
+    assert len(history.search(limit=1)) == 1
+    assert history.search(since=datetime.now() + timedelta(days=1)) == []
+    assert len(history.search(until=datetime.now())) == 3
+
+def test_sqlite_history_imports_jsonl(temp_history):
+    """Test that an existing JSONL log is imported into a new database"""
+    History(backend='jsonl').add("old prompt", "ls")
+
+    history = History(backend='sqlite')
+    assert [e['prompt'] for e in history.load()] == ["old prompt"]
+
+def test_history_unknown_backend(temp_history):
+    """Test that an unknown backend is rejected"""
+    import click
+    with pytest.raises(click.ClickException):
+        History(backend='nope')
+
+def test_parse_time():
+    """Test absolute and relative date parsing"""
+    assert parse_time("2024-01-02") == datetime(2024, 1, 2)
+    assert abs((datetime.now() - parse_time("7d")) - timedelta(days=7)) < timedelta(seconds=5)
+    with pytest.raises(ValueError):
+        parse_time("last tuesday")
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_history_add_many(temp_history, backend):
+    """Test adding several entries in one write"""
+    history = History(backend=backend)
+    history.add_many([
+        {"prompt": "a", "command": "ls"},
+        {"prompt": "b", "command": "", "success": False, "metadata": {"error": "boom"}}
+    ])
+
+    entries = history.load()
+    assert [e['prompt'] for e in entries] == ["a", "b"]
+    assert entries[1]['success'] is False
+    assert entries[1]['metadata'] == {"error": "boom"}
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_history_offset(temp_history, backend):
+    """Test paging through entries newest first"""
+    history = History(backend=backend)
+    history.add_many([{"prompt": f"p{i}", "command": f"echo {i}"} for i in range(25)])
+
+    assert [e['prompt'] for e in history.search(limit=3, offset=0)] == ["p24", "p23", "p22"]
+    assert [e['prompt'] for e in history.search(limit=3, offset=23)] == ["p1", "p0"]
+    assert history.search(limit=3, offset=30) == []
+    assert [e['prompt'] for e in history.search(text="echo", limit=2, offset=1)] == ["p23", "p22"]
+    assert len(list(history.iter_search())) == 25
+
+def test_history_reads_from_end(temp_history):
+    """Test that the newest entries are found without parsing the rest of the log"""
+    history = History(backend='jsonl')
+    history.add("old", "ls")
+    with open(history.history_file, 'a') as f:
+        f.write("not json\n" * 1000)
+    history.add("new", "pwd")
+
+    assert [e['prompt'] for e in history.search(limit=1)] == ["new"]
+
+def test_history_line_formats(temp_history, capsys):
+    """Test plain and tab-separated output"""
+    history = History()
+    history.add("list\tfiles", "ls -la\nwc -l", metadata={"provider": "openai", "model": "gpt-4o", "latency": 1.5})
+    entry = history.load()[0]
+
+    fields = format_line(entry, 'tsv').split('\t')
+    assert fields[1:] == ["ok", "openai", "gpt-4o", "1.50", "list files", "ls -la wc -l"]
+    assert format_line(entry, 'plain') == "ls -la wc -l  # list files"
+
+    history.show(output='plain')
+    assert capsys.readouterr().out == "ls -la wc -l  # list files\n"
+
+def test_history_background_compaction(temp_history):
+    """Test the detached compaction process against a retention policy from config.yaml"""
+    import subprocess
+    import sys
+    config_file = Path(os.environ['HOME']) / '.config' / 'wtf' / 'config.yaml'
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text("history:\n  max_entries: 10\n")
+    History().add_many([{"prompt": f"p{i}", "command": "ls"} for i in range(20)])
+
+    subprocess.run([sys.executable, '-m', 'wtf.history'], check=True, env=os.environ.copy(),
+                   cwd=Path(__file__).parent.parent)
+
+    history = History()
+    assert len(history.load()) == 10
+    assert len(history.search(limit=None)) == 20
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_history_save_conflict(temp_history, backend):
+    """Test that save refuses to drop entries added since the history was read"""
+    from wtf.storage import VersionConflict
+    history = History(backend=backend)
+    history.add("first", "ls")
+    version = history.version()
+    entries = history.load()
+
+    History(backend=backend).add("second", "pwd")
+    with pytest.raises(VersionConflict):
+        history.save(entries, expected=version)
+
+    history.save(history.load()[1:], expected=history.version())
+    assert [e['prompt'] for e in history.load()] == ["second"]
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_search_since_out_of_order(backend, monkeypatch, tmp_path):
+    """Test that --since finds an entry written after a slightly older one from a concurrent run"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    history = History(backend)
+    now = datetime.now()
+    for prompt, age in (("old", 60), ("inside", 4), ("just before", 6), ("newest", 1)):
+        history.add_many([{"timestamp": (now - timedelta(minutes=age)).isoformat(), "prompt": prompt, "command": "ls"}])
+    found = [e['prompt'] for e in history.search(since=now - timedelta(minutes=5))]
+    assert found == ["newest", "inside"]
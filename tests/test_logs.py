@@ -0,0 +1,128 @@
+import gzip
+import json
+import logging
+import os
+import pytest
+import threading
+import time
+from wtf.logs import JsonFormatter, RotatingLogHandler, follow, record_filter, tail_lines
+
+def record(name: str, level: str, message: str) -> str:
+    return f"2024-01-01 12:00:00,000 - {name} - {level} - {message}"
+
+@pytest.fixture
+def log_file(tmp_path):
+    """Write a log with mixed loggers, levels and a multi-line traceback"""
+    path = tmp_path / 'wtf.log'
+    lines = [record("httpx", "DEBUG", f"request {i}") for i in range(200)]
+    lines += [
+        record("wtf", "ERROR", "Error during command translation"),
+        "Traceback (most recent call last):",
+        "  ValueError: boom",
+        record("wtf", "INFO", "Generated command: ls"),
+        record("httpx", "DEBUG", "closing"),
+    ]
+    path.write_text('\n'.join(lines) + '\n')
+    return path
+
+@pytest.mark.parametrize("block_size", [7, 64, 8192])
+def test_tail_lines(log_file, block_size):
+    """Test that the last lines match a full read for any block size"""
+    expected = log_file.read_text().splitlines()
+    assert tail_lines(log_file, 5, block_size=block_size) == expected[-5:]
+    assert tail_lines(log_file, 1000, block_size=block_size) == expected
+    assert tail_lines(log_file, 0) == []
+
+def test_tail_lines_filtered(log_file):
+    """Test level and logger filters keep continuation lines with their record"""
+    lines = tail_lines(log_file, 10, record_filter(level="warning"))
+    assert lines == [
+        record("wtf", "ERROR", "Error during command translation"),
+        "Traceback (most recent call last):",
+        "  ValueError: boom",
+    ]
+    lines = tail_lines(log_file, 2, record_filter(logger_name="wtf"))
+    assert lines == ["  ValueError: boom", record("wtf", "INFO", "Generated command: ls")]
+    assert tail_lines(log_file, 3, record_filter(logger_name="http")) == []
+
+def test_follow_handles_rotation(tmp_path):
+    """Test that follow picks up appended lines and continues after rotation"""
+    path = tmp_path / 'wtf.log'
+    path.write_text(record("wtf", "INFO", "old") + '\n')
+    seen = []
+
+    def reader():
+        for line in follow(path, record_filter(logger_name="wtf"), poll_interval=0.05):
+            seen.append(line)
+            if len(seen) == 2:
+                return
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+    with open(path, 'a') as f:
+        f.write(record("httpx", "DEBUG", "skipped") + '\n')
+        f.write(record("wtf", "INFO", "before rotation") + '\n')
+    time.sleep(0.2)
+    path.rename(tmp_path / 'wtf.log.1')
+    path.write_text(record("wtf", "INFO", "after rotation") + '\n')
+    thread.join(timeout=3)
+
+    assert seen == [record("wtf", "INFO", "before rotation"), record("wtf", "INFO", "after rotation")]
+
+def make_record(name: str = "wtf", level: int = logging.INFO, message: str = "hello") -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, message, None, None)
+
+def test_rotating_handler_size_and_compress(tmp_path):
+    """Test that the log rotates past max_bytes and keeps gzipped backups"""
+    path = tmp_path / 'wtf.log'
+    handler = RotatingLogHandler(path, max_bytes=200, backup_count=2, compress=True)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for i in range(30):
+        handler.emit(make_record(message=f"line {i:02d} " + "x" * 20))
+    handler.close()
+
+    assert path.stat().st_size <= 200
+    backups = sorted(tmp_path.glob('wtf.log.*'))
+    assert [p.name for p in backups] == ['wtf.log.1.gz', 'wtf.log.2.gz']
+    assert gzip.decompress(backups[0].read_bytes()).decode().startswith('line')
+
+def test_rotating_handler_new_period(tmp_path):
+    """Test that a log last written yesterday is rotated on the first record of the day"""
+    path = tmp_path / 'wtf.log'
+    path.write_text("old\n")
+    yesterday = time.time() - 86400
+    os.utime(path, (yesterday, yesterday))
+
+    handler = RotatingLogHandler(path, backup_count=3, rotate="daily")
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler.emit(make_record(message="new"))
+    handler.emit(make_record(message="newer"))
+    handler.close()
+
+    assert path.read_text() == "new\nnewer\n"
+    assert (tmp_path / 'wtf.log.1').read_text() == "old\n"
+
+def test_rotating_handler_rotated_elsewhere(tmp_path):
+    """Test that a handler reopens the log instead of rotating it again after another process rotated it"""
+    path = tmp_path / 'wtf.log'
+    handler = RotatingLogHandler(path, max_bytes=50, backup_count=3)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler.emit(make_record(message="x" * 45))
+    os.rename(path, tmp_path / 'wtf.log.1')
+    handler.emit(make_record(message="y" * 10))
+    handler.close()
+
+    assert path.read_text() == "y" * 10 + "\n"
+    assert not (tmp_path / 'wtf.log.2').exists()
+
+def test_tail_json_records(tmp_path):
+    """Test that JSON-lines records are filtered by logger and level"""
+    path = tmp_path / 'wtf.log'
+    formatter = JsonFormatter()
+    records = [make_record("httpx", logging.DEBUG, "request"), make_record("wtf", logging.ERROR, "boom"),
+               make_record("wtf.cli", logging.INFO, "done")]
+    path.write_text(''.join(formatter.format(r) + '\n' for r in records))
+
+    lines = tail_lines(path, 10, record_filter(level="info", logger_name="wtf"))
+    assert [json.loads(line)["message"] for line in lines] == ["boom", "done"]
@@ -0,0 +1,79 @@
+import pytest
+import shutil
+import subprocess
+import threading
+import time
+from click.testing import CliRunner
+from wtf.cli import cli
+from wtf.config import DEFAULT_CONFIG
+from wtf.history import History
+from wtf import worker
+from wtf.prefetch import InFlight, parse_line, prefetch, shell_init
+
+def test_parse_line():
+    """Test splitting typed lines into wtf arguments"""
+    assert parse_line("wtf -p anthropic list 'pdf files'") == {
+        "command": ("list", "pdf files"), "provider": "anthropic", "model": None
+    }
+    assert parse_line("find big files") == {"command": ("find", "big", "files"), "provider": None, "model": None}
+    assert parse_line("wtf list 'unfinished")['command'] == ("list", "'unfinished")
+    assert parse_line("wtf --history") is None
+    assert parse_line("   ") is None
+
+@pytest.mark.parametrize("shell", ["zsh", "bash"])
+def test_shell_init(shell):
+    """Test that the widget scripts are filled in and parse"""
+    script = shell_init(shell, {**DEFAULT_CONFIG['widget'], "debounce": 0.5})
+    assert '{' + 'debounce}' not in script
+    assert 'sleep 0.5' in script
+    assert DEFAULT_CONFIG['widget'][f'key_{shell}'] in script
+    if shutil.which(shell):
+        subprocess.run([shell, '-n'], input=script.encode(), check=True)
+
+@pytest.mark.skipif(not shutil.which('bash'), reason="needs bash")
+@pytest.mark.parametrize("space", [False, True])
+def test_bash_space_binding(space):
+    """Test that bash only takes over the space key when asked to"""
+    script = shell_init('bash', {**DEFAULT_CONFIG['widget'], "bash_space_prefetch": space})
+    # Record the bindings instead of making them; line editing is off in a script
+    result = subprocess.run(['bash', '-c', 'bind() { echo "bind $*"; }; eval "$1"', 'bash', script],
+                            capture_output=True, text=True, check=True)
+    assert ('_wtf_space' in result.stdout) is space
+    assert '_wtf_widget' in result.stdout
+
+def test_inflight(tmp_path):
+    """Test that a request for the same prompt waits for the one in flight, and others don't"""
+    first = InFlight(tmp_path)
+    assert first.acquire('key', wait=0)
+
+    other = InFlight(tmp_path)
+    start = time.monotonic()
+    assert other.acquire('other key', wait=5)
+    assert time.monotonic() - start < 1
+    other.release()
+
+    threading.Timer(0.2, first.release).start()
+    assert not other.acquire('key', wait=5)
+    assert time.monotonic() - start >= 0.2
+    assert other.acquire('key', wait=0)
+    other.release()
+    assert list(tmp_path.iterdir()) == []
+
+def test_prefetch_then_widget(monkeypatch, tmp_path):
+    """Test that a prefetched line is answered from the cache without another request"""
+    from benchmarks.stub_server import StubServer
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    with StubServer(command="ls -la") as server:
+        for name, value in server.environ().items():
+            monkeypatch.setenv(name, value)
+        prefetch("wtf -p anthropic list files")
+        assert len(server.requests) == 1
+        assert History().load() == []
+
+        result = CliRunner().invoke(cli, ['--line', 'wtf -p anthropic list  files'])
+    assert result.exit_code == 0
+    assert result.stdout.strip() == "ls -la"
+    assert len(server.requests) == 1
+    worker.wait()
+    assert History().load()[-1]['metadata']['cache_hit']
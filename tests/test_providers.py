@@ -2,7 +2,8 @@ import pytest
 from wtf.providers import get_provider, OpenAIProvider, AnthropicProvider
 import click
 import os
-from unittest.mock import Mock, patch
+import time
+from unittest.mock import MagicMock, Mock, patch
 
 def test_get_provider_unknown():
     """Test that unknown provider raises error"""
@@ -104,4 +105,152 @@ def test_openai_provider_params(mock_openai_class):
     assert call_args['model'] == "gpt-4"
     assert call_args['temperature'] == 0.1
     assert len(call_args['messages']) == 2
-    assert result == "ls" 
\ No newline at end of file
+    assert result == "ls" 
+@patch('wtf.providers.OpenAI')
+def test_openai_provider_streaming(mock_openai_class):
+    """Test OpenAI provider streams tokens to the callback"""
+    chunks = [Mock(choices=[Mock(delta=Mock(content=token))]) for token in ["ls", " -la", None, "\n"]]
+    chunks.append(Mock(choices=[]))
+    stream = MagicMock()
+    stream.__enter__.return_value = iter(chunks)
+    mock_client = Mock()
+    mock_client.chat.completions.create.return_value = stream
+    mock_openai_class.return_value = mock_client
+
+    tokens = []
+    provider = OpenAIProvider("dummy-key")
+    result = provider.get_shell_command("list files", "gpt-4", on_token=tokens.append)
+
+    assert mock_client.chat.completions.create.call_args[1]['stream'] is True
+    assert tokens == ["ls", " -la", "\n"]
+    assert result == "ls -la"
+    assert stream.__exit__.called
+
+@patch('wtf.providers.OpenAI')
+def test_openai_stream_closed_on_cancel(mock_openai_class):
+    """Test that a callback giving up on the answer closes the OpenAI stream"""
+    chunks = [Mock(choices=[Mock(delta=Mock(content=token))]) for token in ["ls", " -la"]]
+    stream = MagicMock()
+    stream.__enter__.return_value = iter(chunks)
+    stream.__exit__.return_value = False
+    mock_client = Mock()
+    mock_client.chat.completions.create.return_value = stream
+    mock_openai_class.return_value = mock_client
+
+    def cancel(token):
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError, match="cancelled"):
+        OpenAIProvider("dummy-key").get_shell_command("list files", "gpt-4", on_token=cancel)
+    assert stream.__exit__.called
+
+@patch('wtf.providers.Anthropic')
+def test_anthropic_provider_streaming(mock_anthropic_class):
+    """Test Anthropic provider streams tokens to the callback"""
+    stream = MagicMock()
+    stream.__enter__.return_value.text_stream = iter(["docker", " ps", " -a"])
+    mock_client = Mock()
+    mock_client.messages.stream.return_value = stream
+    mock_anthropic_class.return_value = mock_client
+
+    tokens = []
+    provider = AnthropicProvider("dummy-key")
+    result = provider.get_shell_command("list containers", "claude-3-5-haiku", on_token=tokens.append)
+
+    assert mock_client.messages.stream.call_args[1]['max_tokens'] == 100
+    assert tokens == ["docker", " ps", " -a"]
+    assert result == "docker ps -a"
+
+def test_create_prompt_environment():
+    """Test that the probed environment is included in the prompt"""
+    provider = OpenAIProvider("dummy-key")
+    prompt = provider.create_prompt("list files", "bash", {
+        "shell": "bash", "shell_version": "5.2", "os": "Linux", "os_release": "6.1",
+        "coreutils": "gnu", "tools": ["rg"]
+    })
+    assert "bash command" in prompt
+    assert "Environment: bash 5.2 on Linux 6.1; GNU coreutils; available tools: rg" in prompt
+
+def test_request_timings():
+    """Test that HTTP client hooks split a request into send, ttfb and completion"""
+    provider = OpenAIProvider("dummy-key")
+    hooks = provider.http_client('OpenAI').event_hooks
+    start = time.perf_counter()
+    hooks['request'][0](None)
+    hooks['response'][0](None)
+    timings = provider.request_timings(start, time.perf_counter())
+    assert set(timings) == {"send", "ttfb", "completion"}
+    assert all(value >= 0 for value in timings.values())
+
+    # Marks are consumed; without them only the total is known
+    assert set(provider.request_timings(start, time.perf_counter())) == {"request"}
+
+def test_local_openai_compatible_provider(monkeypatch):
+    """Test a config-defined OpenAI-compatible server with client settings and no API key"""
+    from benchmarks.stub_server import StubServer
+
+    with StubServer(command="ls -la") as server:
+        config = {'providers': {'local': {
+            'type': 'openai',
+            'base_url': f"{server.url}/v1",
+            'timeout': 5,
+            'max_retries': 0,
+            'max_connections': 4,
+            'default_model': 'llama3.2',
+        }}}
+        provider = get_provider('local', config)
+        assert isinstance(provider, OpenAIProvider)
+        assert provider.client.timeout == 5
+        assert provider.client.max_retries == 0
+        assert provider.get_shell_command("list files", "llama3.2") == "ls -la"
+        assert server.requests[0]['body']['model'] == "llama3.2"
+
+def test_provider_entry_point(monkeypatch):
+    """Test that provider types can come from the wtf.providers entry point group"""
+    from importlib.metadata import EntryPoint
+    import wtf.providers
+
+    entry_point = EntryPoint(name='custom', value='wtf.providers:OpenAIProvider', group='wtf.providers')
+    monkeypatch.setattr('importlib.metadata.entry_points', lambda group: [entry_point])
+    monkeypatch.setattr(wtf.providers, 'PROVIDER_TYPES', dict(wtf.providers.PROVIDER_TYPES))
+
+    config = {'providers': {'mine': {'type': 'custom', 'api_key': 'sk-test', 'default_model': 'm'}}}
+    assert isinstance(get_provider('mine', config), OpenAIProvider)
+
+    config['providers']['mine']['type'] = 'missing'
+    with pytest.raises(click.ClickException) as exc:
+        get_provider('mine', config)
+    assert 'Available types: openai, anthropic, custom' in str(exc.value)
+
+@pytest.mark.parametrize("provider_class,mock_path", [(OpenAIProvider, 'wtf.providers.OpenAI'),
+                                                      (AnthropicProvider, 'wtf.providers.Anthropic')])
+def test_request_settings(provider_class, mock_path):
+    """Test that max_tokens and stop come from settings and the static prompt is separated from the request"""
+    with patch(mock_path) as mock_class:
+        client = mock_class.return_value
+        provider = provider_class("dummy-key", {"max_tokens": 40, "stop": ["\n"]})
+        provider.get_shell_command("list files", "model", shell="bash")
+
+    create = client.chat.completions.create if provider_class is OpenAIProvider else client.messages.create
+    request = create.call_args[1]
+    assert request['max_tokens'] == 40
+    assert request.get('stop', request.get('stop_sequences')) == ["\n"]
+    if provider_class is OpenAIProvider:
+        system, user = request['messages']
+        assert "bash command" in system['content']
+    else:
+        system, = request['system']
+        user, = request['messages']
+        assert "bash command" in system['text']
+        assert system['cache_control'] == {"type": "ephemeral"}
+    assert user['content'] == "Natural language: list files"
+
+def test_create_prompt_context():
+    """Test that working-directory context goes with the request, after the cacheable instructions"""
+    provider = OpenAIProvider("dummy-key")
+    environment = {"shell": "bash", "os": "Linux", "context": "Project type: python"}
+    assert provider.user_prompt("run tests", environment) == (
+        "Working directory:\nProject type: python\n\nNatural language: run tests"
+    )
+    assert provider.user_prompt("run tests", {"shell": "bash", "os": "Linux"}) == "Natural language: run tests"
+    assert "Project type: python" not in provider.context_prompt("bash", environment)
@@ -0,0 +1,68 @@
+import pytest
+import time
+from unittest.mock import Mock
+from wtf.resilience import CircuitBreaker, DeadlineExceeded, backoff_delay, call_with_deadline, is_retryable
+
+class StatusError(Exception):
+    def __init__(self, status_code: int, retry_after: str = None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = Mock(headers={'retry-after': retry_after} if retry_after else {})
+
+@pytest.mark.parametrize("error,retryable", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(401), False),
+    (StatusError(400), False),
+    (TimeoutError(), True),
+    (DeadlineExceeded(), True),
+    (type("APIConnectionError", (Exception,), {})(), True),
+    (ValueError("bad"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) == retryable
+
+def test_backoff_delay():
+    """Test that backoff is jittered, capped and honours Retry-After"""
+    delays = [backoff_delay(3, 0.5, 2.0) for _ in range(50)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 1
+    assert backoff_delay(0, 0.5, 2.0, StatusError(429, retry_after="1.5")) == 1.5
+    assert backoff_delay(0, 0.5, 2.0, StatusError(429, retry_after="30")) <= 0.5
+
+def test_call_with_deadline():
+    """Test that a slow call is abandoned and its late tokens are dropped"""
+    tokens = []
+
+    def slow(on_token):
+        on_token("early")
+        time.sleep(0.2)
+        on_token("late")
+        return "done"
+
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(slow, 0.05, tokens.append)
+    time.sleep(0.25)
+    assert tokens == ["early"]
+    assert call_with_deadline(slow, 1.0, tokens.append) == "done"
+    assert call_with_deadline(lambda on_token: "inline", None) == "inline"
+
+def test_circuit_breaker(tmp_path, monkeypatch):
+    """Test that the breaker opens after repeated failures, persists, and closes after a half-open success"""
+    path = tmp_path / 'breakers.json'
+    breaker = CircuitBreaker(threshold=2, cooldown=60, path=path)
+    breaker.record_failure('openai')
+    assert breaker.state('openai') == 'closed'
+    breaker.record_failure('openai')
+    assert breaker.state('openai') == 'open'
+
+    # Another process sees the same state
+    other = CircuitBreaker(threshold=2, cooldown=60, path=path)
+    assert not other.allow('openai')
+    assert other.allow('anthropic')
+
+    now = time.time()
+    monkeypatch.setattr('wtf.resilience.time.time', lambda: now + 61)
+    assert other.state('openai') == 'half-open'
+    other.record_success('openai')
+    assert breaker.state('openai') == 'closed'
@@ -0,0 +1,38 @@
+import json
+import logging
+import click
+import pytest
+from wtf.setup import setup_logging, shutdown_logging
+
+@pytest.fixture
+def log_dir(tmp_path):
+    yield tmp_path
+    shutdown_logging()
+    for name in ("httpx", "wtf"):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+def test_setup_logging_json(log_dir):
+    """Test that queued records reach the log file as JSON lines with per-logger levels applied"""
+    log_file = setup_logging(log_dir, {"format": "json", "levels": {"httpx": "WARNING"}})
+    logging.getLogger("httpx").debug("dropped")
+    logging.getLogger("wtf").info("kept")
+    shutdown_logging()
+
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    # Ignore records from client connections other tests left behind
+    records = [r for r in records if r["name"] in ("httpx", "wtf")]
+    assert [(r["name"], r["level"], r["message"]) for r in records] == [("wtf", "INFO", "kept")]
+
+def test_setup_logging_once(log_dir):
+    """Test that setting up logging twice does not duplicate records"""
+    log_file = setup_logging(log_dir)
+    setup_logging(log_dir)
+    logging.getLogger("wtf").info("once")
+    shutdown_logging()
+
+    assert log_file.read_text().count("once") == 1
+
+def test_setup_logging_invalid_level(log_dir):
+    """Test that an unknown level in config.yaml is reported"""
+    with pytest.raises(click.ClickException):
+        setup_logging(log_dir, {"levels": {"wtf": "LOUD"}})
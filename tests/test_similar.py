@@ -0,0 +1,91 @@
+import pytest
+import sqlite3
+import tempfile
+import os
+from wtf.similar import PromptIndex, trigrams
+from wtf.history import History, Retention
+
+@pytest.fixture
+def temp_index():
+    """Create a temporary index directory"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_home = os.environ.get('HOME')
+        os.environ['HOME'] = tmp_dir
+        yield
+        if old_home:
+            os.environ['HOME'] = old_home
+
+def test_trigrams():
+    """Test that trigrams ignore case and punctuation"""
+    assert trigrams("Docker PS!") == trigrams("docker ps")
+    assert trigrams("") == set()
+
+def test_index_lookup(temp_index):
+    """Test that near-duplicate prompts are found above the threshold"""
+    index = PromptIndex()
+    index.add("list all docker containers including stopped ones", "docker ps -a", "zsh")
+    index.add("find pdf files modified today", "find . -name '*.pdf' -mtime 0", "zsh")
+
+    matches = index.lookup("list docker containers incl stopped", "zsh", threshold=0.8)
+    assert [m.command for m in matches] == ["docker ps -a"]
+    assert 0.8 <= matches[0].score < 1
+
+    assert index.lookup("compress the logs directory", "zsh", threshold=0.8) == []
+    assert index.lookup("list docker containers incl stopped", "fish", threshold=0.8) == []
+
+def test_index_replaces_duplicate_prompt(temp_index):
+    """Test that re-adding a prompt updates its command instead of duplicating it"""
+    index = PromptIndex()
+    index.add("list files", "ls")
+    index.add("list files", "ls -la")
+
+    matches = index.lookup("list files", limit=5)
+    assert [(m.command, m.score) for m in matches] == [("ls -la", 1.0)]
+
+def test_history_updates_index(temp_index):
+    """Test that successful history entries are indexed incrementally"""
+    history = History()
+    history.add("show disk usage", "df -h", metadata={"shell": "bash"})
+    history.add("show memory usage", "", success=False, metadata={"shell": "bash"})
+
+    with history.index() as index:
+        assert [m.command for m in index.lookup("show disk usage", "bash")] == ["df -h"]
+        assert index.lookup("show memory usage", "bash") == []
+    with pytest.raises(sqlite3.ProgrammingError):
+        index.conn.execute('SELECT 1')
+
+def test_index_seeded_from_history(temp_index):
+    """Test that a new index is built from existing history once"""
+    history = History()
+    history.store.append({"timestamp": "2024-01-01T00:00:00", "prompt": "show disk usage",
+                          "command": "df -h", "success": True, "metadata": {}})
+
+    with history.index() as index:
+        assert [m.command for m in index.lookup("show disk usage")] == ["df -h"]
+
+def test_index_seeded_in_one_transaction(temp_index):
+    """Test that seeding many entries commits once"""
+    statements = []
+    with PromptIndex() as index:
+        index.conn.set_trace_callback(statements.append)
+        index.add_entries([{"timestamp": f"2024-01-01T00:00:{i:02d}", "prompt": f"show file number {i}",
+                            "command": f"cat {i}", "success": True, "metadata": {}} for i in range(20)])
+    assert sum(statement.startswith('BEGIN') for statement in statements) == 1
+
+def test_index_follows_history(temp_index):
+    """Test that prompts evicted by retention or removed from history are no longer suggested"""
+    history = History()
+    history.add_many([
+        {"timestamp": "2024-01-01T00:00:00", "prompt": "show disk usage", "command": "df -h"},
+        {"timestamp": "2024-06-01T00:00:00", "prompt": "show memory usage", "command": "free -h"},
+        {"timestamp": "2024-06-01T00:00:01", "prompt": "list open ports", "command": "ss -tlnp"},
+    ])
+    history.retention = Retention(max_entries=2)
+    assert history.compact() == 1
+    with history.index() as index:
+        assert index.lookup("show disk usage", threshold=0.9) == []
+        assert [m.command for m in index.lookup("show memory usage")] == ["free -h"]
+
+    history.save([])
+    with history.index() as index:
+        assert index.lookup("show memory usage") == []
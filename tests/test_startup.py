@@ -0,0 +1,57 @@
+import pytest
+import subprocess
+import sys
+from typing import Dict
+
+# Cold-start import budget for commands that never talk to a provider
+STARTUP_BUDGET_MS = 500
+# Runs per budget check; the fastest counts, since other load on the machine only adds time
+BUDGET_RUNS = 5
+
+PROVIDER_SDKS = ["openai", "anthropic"]
+
+def import_times(args: list, home) -> Dict[str, int]:
+    """Run `wtf <args>` under -X importtime and return cumulative microseconds per module"""
+    code = f"import sys; sys.argv = ['wtf', *{args!r}]; import wtf; wtf.main()"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env={'HOME': str(home), 'PATH': ''}
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented; only top-level entries add up to the total
+        times[name.rstrip()[1:]] = int(cumulative)
+    return times
+
+# Modules too slow to import on every start; loaded only by the commands that use them
+HEAVY_MODULES = [*PROVIDER_SDKS, "rich"]
+
+def test_import_skips_heavy_modules(tmp_path):
+    """Test that importing wtf and its CLI loads no provider SDK or rich"""
+    code = "import sys, wtf, wtf.cli; print(' '.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            env={'HOME': str(tmp_path), 'PATH': ''})
+    loaded = {name.partition('.')[0] for name in result.stdout.split()}
+    assert not loaded & set(HEAVY_MODULES), f"imported {sorted(loaded & set(HEAVY_MODULES))}"
+
+@pytest.mark.parametrize("args", [["--history"], ["--show-config"], ["--logs"]])
+def test_startup_skips_provider_sdks(args, tmp_path):
+    """Test that non-network commands never import a provider SDK"""
+    times = import_times(args, tmp_path)
+    assert times, "no import timings captured"
+    for sdk in PROVIDER_SDKS:
+        assert not any(name.strip() == sdk for name in times), f"{sdk} imported by wtf {' '.join(args)}"
+
+@pytest.mark.timing
+@pytest.mark.parametrize("args", [["--history"], ["--show-config"]])
+def test_startup_budget(args, tmp_path):
+    """Test that cold startup for non-network commands stays within budget (opt in with -m timing)"""
+    import_times(args, tmp_path)  # warm the bytecode cache
+    total_ms = min(
+        sum(us for name, us in import_times(args, tmp_path).items() if not name.startswith(' ')) / 1000
+        for _ in range(BUDGET_RUNS)
+    )
+    assert total_ms < STARTUP_BUDGET_MS, f"wtf {' '.join(args)} spent {total_ms:.0f}ms importing"
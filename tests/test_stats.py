@@ -0,0 +1,58 @@
+import pytest
+import time
+from datetime import datetime, timedelta
+from wtf.stats import PhaseTimer, summarize
+
+def entry(provider: str, model: str, latency: float, success: bool = True, cache_hit: bool = False,
+          age: timedelta = timedelta(0), timings=None) -> dict:
+    return {
+        "timestamp": (datetime.now() - age).isoformat(),
+        "prompt": "list files",
+        "command": "ls",
+        "success": success,
+        "metadata": {"provider": provider, "model": model, "latency": latency, "cache_hit": cache_hit,
+                     "timings": timings or {}},
+    }
+
+def test_phase_timer():
+    """Test that laps accumulate per phase and split attributes remote parts"""
+    timer = PhaseTimer()
+    time.sleep(0.01)
+    timer.lap('config')
+    time.sleep(0.02)
+    timer.split('dispatch', {"ttfb": 0.015})
+    assert timer.timings['config'] >= 0.01
+    assert timer.timings['ttfb'] == 0.015
+    assert 0 < timer.timings['dispatch'] < timer.timings['ttfb'] + 0.05
+
+    timer.split('dispatch', {"completion": 10.0})
+    assert 'completion' in timer.timings
+    assert set(timer.rounded()) == set(timer.timings)
+
+def test_summarize():
+    """Test percentiles, rates and throughput per provider and model"""
+    entries = [entry("openai", "gpt-4o", latency=i / 10, timings={"ttfb": 0.2}) for i in range(1, 11)]
+    entries += [entry("openai", "gpt-4o", latency=0.01, cache_hit=True, age=timedelta(hours=2))]
+    entries += [entry("anthropic", "claude", latency=0, success=False)]
+
+    rows = summarize(entries)
+    assert [(row['provider'], row['model']) for row in rows] == [("anthropic", "claude"), ("openai", "gpt-4o")]
+    anthropic, openai = rows
+    assert anthropic['error_rate'] == 1.0
+    assert anthropic['latency'] == {}
+    assert openai['count'] == 11
+    assert openai['latency'] == {50: 0.5, 90: 0.9, 99: 1.0}
+    assert openai['cache_hit_rate'] == pytest.approx(1 / 11)
+    assert openai['throughput'] == pytest.approx(11 / 2, rel=0.01)
+    assert openai['phases'] == {"ttfb": 0.2}
+
+def test_summarize_empty():
+    assert summarize([]) == []
+
+def test_summarize_failed_execution():
+    """Test that a command that failed when executed doesn't count as a provider error"""
+    failed = entry("openai", "gpt-4o", latency=0.5, success=False)
+    failed['metadata']['execution'] = {"exit_code": 1, "duration": 0.1}
+    row, = summarize([failed])
+    assert row['error_rate'] == 0
+    assert row['latency'][50] == 0.5
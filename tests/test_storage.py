@@ -0,0 +1,82 @@
+import pytest
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+from wtf.storage import VersionConflict, atomic_file, atomic_write, file_lock, version
+
+# Concurrent wtf processes in the stress test
+WORKERS = 24
+
+def test_atomic_write(tmp_path):
+    """Test replacing a file with and without a version check"""
+    path = tmp_path / 'state.json'
+    first = atomic_write(path, '{"a": 1}', expected=None)
+    assert first == version(path)
+    assert path.read_text() == '{"a": 1}'
+
+    with pytest.raises(VersionConflict):
+        atomic_write(path, '{}', expected=None)
+
+    atomic_write(path, b'{"a": 2}', expected=first)
+    with pytest.raises(VersionConflict):
+        atomic_write(path, '{}', expected=first)
+    assert path.read_text() == '{"a": 2}'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['state.json', 'state.json.lock']
+
+def test_atomic_file_failure(tmp_path):
+    """Test that a failed write leaves the old file and no temp file behind"""
+    path = tmp_path / 'config.yaml'
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_file(path, 'w') as f:
+            f.write("half")
+            raise RuntimeError("boom")
+    assert path.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [path]
+
+def test_file_lock_non_blocking(tmp_path):
+    """Test that a non-blocking lock reports when it is already held"""
+    lock = tmp_path / 'x.lock'
+    with file_lock(lock) as held:
+        assert held
+        with file_lock(lock, blocking=False) as again:
+            assert not again
+    with file_lock(lock, blocking=False) as held:
+        assert held
+
+WORKER = """
+import sys
+from wtf.config import Config
+from wtf.history import History
+
+worker = int(sys.argv[1])
+config = Config()
+config.update(lambda settings: settings['providers'].update({f'worker{worker}': {'models': ['m']}}))
+history = History()
+for i in range(10):
+    history.add(f'worker {worker} prompt {i}', f'echo {worker} {i}')
+    assert Config().config['providers'], 'empty config'
+"""
+
+def test_concurrent_processes(tmp_path):
+    """Stress config updates and history appends from dozens of processes at once"""
+    env = {**os.environ, "HOME": str(tmp_path)}
+    root = Path(__file__).parent.parent
+    workers = [
+        subprocess.Popen([sys.executable, '-c', WORKER, str(i)], env=env, cwd=root, stderr=subprocess.PIPE)
+        for i in range(WORKERS)
+    ]
+    errors = [worker.communicate()[1].decode() for worker in workers if worker.wait() != 0]
+    assert errors == []
+
+    import yaml
+    config_dir = tmp_path / '.config' / 'wtf'
+    providers = yaml.safe_load((config_dir / 'config.yaml').read_text())['providers']
+    assert {f'worker{i}' for i in range(WORKERS)} <= set(providers)
+
+    entries = [json.loads(line) for line in (config_dir / 'history.jsonl').read_text().splitlines()]
+    assert len(entries) == WORKERS * 10
+    assert len({entry['prompt'] for entry in entries}) == WORKERS * 10
+    assert not list(config_dir.glob('.*.tmp'))
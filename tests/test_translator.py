@@ -0,0 +1,226 @@
+import pytest
+import time
+from wtf.resilience import DeadlineExceeded
+from wtf.translator import Translator
+from wtf.history import percentile
+
+class FakeProvider:
+    def __init__(self, command: str, delay: float = 0.0, error: Exception = None):
+        self.command, self.delay, self.error = command, delay, error
+        self.calls = 0
+
+    def get_shell_command(self, prompt, model, on_token=None, shell=None, environment=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.command
+
+@pytest.fixture
+def providers(monkeypatch, tmp_path):
+    """Isolate HOME and let each test choose the fake providers"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    fakes = {}
+    monkeypatch.setattr('wtf.translator.get_provider', lambda name, config: fakes[name])
+    return fakes
+
+def test_translator_reuses_provider(providers):
+    """Test that generate builds each provider once and fills the cache"""
+    providers['openai'] = FakeProvider("ls")
+    translator = Translator()
+    assert translator.generate("list files", "openai", "gpt-4o", "zsh") == "ls"
+    assert translator.provider('openai') is providers['openai']
+    assert translator.cached("list files", "openai", "gpt-4o", "zsh") == "ls"
+
+def test_race_first_answer_wins(providers):
+    """Test that racing returns the fastest answer and marks the loser cancelled"""
+    providers['openai'] = FakeProvider("slow", delay=0.5)
+    providers['anthropic'] = FakeProvider("fast", delay=0.01)
+
+    command, info = Translator().race("list files", [("openai", "gpt-4o"), ("anthropic", "claude")], "zsh")
+    assert command == "fast"
+    assert info['mode'] == "race"
+    assert info['winner'] == "anthropic:claude"
+    assert [a['status'] for a in info['attempts']] == ["cancelled", "won"]
+    assert all(a['latency'] < 0.5 for a in info['attempts'])
+
+def test_race_skips_failures(providers):
+    """Test that a failing target does not win the race"""
+    providers['openai'] = FakeProvider("", error=RuntimeError("429"))
+    providers['anthropic'] = FakeProvider("ls", delay=0.05)
+
+    command, info = Translator().race("list files", [("openai", "gpt-4o"), ("anthropic", "claude")], "zsh")
+    assert command == "ls"
+    assert info['attempts'][0]['status'] == "error"
+    assert "429" in info['attempts'][0]['error']
+
+class StreamingProvider(FakeProvider):
+    """Streams its answer a token at a time and notes whether it ran to the end"""
+
+    def __init__(self, tokens: list, delay: float = 0.0, usage: dict = None):
+        super().__init__(''.join(tokens), delay)
+        self.tokens, self.usage = tokens, usage
+        self.finished = False
+
+    def get_shell_command(self, prompt, model, on_token=None, shell=None, environment=None):
+        self.calls += 1
+        for token in self.tokens:
+            time.sleep(self.delay)
+            if on_token:
+                on_token(token)
+        self.finished = True
+        return self.command
+
+    def request_timings(self, start, end):
+        return {"request": end - start}
+
+    def request_usage(self):
+        return self.usage
+
+def test_race_closes_losers(providers, monkeypatch):
+    """Test that a losing attempt stops at its next token and the winner's usage is kept"""
+    # Report usage the way real providers do
+    monkeypatch.setattr('wtf.translator.AIProvider', StreamingProvider)
+    providers['openai'] = StreamingProvider(["ls", " -la", " -h"], delay=0.1)
+    providers['anthropic'] = StreamingProvider(["ls"], usage={"input_tokens": 10, "output_tokens": 1})
+
+    command, info = Translator().race("list files", [("openai", "gpt-4o"), ("anthropic", "claude")], "zsh")
+    assert command == "ls"
+    assert info['attempts'][1]['usage'] == {"input_tokens": 10, "output_tokens": 1}
+    time.sleep(0.3)
+    assert not providers['openai'].finished
+
+def test_race_resilience(providers):
+    """Test that race attempts respect and feed the circuit breaker and get the deadline"""
+    translator = Translator()
+    translator.config.config['resilience'].update(deadline=0.2, breaker_threshold=1)
+    providers['openai'] = FakeProvider("ls", delay=0.05)
+    providers['anthropic'] = FakeProvider("", error=StatusError(503))
+    targets = [("openai", "gpt-4o"), ("anthropic", "claude")]
+
+    assert translator.race("list files", targets, "zsh", use_cache=False)[0] == "ls"
+    command, info = translator.race("list files", targets, "zsh", use_cache=False)
+    assert providers['anthropic'].calls == 1
+    assert [(a['provider'], a['status']) for a in info['attempts']] == [("openai", "won"), ("anthropic", "skipped")]
+
+    providers['openai'] = FakeProvider("ls", delay=1.0)
+    translator._providers.clear()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        translator.race("list files", targets, "zsh", use_cache=False)
+    assert time.monotonic() - start < 1.0
+
+def test_race_all_fail(providers):
+    """Test that the last error is raised when every target fails"""
+    providers['openai'] = FakeProvider("", error=RuntimeError("boom"))
+    providers['anthropic'] = FakeProvider("")
+
+    with pytest.raises(RuntimeError):
+        Translator().race("list files", [("openai", "gpt-4o"), ("anthropic", "claude")], "zsh")
+
+def test_hedge_not_sent_when_primary_is_fast(providers):
+    """Test that the hedge only fires after the delay"""
+    providers['openai'] = FakeProvider("ls", delay=0.01)
+    providers['anthropic'] = FakeProvider("ls -a")
+
+    command, info = Translator().race("list files", [("openai", "gpt-4o"), ("anthropic", "claude")], "zsh",
+                                      hedge_delay=1.0)
+    assert command == "ls"
+    assert info['mode'] == "hedge"
+    assert len(info['attempts']) == 1
+    assert providers['anthropic'].calls == 0
+
+def test_hedge_fires_after_delay(providers):
+    """Test that a slow primary is hedged and the hedge can win"""
+    providers['openai'] = FakeProvider("slow", delay=1.0)
+    providers['anthropic'] = FakeProvider("fast")
+
+    start = time.monotonic()
+    command, info = Translator().race("list files", [("openai", "gpt-4o"), ("anthropic", "claude")], "zsh",
+                                      hedge_delay=0.1)
+    assert command == "fast"
+    assert 0.1 <= time.monotonic() - start < 1.0
+    assert info['attempts'][1]['started'] >= 0.1
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+
+def test_generate_timings(providers):
+    """Test that generate reports its phases"""
+    providers['openai'] = FakeProvider("ls", delay=0.02)
+    timings = {}
+    Translator().generate("list files", "openai", "gpt-4o", "zsh", timings=timings)
+    assert set(timings) == {"provider_init", "request", "cache_write"}
+    assert timings['request'] >= 0.02
+
+class FlakyProvider(FakeProvider):
+    """Fails with the given errors first, then answers"""
+
+    def __init__(self, command: str, errors: list):
+        super().__init__(command)
+        self.errors = list(errors)
+
+    def get_shell_command(self, prompt, model, on_token=None, shell=None, environment=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.command
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+@pytest.fixture
+def resilient(providers):
+    """A translator that retries without waiting and fails over to anthropic"""
+    translator = Translator()
+    translator.config.config['resilience'].update(backoff=0, deadline=0.5, failover=["anthropic:claude"])
+    return translator
+
+def test_generate_retries(providers, resilient):
+    """Test that transient errors are retried and every attempt is reported"""
+    providers['openai'] = FlakyProvider("ls", [StatusError(429), StatusError(503)])
+    route = {}
+    assert resilient.generate("list files", "openai", "gpt-4o", "zsh", route=route) == "ls"
+    assert [a['status'] for a in route['attempts']] == ["error", "error", "ok"]
+    assert (route['provider'], route['model']) == ("openai", "gpt-4o")
+
+def test_generate_failover(providers, resilient):
+    """Test failover after a permanent error and after a missed deadline"""
+    providers['openai'] = FlakyProvider("ls", [StatusError(401)])
+    providers['anthropic'] = FakeProvider("ls -la")
+    route = {}
+    assert resilient.generate("list files", "openai", "gpt-4o", "zsh", route=route) == "ls -la"
+    assert [(a['provider'], a['status']) for a in route['attempts']] == [("openai", "error"), ("anthropic", "ok")]
+    assert route['provider'] == "anthropic"
+    # The answer is cached for the target that gave it
+    assert resilient.cached("list files", "anthropic", "claude", "zsh") == "ls -la"
+
+    providers['openai'] = FakeProvider("ls", delay=1.0)
+    resilient._providers.clear()
+    resilient.config.config['resilience']['retries'] = 0
+    route = {}
+    assert resilient.generate("list all files", "openai", "gpt-4o", "zsh", route=route) == "ls -la"
+    assert "within" in route['attempts'][0]['error']
+
+def test_generate_circuit_open(providers, resilient):
+    """Test that a provider with an open circuit is skipped by later calls"""
+    resilient.config.config['resilience'].update(breaker_threshold=2, retries=1)
+    providers['openai'] = FlakyProvider("ls", [StatusError(500)] * 2)
+    providers['anthropic'] = FakeProvider("ls -la")
+    resilient.generate("list files", "openai", "gpt-4o", "zsh", use_cache=False)
+    assert providers['openai'].calls == 2
+
+    route = {}
+    assert resilient.generate("list files", "openai", "gpt-4o", "zsh", use_cache=False, route=route) == "ls -la"
+    assert providers['openai'].calls == 2
+    assert route['attempts'][0]['status'] == "skipped"
+
+    resilient.config.config['resilience']['failover'] = []
+    with pytest.raises(RuntimeError, match="circuit is open"):
+        resilient.generate("list files", "openai", "gpt-4o", "zsh", use_cache=False)
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from wtf import worker
+from wtf.history import History
+from wtf.worker import Worker, make_job, run_job
+
+def entry(prompt):
+    return {"timestamp": "2026-01-01T00:00:00", "prompt": prompt, "command": "ls", "success": True, "metadata": {}}
+
+def test_detached_job(monkeypatch, tmp_path):
+    """Test that a forked worker records history after the caller moves on"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    worker.submit(make_job(entries=[entry("list files")]))
+    worker.wait()
+    assert [e['prompt'] for e in History().load()] == ["list files"]
+
+def test_detached_limit(monkeypatch, tmp_path):
+    """Test that no more than `limit` detached workers run at once and the rest run inline"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    busy = worker._claim_slot(2)
+    assert busy is not None
+    worker.submit(make_job(entries=[entry("first")]), limit=2)
+    # The child holds the other slot until it exits, so the next job runs here
+    assert worker._claim_slot(2) is None
+    worker.submit(make_job(entries=[entry("second")]), limit=2)
+    assert len(worker._children) == 1
+    assert "second" in [e['prompt'] for e in History().load()]
+    worker.wait()
+    os.close(busy)
+
+    # Finished workers free their slots
+    slot = worker._claim_slot(1)
+    assert slot is not None
+    os.close(slot)
+    assert sorted(e['prompt'] for e in History().load()) == ["first", "second"]
+
+def test_inline_job(monkeypatch, tmp_path):
+    """Test that a job runs in-process when detaching is off"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('DISPLAY', ':1')
+    copied = []
+    monkeypatch.setattr('wtf.worker.copy', lambda text, environ: copied.append((text, environ)))
+    job = make_job(clipboard="ls", entries=[entry("list files")])
+    assert job['environ'] == {"DISPLAY": ":1"}
+    worker.submit(job, detached=False)
+    assert copied == [("ls", {"DISPLAY": ":1"})]
+    entries = History().load()
+    assert len(entries) == 1
+    assert entries[0]['metadata']['timings']['clipboard'] >= 0
+
+def test_copy_environ(monkeypatch):
+    """Test that the caller's display goes to the clipboard tool and not into our environment"""
+    monkeypatch.setattr('sys.platform', 'linux')
+    monkeypatch.setenv('DISPLAY', ':0')
+    monkeypatch.setattr('shutil.which', lambda name: '/usr/bin/xclip' if name == 'xclip' else None)
+    calls = []
+    monkeypatch.setattr('subprocess.run', lambda command, **kwargs: calls.append((command, kwargs)))
+    run_job({"clipboard": "ls", "environ": {"DISPLAY": ":7", "XAUTHORITY": "/tmp/xauth"}})
+    command, kwargs = calls[0]
+    assert command == ['xclip', '-selection', 'clipboard']
+    assert kwargs['input'] == b"ls"
+    assert kwargs['env']['DISPLAY'] == ':7' and kwargs['env']['XAUTHORITY'] == '/tmp/xauth'
+    assert os.environ['DISPLAY'] == ':0'
+    assert os.environ.get('XAUTHORITY') != '/tmp/xauth'
+
+    # A caller without a display doesn't borrow ours
+    calls.clear()
+    run_job({"clipboard": "ls", "environ": {}})
+    assert calls == []
+
+def test_worker_queue(monkeypatch, tmp_path):
+    """Test that a full queue refuses jobs and stopping finishes the queued ones"""
+    monkeypatch.setenv('HOME', str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job):
+        started.set()
+        release.wait()
+        run_job(job)
+
+    monkeypatch.setattr('wtf.worker.run_job', slow)
+    pool = Worker(size=2).start()
+    assert pool.submit(make_job(entries=[entry("first")]))
+    started.wait()
+    assert pool.submit(make_job(entries=[entry("second")]))
+    assert pool.submit(make_job(entries=[entry("third")]))
+    assert not pool.submit(make_job(entries=[entry("fourth")]))
+
+    threading.Timer(0.1, release.set).start()
+    pool.stop()
+    assert [e['prompt'] for e in History().load()] == ["first", "second", "third"]
+
+def test_daemon_record(monkeypatch, tmp_path):
+    """Test that the daemon records jobs on its queue and flushes them on close"""
+    from wtf.daemon import DaemonClient, DaemonServer, get_socket_path
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    socket_path = get_socket_path()
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    server = DaemonServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    client = DaemonClient.connect()
+    start = time.monotonic()
+    assert client.record(make_job(entries=[entry("list files")]))
+    assert time.monotonic() - start < 1
+    client.close()
+    server.shutdown()
+    server.server_close()
+    assert [e['prompt'] for e in History().load()] == ["list files"]
+
+def test_clipboard_available(monkeypatch):
+    """Test that a copy is only promised when a clipboard tool can be reached"""
+    monkeypatch.setattr('sys.platform', 'linux')
+    monkeypatch.delenv('WAYLAND_DISPLAY', raising=False)
+    monkeypatch.setenv('DISPLAY', ':0')
+    tools = set()
+    monkeypatch.setattr('shutil.which', lambda name: f'/usr/bin/{name}' if name in tools else None)
+    assert not worker.clipboard_available()
+    tools.add('xsel')
+    assert worker.clipboard_available()
+    monkeypatch.delenv('DISPLAY')
+    assert not worker.clipboard_available()
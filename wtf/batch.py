@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from .translator import Translator
+
+class RateLimiter:
+    """Token bucket shared by every worker calling one provider"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def read_prompts(source: TextIO) -> List[Tuple[int, str]]:
+    """One prompt per line, numbered from 1; blank lines and # comments are skipped"""
+    prompts = []
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            prompts.append((number, line))
+    return prompts
+
+def run_batch(translator: Translator, prompts: Iterable[Tuple[int, str]], provider: str, model: str, shell: str,
+              parallel: int = 4, rate_limits: Optional[Dict[str, float]] = None, use_cache: bool = True,
+              ordered: bool = True, environment: Optional[Dict] = None) -> Iterator[Dict]:
+    """Translate prompts concurrently, yielding one result per prompt in input or completion order.
+
+    rate_limits apply to every request sent to a provider, including retries and failover.
+    """
+    limiters = {name: RateLimiter(rate) for name, rate in (rate_limits or {}).items() if rate}
+
+    def throttle(name: str):
+        if name in limiters:
+            limiters[name].acquire()
+
+    def translate(line: int, prompt: str) -> Dict:
+        start = time.time()
+        result = {"line": line, "prompt": prompt, "command": None, "provider": provider, "model": model,
+                  "cache_hit": False, "latency": None, "error": None, "attempts": []}
+        route = {}
+        try:
+            command = translator.cached(prompt, provider, model, shell) if use_cache else None
+            result["cache_hit"] = command is not None
+            if command is None:
+                command = translator.generate(prompt, provider, model, shell, use_cache=use_cache,
+                                              environment=environment, route=route, throttle=throttle)
+            result["command"] = command
+        except Exception as e:
+            result["error"] = str(e)
+        # Failover may have answered with another provider or model
+        result["provider"] = route.get('provider', provider)
+        result["model"] = route.get('model', model)
+        result["attempts"] = route.get('attempts', [])
+        result["latency"] = time.time() - start
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        futures = [executor.submit(translate, line, prompt) for line, prompt in prompts]
+        for future in (futures if ordered else as_completed(futures)):
+            yield future.result()
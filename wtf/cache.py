@@ -0,0 +1,75 @@
+from pathlib import Path
+import hashlib
+import re
+import sqlite3
+import time
+from typing import Optional
+
+class ResponseCache:
+    """Persistent cache of generated commands with TTL and LRU eviction"""
+
+    def __init__(self, ttl: int = 86400, max_entries: int = 1000):
+        self.cache_file = Path.home() / '.config' / 'wtf' / 'cache.db'
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(self.cache_file, timeout=5, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                command TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        """)
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """Case-fold, collapse whitespace and drop trailing punctuation"""
+        return re.sub(r'\s+', ' ', prompt).strip().rstrip('?.!').strip().lower()
+
+    @classmethod
+    def make_key(cls, prompt: str, shell: str, provider: str, model: str, context: Optional[str] = None) -> str:
+        """Key for an answer; with working-directory context, answers are only reused where it matches"""
+        parts = [cls.normalize(prompt), shell, provider, model]
+        if context:
+            parts.append(context)
+        raw = '\0'.join(parts)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a fresh cached command and mark it as recently used"""
+        now = time.time()
+        row = self.conn.execute(
+            'SELECT command FROM responses WHERE key = ? AND created >= ?',
+            (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def put(self, key: str, command: str):
+        """Store a command, evicting expired and least recently used entries"""
+        now = time.time()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (key, command, created, last_used) VALUES (?, ?, ?, ?)',
+                (key, command, now, now)
+            )
+            self.conn.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl,))
+            self.conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        self.conn.execute('DELETE FROM responses')
+
+    def close(self):
+        self.conn.close()
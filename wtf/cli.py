@@ -1,38 +1,169 @@
-import os
+import json
+import sys
 import click
-import subprocess
-import pyperclip
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 import logging
-from .config import Config
-from .providers import get_provider
-from rich.console import Console
-from rich.status import Status
-from .history import History
+from .config import Config, get_config
+from .environment import probe
+from . import batch, context, daemon, prefetch, worker
+from .translator import Translator
+from .similar import Match
+from .resilience import parse_target
+from .history import History, parse_time
 from .setup import get_log_file
+from .logs import follow as follow_log, record_filter, tail_lines
+from . import execution, stats
 import time
-from rich.table import Table
-from rich import box
+
+# rich and pyperclip are imported where they are used so that commands
+# which never draw a table or spinner start quickly
 
 logger = logging.getLogger('wtf')
 
-def translate_command(command: tuple, provider: Optional[str], model: Optional[str], execute: bool, debug: bool):
-    """Convert natural language to shell commands"""
+# Seconds to wait before hedging when history has too few samples for a percentile
+DEFAULT_HEDGE_DELAY = 2.0
+
+def offer_similar(history: History, prompt: str, shell: str, threshold: float, status) -> Optional[Match]:
+    """Offer the command generated for a near-duplicate earlier prompt"""
+    with history.index() as index:
+        matches = index.lookup(prompt, shell, threshold)
+    if not matches:
+        return None
+    match = matches[0]
+    status.stop()
+    if click.confirm(
+        f"\nSimilar to an earlier prompt ({match.score:.0%}): {match.prompt}\n  {match.command}\nUse this command?",
+        default=True, err=True
+    ):
+        return match
+    status.start()
+    return None
+
+def race_targets(config: Config, provider: str, model: str) -> List[Tuple[str, str]]:
+    """The requested provider/model followed by the configured race targets"""
+    targets = [(provider, model)]
+    for target in config.config['race']['targets']:
+        target = parse_target(config.config, target)
+        if target not in targets:
+            targets.append(target)
+    if len(targets) < 2:
+        raise click.ClickException("Racing needs other providers or models; add them to race.targets in config.yaml")
+    return targets
+
+def hedge_delay(config: Config, history: History, provider: str, model: str) -> float:
+    """Configured hedge delay, else the recent latency percentile for the primary target"""
+    settings = config.config['race']
+    if settings['hedge_delay'] is not None:
+        return float(settings['hedge_delay'])
+    delay = history.latency_percentile(provider, model, settings['hedge_percentile'])
+    return delay if delay is not None else DEFAULT_HEDGE_DELAY
+
+def history_entry(prompt: str, command: str, success: bool, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """A history entry stamped now, for writing later"""
+    return {"timestamp": datetime.now().isoformat(), "prompt": prompt, "command": command, "success": success,
+            "metadata": metadata}
+
+def translate_command(command: tuple, provider: Optional[str], model: Optional[str], execute: bool, debug: bool,
+                      no_cache: bool = False, stream: Optional[bool] = None, race: Optional[str] = None) -> int:
+    """Convert natural language to shell commands; returns the exit code of an executed command"""
+    from rich.console import Console
+    from rich.status import Status
+
     console = Console(stderr=True)
     history = History()
     
     status = Status("[bold blue]Thinking...", console=console)
     status.start()
     
+    provider_name = provider
+    route = {}
+    timer = stats.PhaseTimer()
+    inflight = prefetch.InFlight()
+    backend = None
+    exit_code = 0
     try:
         start_time = time.time()
-        config = Config()
+        config = get_config()
         provider_name = provider or config.config['default_provider']
         provider_config = config.get_provider_config(provider_name)
         model = model or provider_config['default_model']
+        prompt = ' '.join(command)
+        # Opt-in working-directory facts, gathered while we probe the environment and connect
+        collector = context.Collector(config.config['context']).start() if config.config['context']['enabled'] else None
+        timer.lap('config')
+
+        environment = probe()
+        shell = environment['shell']
+        timer.lap('environment')
+        backend = daemon.connect(config)
+        timer.lap('connect')
+
+        # The answer depends on the context, so it is part of the cache key
+        workdir = None
+        if collector:
+            workdir = context.describe(collector.wait())
+            environment = {**environment, "context": workdir}
+            timer.lap('context')
+
+        use_cache = config.config['cache']['enabled'] and not no_cache
+        shell_command = backend.cached(prompt, provider_name, model, shell, workdir) if use_cache else None
+        cache_hit = shell_command is not None
+        timer.lap('cache')
+
+        prefetch_wait = None
+        if not cache_hit and use_cache and not race:
+            # A shell widget may already be asking for this exact prompt; wait for its answer
+            from .cache import ResponseCache
+            key = ResponseCache.make_key(prompt, shell, provider_name, model, workdir)
+            if not inflight.acquire(key, wait=config.config['resilience']['deadline'] or 10):
+                shell_command = backend.cached(prompt, provider_name, model, shell, workdir)
+                cache_hit = shell_command is not None
+                prefetch_wait = timer.lap('prefetch')
 
-        ai_provider = get_provider(provider_name, config.config)
-        shell_command = ai_provider.get_shell_command(' '.join(command), model)
+        similar = None
+        # An earlier prompt's command was written for whatever directory it was asked in
+        if (not cache_hit and not no_cache and not collector and config.config['similar']['enabled']
+                and sys.stdin.isatty()):
+            similar = offer_similar(history, prompt, shell, config.config['similar']['threshold'], status)
+            if similar:
+                shell_command = similar.command
+            timer.lap('similar')
+
+        ttft = None
+        race_info = None
+        usage = {}
+        if shell_command is None and race:
+            targets = race_targets(config, provider_name, model)
+            delay = hedge_delay(config, history, provider_name, model) if race == 'hedge' else None
+            shell_command, race_info = backend.race(prompt, targets, shell, hedge_delay=delay, use_cache=use_cache,
+                                                    environment=environment)
+            provider_name, _, model = race_info['winner'].partition(':')
+            usage.update(next(a for a in race_info['attempts'] if a['status'] == 'won').get('usage') or {})
+            timer.lap('request')
+        elif shell_command is None:
+            if stream is None:
+                stream = config.config['stream']['enabled']
+            on_token = None
+            if stream:
+                def on_token(token: str):
+                    nonlocal ttft
+                    if ttft is None:
+                        ttft = time.time() - start_time
+                        status.stop()
+                    click.secho(token, err=True, nl=False, dim=True)
+
+            phases = {}
+            shell_command = backend.generate(prompt, provider_name, model, shell, use_cache=use_cache, on_token=on_token,
+                                             environment=environment, timings=phases, usage=usage, route=route)
+            # Failover may have answered with another provider or model
+            provider_name, model = route.get('provider', provider_name), route.get('model', model)
+            # Whatever the translator didn't measure went to the daemon round trip
+            timer.split('dispatch', phases)
+            if ttft is not None:
+                click.echo(err=True)
+        # The answer is cached; anyone waiting on this prompt can have it
+        inflight.release()
         latency = time.time() - start_time
 
         status.stop()
@@ -40,33 +171,113 @@ def translate_command(command: tuple, provider: Optional[str], model: Optional[s
         metadata = {
             "provider": provider_name,
             "model": model,
-            "latency": latency
+            "latency": latency,
+            "shell": shell,
+            "cache_hit": cache_hit,
+            "daemon": isinstance(backend, daemon.DaemonClient) and not backend.fell_back
         }
+        if ttft is not None:
+            metadata["ttft"] = ttft
+        if prefetch_wait is not None and cache_hit:
+            metadata["prefetched"] = True
+        if race_info:
+            metadata["race"] = race_info
+        if usage:
+            metadata["usage"] = usage
+        if route.get('attempts'):
+            metadata["attempts"] = route['attempts']
+        if collector:
+            metadata["context"] = {"cached": collector.cached, "timed_out": collector.timed_out}
+        if similar:
+            metadata["similar_to"] = {"prompt": similar.prompt, "score": round(similar.score, 3)}
 
         if execute:
             if not click.confirm(f"\nAbout to execute: {shell_command}\nContinue?", err=True):
                 raise click.Abort()
             logger.info(f"Executing: {shell_command}")
             click.echo(f"Executing: {shell_command}", err=True)
-            os.system(shell_command)
-            history.add(' '.join(command), shell_command, success=True, metadata=metadata)
+            timer.lap('output')
+            metadata["timings"] = timer.rounded()
+            metadata["execution"] = execution.run(shell_command, shell)
+            exit_code = metadata["execution"]['exit_code']
+            job = worker.make_job(entries=[history_entry(prompt, shell_command, exit_code == 0, metadata)])
         else:
-            logger.info(f"Generated command: {shell_command}")
             click.echo(shell_command)
-            try:
-                pyperclip.copy(shell_command)
+            timer.lap('output')
+            metadata["timings"] = timer.rounded()
+            # Clipboard, history and logging happen after we return, off the critical path
+            copy = worker.clipboard_available()
+            job = worker.make_job(
+                clipboard=shell_command if copy else None,
+                entries=[history_entry(prompt, shell_command, True, metadata)],
+                log=[["INFO", f"Generated command: {shell_command}"]]
+            )
+            if copy:
                 click.echo("(copied to clipboard)", err=True)
-            except Exception as e:
-                logger.debug(f"Failed to copy to clipboard: {e}")
-            history.add(' '.join(command), shell_command, success=True, metadata=metadata)
+        backend.record(job)
+        logger.debug(f"Handoff took {timer.lap('handoff') * 1000:.1f}ms")
+        return exit_code
     except Exception as e:
         status.stop()
         logger.exception("Error during command translation")
-        history.add(' '.join(command), "", success=False, metadata={"error": str(e)})
+        job = worker.make_job(entries=[history_entry(' '.join(command), "", False, {
+            "error": str(e),
+            "provider": provider_name,
+            "model": model,
+            "timings": timer.rounded(),
+            **({"attempts": route['attempts']} if route.get('attempts') else {})
+        })])
+        if backend:
+            backend.record(job)
+        else:
+            worker.submit(job, detached=False)
         raise click.ClickException(str(e))
     finally:
+        inflight.release()
         status.stop()
 
+def translate_batch(source, provider: Optional[str], model: Optional[str], parallel: Optional[int], order: str,
+                    no_cache: bool) -> int:
+    """Translate one prompt per line of source, writing JSON lines to stdout; returns the number of failures"""
+    config = get_config()
+    provider_name = provider or config.config['default_provider']
+    model = model or config.get_provider_config(provider_name)['default_model']
+    environment = probe()
+    shell = environment['shell']
+    settings = config.config['batch']
+
+    results = []
+    for result in batch.run_batch(
+        Translator(config), batch.read_prompts(source), provider_name, model, shell,
+        parallel=parallel or settings['parallel'],
+        rate_limits=settings['rate_limits'],
+        use_cache=config.config['cache']['enabled'] and not no_cache,
+        ordered=order == 'input',
+        environment=environment
+    ):
+        click.echo(json.dumps(result))
+        results.append(result)
+
+    History().add_many([
+        {
+            "prompt": result['prompt'],
+            "command": result['command'] or "",
+            "success": result['error'] is None,
+            "metadata": {
+                "provider": result['provider'],
+                "model": result['model'],
+                "latency": result['latency'],
+                "shell": shell,
+                "cache_hit": result['cache_hit'],
+                "batch": True,
+                **({"attempts": result['attempts']} if result['attempts'] else {}),
+                **({"error": result['error']} if result['error'] else {})
+            }
+        }
+        for result in results
+    ])
+    return sum(1 for result in results if result['error'])
+
 @click.command()
 @click.argument('command', nargs=-1, required=False)
 @click.option('-p', '--provider', help='AI provider to use')
@@ -78,12 +289,48 @@ def translate_command(command: tuple, provider: Optional[str], model: Optional[s
 @click.option('--show-config', is_flag=True, help='Show current configuration')
 @click.option('-n', '--lines', default=20, help='Number of lines to show for logs/history')
 @click.option('-f', '--follow', is_flag=True, help='Follow log output')
+@click.option('--level', type=click.Choice(['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], case_sensitive=False),
+              help='Only show log records at or above this level')
+@click.option('--logger', 'logger_name', help='Only show log records from this logger (and its children)')
+@click.option('--stats', 'show_stats', is_flag=True, help='Show latency percentiles, throughput, error and cache-hit rates per provider and model')
+@click.option('--search', help='Full-text search over history prompts and commands')
+@click.option('--status', type=click.Choice(['ok', 'failed']), help='Only show successful or failed history entries')
+@click.option('--since', help='Only show history from this date (YYYY-MM-DD or relative, e.g. 7d)')
+@click.option('--until', help='Only show history up to this date (YYYY-MM-DD or relative, e.g. 1h)')
+@click.option('--compact-history', is_flag=True, help='Apply the history retention policy now, archiving evicted entries')
+@click.option('--offset', type=click.IntRange(min=0), default=0, help='Skip this many of the newest history entries')
+@click.option('--page', type=click.IntRange(min=1), help='Show this page of history, --lines entries per page')
+@click.option('--pager', is_flag=True, help='Browse history interactively, one page at a time')
+@click.option('--format', 'output_format', type=click.Choice(['table', 'plain', 'tsv']), default='table',
+              help='History output: a table, plain command lines, or tab-separated fields for grep/fzf')
+@click.option('--no-cache', is_flag=True, help='Skip the response cache and similar-prompt suggestions')
+@click.option('--stream/--no-stream', default=None, help='Show the command on stderr as it is generated')
+@click.option('--race', 'race', flag_value='race', help='Ask all race.targets at once and use the first answer')
+@click.option('--hedge', 'race', flag_value='hedge', help='Ask race.targets one after another, each after a latency-percentile delay')
+@click.option('--batch', 'batch_file', type=click.File('r'), help='Translate one prompt per line of a file (- for stdin) to JSON lines')
+@click.option('--parallel', type=click.IntRange(min=1), help='Concurrent requests in batch mode')
+@click.option('--order', type=click.Choice(['input', 'completion']), default='input', help='Order of batch results')
+@click.option('--shell-init', type=click.Choice(list(prefetch.SCRIPTS)), help='Print the line-editor widget for zsh or bash, for eval in your shell rc file')
+@click.option('--line', 'widget_line', metavar='LINE', help='Translate a whole command line as typed in the shell (used by the widget)')
+@click.option('--prefetch', 'prefetch_line', metavar='LINE', help='Translate a line into the cache in the background (used by the widget)')
+@click.option('--daemon', 'start_daemon', is_flag=True, help='Start a background daemon that keeps provider clients warm')
+@click.option('--stop-daemon', is_flag=True, help='Stop the background daemon')
 def cli(command: tuple, provider: Optional[str], model: Optional[str], execute: bool, 
-        debug: bool, history: bool, logs: bool, show_config: bool, lines: int, follow: bool):
+        debug: bool, history: bool, logs: bool, show_config: bool, lines: int, follow: bool,
+        level: Optional[str], logger_name: Optional[str], show_stats: bool,
+        search: Optional[str], status: Optional[str], since: Optional[str], until: Optional[str],
+        compact_history: bool, offset: int, page: Optional[int], pager: bool, output_format: str,
+        no_cache: bool, stream: Optional[bool], race: Optional[str], batch_file, parallel: Optional[int],
+        order: str, shell_init: Optional[str], widget_line: Optional[str], prefetch_line: Optional[str],
+        start_daemon: bool, stop_daemon: bool):
     """WTF - Convert natural language to shell commands"""
     
     if show_config:
-        config = Config()
+        from rich.console import Console
+        from rich.table import Table
+        from rich import box
+
+        config = get_config()
         console = Console()
         
         table = Table(
@@ -131,6 +378,9 @@ def cli(command: tuple, provider: Optional[str], model: Optional[str], execute:
                 "  Default Model",
                 f"[yellow]{settings['default_model']}[/]"
             )
+
+            if settings.get('base_url'):
+                table.add_row("  Base URL", settings['base_url'])
             
             # Available models as bullet points
             models = "\n".join(f"• {model}" for model in settings['models'])
@@ -143,30 +393,105 @@ def cli(command: tuple, provider: Optional[str], model: Optional[str], execute:
         console.print()
         return
         
-    if history:
-        History().show(limit=lines)
+    if shell_init:
+        click.echo(prefetch.shell_init(shell_init, get_config().config['widget']))
+        return
+
+    if prefetch_line:
+        try:
+            prefetch.prefetch(prefetch_line)
+        except Exception as e:
+            # Speculative; the real request will report any problem
+            logger.debug(f"Prefetch failed: {e}")
+        return
+
+    if widget_line:
+        params = prefetch.parse_line(widget_line)
+        if not params:
+            raise click.UsageError("Please provide a command description")
+        translate_command(params['command'], provider or params['provider'], model or params['model'],
+                          execute=False, debug=debug, no_cache=no_cache, stream=False)
+        return
+
+    if start_daemon:
+        client = daemon.DaemonClient.connect()
+        if client:
+            click.echo(f"wtf daemon already running (pid {client.call('ping')})", err=True)
+        elif daemon.spawn():
+            click.echo(f"wtf daemon started on {daemon.get_socket_path()}", err=True)
+        else:
+            raise click.ClickException("wtf daemon failed to start; see wtf --logs")
+        return
+
+    if stop_daemon:
+        client = daemon.DaemonClient.connect()
+        if not client:
+            click.echo("wtf daemon is not running", err=True)
+            return
+        client.call('shutdown')
+        click.echo("wtf daemon stopped", err=True)
+        return
+
+    if compact_history:
+        evicted = History().compact()
+        click.echo(f"Compacted history: {evicted} entries evicted", err=True)
+        return
+
+    if history or search or show_stats or pager:
+        filters = {
+            "text": search,
+            "provider": provider,
+            "model": model,
+            "success": None if status is None else status == 'ok'
+        }
+        for name, value in (("since", since), ("until", until)):
+            try:
+                filters[name] = parse_time(value) if value else None
+            except ValueError:
+                raise click.BadParameter(f"Invalid date: {value}", param_hint=f"--{name}")
+        if show_stats:
+            entries = History().search(limit=stats.MAX_SAMPLES, **filters)
+            stats.show(stats.summarize(entries, filters['since'], filters['until']))
+            execution.show(execution.summarize(entries))
+            return
+        if page:
+            offset += (page - 1) * lines
+        if pager:
+            if lines < 1:
+                raise click.BadParameter("The pager needs at least one line per page", param_hint="--lines")
+            History().page(page_size=lines, offset=offset, **filters)
+            return
+        History().show(limit=lines, offset=offset, output=output_format, **filters)
         return
         
     if logs:
         log_file = get_log_file()
-        console = Console()
-        
+        predicate = record_filter(level, logger_name)
+
         if follow:
             try:
-                subprocess.run(['tail', '-f', str(log_file)])
+                for line in follow_log(log_file, predicate):
+                    click.echo(line)
             except KeyboardInterrupt:
                 pass
         else:
             if log_file.exists():
-                with open(log_file) as f:
-                    last_lines = list(f)[-lines:]
-                    for line in last_lines:
-                        console.print(line.strip())
+                for line in tail_lines(log_file, lines, predicate):
+                    click.echo(line)
             else:
-                console.print("No logs found", style="yellow")
+                click.secho("No logs found", fg="yellow")
+        return
+
+    if batch_file:
+        failures = translate_batch(batch_file, provider, model, parallel, order, no_cache)
+        if failures:
+            raise click.exceptions.Exit(1)
         return
 
     if not command:
         raise click.UsageError("Please provide a command description")
         
-    translate_command(command, provider, model, execute, debug) 
\ No newline at end of file
+    exit_code = translate_command(command, provider, model, execute, debug, no_cache=no_cache, stream=stream, race=race)
+    if exit_code:
+        # Pass a failed command's status on, so `wtf -e` works in scripts; signals map to 128+N like a shell
+        raise click.exceptions.Exit(exit_code if exit_code > 0 else 128 - exit_code) 
\ No newline at end of file
@@ -1,9 +1,13 @@
 from pathlib import Path
+import copy
+import json
 import os
-from typing import Dict, Any, Optional
-import yaml
+import random
+import time
+from typing import Callable, Dict, Any, Optional, Tuple
 import click
 import logging
+from .storage import VersionConflict, atomic_file, atomic_write, version
 
 logger = logging.getLogger(__name__)
 
@@ -15,71 +19,215 @@ DEFAULT_CONFIG = {
             "api_key": "",
             "default_model": "gpt-4o",
             "models": ["gpt-3.5-turbo", "gpt-4", "gpt-4o"],
-            "env_key": "OPENAI_API_KEY"
+            "env_key": "OPENAI_API_KEY",
+            "max_tokens": 100
         },
         "anthropic": {
             "api_key": "",
             "default_model": "claude-3-5-sonnet",
             "models": ["claude-3-sonnet", "claude-3-opus", "claude-3-haiku", "claude-3-5-sonnet", "claude-3-5-haiku", "claude-3-5-opus"],
-            "env_key": "ANTHROPIC_API_KEY"
+            "env_key": "ANTHROPIC_API_KEY",
+            "max_tokens": 100,
+            "prompt_cache": True
+        }
+    },
+    "history": {
+        "backend": "jsonl",
+        "max_entries": 100000,
+        "max_age": "365d",
+        "max_bytes": 100 * 1024 * 1024,
+        "archive": True,
+        "auto_compact": True
+    },
+    "cache": {
+        "enabled": True,
+        "ttl": 86400,
+        "max_entries": 1000
+    },
+    "similar": {
+        "enabled": True,
+        "threshold": 0.8
+    },
+    "stream": {
+        "enabled": False
+    },
+    "daemon": {
+        "auto_spawn": False
+    },
+    "race": {
+        "targets": [],
+        "hedge_delay": None,
+        "hedge_percentile": 95
+    },
+    "batch": {
+        "parallel": 4,
+        "rate_limits": {}
+    },
+    "resilience": {
+        "deadline": 10,
+        "retries": 2,
+        "backoff": 0.5,
+        "max_backoff": 4,
+        "failover": [],
+        "breaker_threshold": 3,
+        "breaker_cooldown": 60
+    },
+    "context": {
+        "enabled": False,
+        "probes": ["files", "git", "project", "tools"],
+        "timeout": 0.25,
+        "max_bytes": 1024,
+        "max_files": 40
+    },
+    "worker": {
+        "detach": True,
+        "max_detached": 4,
+        "queue_size": 100
+    },
+    "widget": {
+        "prefetch": True,
+        "debounce": 0.3,
+        "min_words": 2,
+        "key_zsh": "^G",
+        "key_bash": "\\C-g",
+        "bash_space_prefetch": False
+    },
+    "logging": {
+        "level": "DEBUG",
+        "format": "text",
+        "max_bytes": 5 * 1024 * 1024,
+        "backup_count": 5,
+        "rotate": "daily",
+        "compress": True,
+        "levels": {
+            "httpcore": "INFO",
+            "httpx": "INFO",
+            "openai": "INFO",
+            "anthropic": "INFO"
         }
     }
 }
 
+# Top-level settings sections merged key by key with their defaults
+SECTIONS = ["history", "cache", "similar", "stream", "daemon", "race", "batch", "resilience", "context", "worker", "widget", "logging"]
+
+# A config.yaml modified this recently may change again within the same
+# mtime tick, so its parsed form is not cached yet
+RACY_WINDOW_NS = 2_000_000_000
+
+# Times Config.update re-reads and retries after another process saved first
+UPDATE_ATTEMPTS = 20
+
 class Config:
     def __init__(self):
         self.config_dir = Path.home() / '.config' / 'wtf'
         self.config_file = self.config_dir / 'config.yaml'
+        self.cache_file = self.config_dir / 'config.cache.json'
         self.config = self._load_config()
 
+    def _stamp(self) -> Optional[Tuple[int, int, int]]:
+        return version(self.config_file)
+
+    def is_stale(self) -> bool:
+        """Whether HOME or config.yaml changed since this config was loaded"""
+        return (
+            self.config_file != Path.home() / '.config' / 'wtf' / 'config.yaml'
+            or self._stamp() != self.stamp
+        )
+
     def _merge_configs(self, config: Dict[str, Any]) -> Dict[str, Any]:
         """Ensure all default fields exist in the config"""
-        result = DEFAULT_CONFIG.copy()
+        result = copy.deepcopy(DEFAULT_CONFIG)
         if config:
-            for provider, settings in config.get('providers', {}).items():
+            for provider, settings in (config.get('providers') or {}).items():
                 if provider in result['providers']:
                     result['providers'][provider].update(settings)
+                else:
+                    # A provider defined only in config.yaml, e.g. a local OpenAI-compatible server
+                    models = settings.get('models') or []
+                    result['providers'][provider] = {
+                        "api_key": "",
+                        "default_model": models[0] if models else None,
+                        "models": models,
+                        **settings
+                    }
             if 'default_provider' in config:
                 result['default_provider'] = config['default_provider']
             if 'default_model' in config:
                 result['default_model'] = config['default_model']
+            for section in SECTIONS:
+                result[section].update(config.get(section) or {})
         return result
 
     def _load_config(self) -> Dict[str, Any]:
         if not self.config_file.exists():
             self.config_dir.mkdir(parents=True, exist_ok=True)
-            self._save_config(DEFAULT_CONFIG)
-            return DEFAULT_CONFIG
-        
-        with open(self.config_file, 'r') as f:
-            config = yaml.safe_load(f) or {}
-        
-        # Merge with defaults to ensure all required fields exist
-        merged_config = self._merge_configs(config)
-        if merged_config != config:
-            self._save_config(merged_config)
-        return merged_config
+            self.stamp = None
+            try:
+                self._save_config(DEFAULT_CONFIG)
+                return copy.deepcopy(DEFAULT_CONFIG)
+            except VersionConflict:
+                # Another process created it first; use theirs
+                pass
+
+        self.stamp = self._stamp()
+        config = self._read_cache()
+        if config is None:
+            import yaml
+            with open(self.config_file, 'r') as f:
+                config = yaml.safe_load(f) or {}
+            self._write_cache(config)
+
+        # Merge with defaults in memory; the file is only written by wtf-config
+        return self._merge_configs(config)
+
+    def _read_cache(self) -> Optional[Dict[str, Any]]:
+        """Parsed config.yaml from the JSON cache, if it was made from the current file"""
+        try:
+            cached = json.loads(self.cache_file.read_text())
+        except (OSError, ValueError):
+            return None
+        if tuple(cached.get('stamp') or ()) != self.stamp:
+            return None
+        return cached['config']
+
+    def _write_cache(self, config: Dict[str, Any]):
+        if self.stamp is None or time.time_ns() - self.stamp[0] < RACY_WINDOW_NS:
+            return
+        try:
+            # Just a cache: atomic, but not worth an fsync
+            with atomic_file(self.cache_file, 'w', sync=False) as f:
+                f.write(json.dumps({"stamp": self.stamp, "config": config}))
+        except (OSError, TypeError, ValueError):
+            # Not JSON-serializable or not writable; parse the YAML next time
+            pass
 
     def _save_config(self, config: Dict[str, Any]):
-        with open(self.config_file, 'w') as f:
-            yaml.dump(config, f)
+        """Atomically replace config.yaml, unless it changed since this config was loaded"""
+        import yaml
+        self.stamp = atomic_write(self.config_file, yaml.dump(config), expected=self.stamp)
+        self.cache_file.unlink(missing_ok=True)
+
+    def update(self, change: Callable[[Dict[str, Any]], None]):
+        """Apply change to the config and save it, re-reading and retrying if another process saved first"""
+        for attempt in range(UPDATE_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, min(0.5, 0.005 * 2 ** attempt)))
+                self.config = self._load_config()
+            change(self.config)
+            try:
+                self._save_config(self.config)
+                return
+            except VersionConflict:
+                if attempt == UPDATE_ATTEMPTS - 1:
+                    raise
 
     def get_provider_config(self, provider: Optional[str] = None) -> Dict[str, Any]:
         provider = provider or self.config['default_provider']
         return self.config['providers'][provider]
 
     def get_api_key(self, provider: str) -> Optional[str]:
-        provider_config = self.config['providers'][provider]
-        # First check environment variable
-        if env_key := provider_config.get('env_key'):
-            api_key = os.getenv(env_key)
-            logger.debug(f"Checking env var {env_key}: {'found' if api_key else 'not found'}")  # This goes to log file only
-            if api_key:
-                return api_key
-        # Fall back to config file
-        config_key = provider_config.get('api_key')
-        logger.debug(f"Checking config file: {'found' if config_key else 'not found'}")  # This goes to log file only
-        return config_key 
+        return get_api_key(self.config, provider)
 
     def check_first_run(self) -> bool:
         """Check if this is first run and show helpful info"""
@@ -93,4 +241,26 @@ class Config:
             click.echo("1. Get a key from https://console.anthropic.com/settings/keys")
             click.echo("2. Run: wtf-config set-key anthropic sk-...\n")
             return True
-        return False 
\ No newline at end of file
+        return False 
+
+def get_api_key(config: Dict[str, Any], provider: str) -> Optional[str]:
+    provider_config = config['providers'][provider]
+    # First check environment variable
+    if env_key := provider_config.get('env_key'):
+        api_key = os.getenv(env_key)
+        logger.debug(f"Checking env var {env_key}: {'found' if api_key else 'not found'}")  # This goes to log file only
+        if api_key:
+            return api_key
+    # Fall back to config file
+    config_key = provider_config.get('api_key')
+    logger.debug(f"Checking config file: {'found' if config_key else 'not found'}")  # This goes to log file only
+    return config_key
+
+_config: Optional[Config] = None
+
+def get_config() -> Config:
+    """Process-wide config, reloaded only when config.yaml changes on disk"""
+    global _config
+    if _config is None or _config.is_stale():
+        _config = Config()
+    return _config
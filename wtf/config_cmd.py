@@ -15,8 +15,7 @@ def set_key(provider: str, api_key: str):
     if provider not in config.config['providers']:
         raise click.ClickException(f"Unknown provider: {provider}")
     
-    config.config['providers'][provider]['api_key'] = api_key
-    config._save_config(config.config)
+    config.update(lambda settings: settings['providers'][provider].update(api_key=api_key))
     click.echo(f"API key set for {provider}")
 
 @cli.command()
@@ -27,6 +26,5 @@ def set_default(provider: str):
     if provider not in config.config['providers']:
         raise click.ClickException(f"Unknown provider: {provider}")
     
-    config.config['default_provider'] = provider
-    config._save_config(config.config)
+    config.update(lambda settings: settings.update(default_provider=provider))
     click.echo(f"Default provider set to {provider}") 
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""Opt-in facts about the working directory for the prompt: files, git state, project type and its tools"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from .storage import atomic_file
+
+logger = logging.getLogger(__name__)
+
+# Reuse a directory's context for at most this long even when its mtime is unchanged,
+# since editing a file inside it doesn't touch the directory
+CONTEXT_TTL = 300
+
+# Directories remembered in the on-disk cache
+MAX_CACHED = 64
+
+# Files that identify the kind of project in a directory
+MARKERS = {
+    "pyproject.toml": "python", "setup.py": "python", "requirements.txt": "python",
+    "package.json": "node", "Cargo.toml": "rust", "go.mod": "go", "Gemfile": "ruby",
+    "composer.json": "php", "pom.xml": "maven", "build.gradle": "gradle", "build.gradle.kts": "gradle",
+    "CMakeLists.txt": "cmake", "Makefile": "make", "Dockerfile": "docker",
+    "docker-compose.yml": "compose", "docker-compose.yaml": "compose", "compose.yaml": "compose",
+    "main.tf": "terraform", "flake.nix": "nix",
+}
+
+# Tools those projects are usually driven with, reported when they are on PATH
+PROJECT_TOOLS = {
+    "python": ["python3", "pip", "uv", "poetry", "pytest", "tox"],
+    "node": ["node", "npm", "npx", "yarn", "pnpm", "bun"],
+    "rust": ["cargo", "rustc"],
+    "go": ["go"],
+    "ruby": ["ruby", "bundle", "rake"],
+    "php": ["php", "composer"],
+    "maven": ["mvn"],
+    "gradle": ["gradle"],
+    "cmake": ["cmake", "ninja", "make"],
+    "make": ["make"],
+    "docker": ["docker", "podman"],
+    "compose": ["docker", "docker-compose", "podman-compose"],
+    "terraform": ["terraform", "tofu"],
+    "nix": ["nix"],
+}
+
+def get_cache_file() -> Path:
+    """Get path to the working-directory context cache"""
+    return Path.home() / '.config' / 'wtf' / 'context.json'
+
+def _names(cwd: Path) -> List[str]:
+    with os.scandir(cwd) as entries:
+        return sorted(entry.name + ('/' if entry.is_dir() else '') for entry in entries)
+
+def _kinds(names: List[str]) -> List[str]:
+    kinds = []
+    for name in names:
+        kind = MARKERS.get(name)
+        if kind and kind not in kinds:
+            kinds.append(kind)
+    return kinds
+
+def _git_dir(cwd: Path) -> Optional[Path]:
+    for directory in (cwd, *cwd.parents):
+        if (directory / '.git').exists():
+            return directory / '.git'
+    return None
+
+def probe_files(cwd: Path, settings: Dict[str, Any]) -> Optional[str]:
+    names = [name for name in _names(cwd) if not name.startswith('.')]
+    if not names:
+        return f"Directory {cwd} is empty (apart from dotfiles)"
+    shown = names[:settings['max_files']]
+    more = f" and {len(names) - len(shown)} more" if len(names) > len(shown) else ""
+    return f"Files in {cwd}: {', '.join(shown)}{more}"
+
+def probe_git(cwd: Path, settings: Dict[str, Any]) -> Optional[str]:
+    if _git_dir(cwd) is None or not shutil.which('git'):
+        return None
+    output = subprocess.run(
+        ['git', 'status', '--porcelain=v1', '--branch'],
+        cwd=cwd, capture_output=True, text=True, timeout=settings['timeout'],
+        # Don't take index.lock for the stat refresh; a concurrent git command would fail on it
+        env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"},
+    ).stdout.splitlines()
+    if not output:
+        return None
+    branch = output[0][3:] if output[0].startswith('## ') else '?'
+    changes = output[1:]
+    if not changes:
+        return f"Git: on {branch}, clean"
+    shown = ', '.join(line.strip() for line in changes[:settings['max_files']])
+    more = f" and {len(changes) - settings['max_files']} more" if len(changes) > settings['max_files'] else ""
+    return f"Git: on {branch}, {len(changes)} changed: {shown}{more}"
+
+def probe_project(cwd: Path, settings: Dict[str, Any]) -> Optional[str]:
+    kinds = _kinds(_names(cwd))
+    return f"Project type: {', '.join(kinds)}" if kinds else None
+
+def probe_tools(cwd: Path, settings: Dict[str, Any]) -> Optional[str]:
+    wanted = [tool for kind in _kinds(_names(cwd)) for tool in PROJECT_TOOLS[kind]]
+    found = [tool for tool in dict.fromkeys(wanted) if shutil.which(tool)]
+    return f"Project tools on PATH: {', '.join(found)}" if found else None
+
+PROBES: Dict[str, Callable[[Path, Dict[str, Any]], Optional[str]]] = {
+    "files": probe_files,
+    "git": probe_git,
+    "project": probe_project,
+    "tools": probe_tools,
+}
+
+def clip(text: str, max_bytes: int) -> str:
+    """Cut text to at most max_bytes of UTF-8"""
+    data = text.encode()
+    if len(data) <= max_bytes:
+        return text
+    return data[:max(max_bytes - 3, 0)].decode(errors='ignore') + '...'
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+class Collector:
+    """Runs the context probes for a directory on background threads.
+
+    Call start() early and wait() when the prompt is needed; the probes run
+    meanwhile. Every probe shares one time budget and its output is clipped
+    to max_bytes; a probe that misses the budget is left out. Complete
+    results are cached on disk per directory until its mtime (or the git
+    index's) changes.
+    """
+
+    def __init__(self, settings: Dict[str, Any], cwd: Optional[Path] = None):
+        self.settings = settings
+        self.cwd = Path(cwd or os.getcwd())
+        self.probes = [name for name in settings['probes'] if name in PROBES]
+        self.results: Dict[str, Optional[str]] = {}
+        self.threads: Dict[str, threading.Thread] = {}
+        self.cached = False
+        self.stamp: Optional[Dict[str, Any]] = None
+        self.deadline = 0.0
+        # Probes that missed the time budget on the last wait()
+        self.timed_out: List[str] = []
+
+    def _stamp(self) -> Dict[str, Any]:
+        git_dir = _git_dir(self.cwd)
+        return {
+            "mtime": _mtime(self.cwd),
+            "git": [_mtime(git_dir / 'index'), _mtime(git_dir / 'HEAD')] if git_dir else None,
+            "probes": self.probes,
+            "limits": [self.settings['max_files'], self.settings['max_bytes']],
+        }
+
+    def _key(self) -> str:
+        return hashlib.sha256(str(self.cwd).encode()).hexdigest()[:16]
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            return json.loads(get_cache_file().read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def start(self) -> 'Collector':
+        self.stamp = self._stamp()
+        entry = self._load().get(self._key())
+        if entry and entry['stamp'] == self.stamp and time.time() - entry['collected_at'] <= CONTEXT_TTL:
+            self.results = entry['results']
+            self.cached = True
+            return self
+
+        self.deadline = time.monotonic() + self.settings['timeout']
+        for name in self.probes:
+            # Daemon threads, so a probe stuck on a slow filesystem can't hold up exit
+            thread = threading.Thread(target=self._run, args=(name,), name=f'wtf-context-{name}', daemon=True)
+            self.threads[name] = thread
+            thread.start()
+        return self
+
+    def _run(self, name: str):
+        try:
+            result = PROBES[name](self.cwd, self.settings)
+        except Exception as e:
+            logger.debug(f"Context probe {name} failed: {e}")
+            result = None
+        self.results[name] = clip(result, self.settings['max_bytes']) if result else None
+
+    def wait(self) -> Dict[str, Optional[str]]:
+        """Results of the probes that finished within the budget, by probe name"""
+        for thread in self.threads.values():
+            thread.join(max(self.deadline - time.monotonic(), 0))
+        results = {name: self.results[name] for name in self.probes if name in self.results}
+        self.timed_out = [name for name in self.probes if name not in results]
+        if self.threads and not self.timed_out:
+            self._save(results)
+        self.threads = {}
+        return results
+
+    def _save(self, results: Dict[str, Optional[str]]):
+        cache = self._load()
+        cache[self._key()] = {"stamp": self.stamp, "collected_at": time.time(), "results": results}
+        if len(cache) > MAX_CACHED:
+            newest = sorted(cache.items(), key=lambda item: item[1]['collected_at'])[-MAX_CACHED:]
+            cache = dict(newest)
+        try:
+            cache_file = get_cache_file()
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_file(cache_file, 'w', sync=False) as f:
+                f.write(json.dumps(cache))
+        except OSError:
+            pass
+
+def describe(results: Dict[str, Optional[str]]) -> str:
+    """The probe results as lines for the prompt"""
+    return '\n'.join(result for result in results.values() if result)
+
+def collect(settings: Dict[str, Any], cwd: Optional[Path] = None) -> str:
+    """Gather the working-directory context in one go, for callers with nothing to overlap it with"""
+    return describe(Collector(settings, cwd).start().wait())
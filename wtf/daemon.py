@@ -0,0 +1,262 @@
+from pathlib import Path
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import click
+from .config import Config, get_config
+from .translator import Translator
+from .worker import Worker
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger('wtf')
+
+CONNECT_TIMEOUT = 0.2
+
+# Details a generate call can ask for alongside the command
+REPORTS = ["timings", "usage", "route"]
+
+def get_socket_path() -> Path:
+    """Get path to the daemon's Unix socket"""
+    return Path.home() / '.config' / 'wtf' / 'daemon.sock'
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests; each reply is one JSON line"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                result = self.dispatch(request.pop('op'), request)
+                self.send({"result": result})
+            except Exception as e:
+                logger.exception("Daemon request failed")
+                message = e.format_message() if isinstance(e, click.ClickException) else str(e)
+                self.send({"error": message})
+
+    def send(self, message: dict):
+        self.wfile.write((json.dumps(message) + '\n').encode())
+        self.wfile.flush()
+
+    def dispatch(self, op: str, params: dict):
+        translator = self.server.translator()
+        if op == 'ping':
+            return os.getpid()
+        if op == 'cached':
+            return translator.cached(**params)
+        if op == 'generate':
+            on_token = (lambda token: self.send({"token": token})) if params.pop('stream', False) else None
+            # Timings and usage are sent as their own messages ahead of the result
+            reports = {name: {} for name in REPORTS if params.pop(name, False)}
+            try:
+                return translator.generate(on_token=on_token, **reports, **params)
+            finally:
+                for name, report in reports.items():
+                    self.send({name: report})
+        if op == 'record':
+            return self.server.worker.submit(params['job'])
+        if op == 'race':
+            command, info = translator.race(**params)
+            return [command, info]
+        if op == 'shutdown':
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return True
+        raise ValueError(f"Unknown daemon operation '{op}'")
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path):
+        super().__init__(str(socket_path), DaemonHandler)
+        os.chmod(socket_path, 0o600)
+        self._translator = None
+        self._lock = threading.Lock()
+        self.worker = Worker(get_config().config['worker']['queue_size']).start()
+
+    def server_close(self):
+        super().server_close()
+        # Finish every queued history write and clipboard copy before exiting
+        self.worker.stop()
+
+    def translator(self) -> Translator:
+        """Return the shared translator, rebuilding it when config.yaml changes"""
+        with self._lock:
+            config = get_config()
+            if self._translator is None or self._translator.config is not config:
+                self._translator = Translator(config)
+            return self._translator
+
+def serve(socket_path: Optional[Path] = None):
+    """Run the daemon in the foreground until it is told to stop"""
+    from .setup import ensure_directories, setup_logging
+
+    socket_path = socket_path or get_socket_path()
+    _, log_dir = ensure_directories()
+    setup_logging(log_dir, get_config().config.get('logging'))
+
+    # Only one daemon per socket; the lock is held for the daemon's lifetime
+    lock_fd = os.open(socket_path.with_suffix('.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise click.ClickException("wtf daemon is already running")
+
+    if socket_path.exists():
+        socket_path.unlink()
+    server = DaemonServer(socket_path)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    logger.info(f"Daemon listening on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+        os.close(lock_fd)
+        logger.info("Daemon stopped")
+
+def spawn(wait: float = 2.0) -> bool:
+    """Start a detached daemon and wait up to `wait` seconds for it to accept connections"""
+    subprocess.Popen(
+        [sys.executable, '-m', 'wtf.daemon'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        client = DaemonClient.connect()
+        if client:
+            client.close()
+            return True
+        time.sleep(0.05)
+    return False
+
+class DaemonClient:
+    """Talks to a running daemon; falls back to in-process translation if it goes away"""
+
+    def __init__(self, sock: socket.socket, fallback: Optional[Callable[[], Translator]] = None):
+        self.sock = sock
+        self.file = sock.makefile('rwb')
+        self.fallback = fallback
+        # Set once the daemon stopped answering and a call was translated in-process instead
+        self.fell_back = False
+
+    @classmethod
+    def connect(cls, socket_path: Optional[Path] = None,
+                fallback: Optional[Callable[[], Translator]] = None) -> Optional['DaemonClient']:
+        socket_path = socket_path or get_socket_path()
+        if not hasattr(socket, 'AF_UNIX') or not socket_path.exists():
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            sock.close()
+            return None
+        sock.settimeout(None)
+        return cls(sock, fallback)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def call(self, op: str, on_token: Optional[Callable[[str], None]] = None,
+             reports: Optional[Dict[str, Dict]] = None, **params):
+        reports = reports or {}
+        self.file.write((json.dumps({"op": op, **params, **{name: True for name in reports}}) + '\n').encode())
+        self.file.flush()
+        for line in self.file:
+            message = json.loads(line)
+            if 'token' in message:
+                if on_token:
+                    on_token(message['token'])
+                continue
+            report = next((name for name in REPORTS if name in message), None)
+            if report:
+                if report in reports:
+                    reports[report].update(message[report])
+                continue
+            if 'error' in message:
+                raise click.ClickException(message['error'])
+            return message['result']
+        raise ConnectionError("wtf daemon closed the connection")
+
+    def _call_or_fallback(self, method: str, on_token=None, reports=None, **params):
+        if not self.fell_back:
+            try:
+                return self.call(method, on_token=on_token, reports=reports, **params)
+            except (OSError, ConnectionError, ValueError) as e:
+                if not self.fallback:
+                    raise
+                logger.warning(f"Daemon unavailable ({e}); translating in-process")
+                self.fell_back = True
+        params.pop('stream', None)
+        if on_token:
+            params['on_token'] = on_token
+        params.update(reports or {})
+        return getattr(self.fallback(), method)(**params)
+
+    def record(self, job: Dict[str, Any]) -> bool:
+        """Queue post-response bookkeeping on the daemon, doing it locally if the daemon's queue is full"""
+        if not self._call_or_fallback('record', job=job):
+            from . import worker
+            worker.submit(job)
+        return True
+
+    def cached(self, prompt: str, provider: str, model: str, shell: str,
+               context: Optional[str] = None) -> Optional[str]:
+        params = dict(prompt=prompt, provider=provider, model=model, shell=shell)
+        if context:
+            params['context'] = context
+        return self._call_or_fallback('cached', **params)
+
+    def generate(self, prompt: str, provider: str, model: str, shell: str, use_cache: bool = True,
+                 on_token: Optional[Callable[[str], None]] = None,
+                 environment: Optional[Dict[str, Any]] = None,
+                 timings: Optional[Dict[str, float]] = None,
+                 usage: Optional[Dict[str, int]] = None,
+                 route: Optional[Dict[str, Any]] = None) -> str:
+        params = dict(prompt=prompt, provider=provider, model=model, shell=shell, use_cache=use_cache,
+                      environment=environment)
+        if on_token:
+            params['stream'] = True
+        reports = {name: report for name, report in (("timings", timings), ("usage", usage), ("route", route))
+                   if report is not None}
+        return self._call_or_fallback('generate', on_token=on_token, reports=reports, **params)
+
+    def race(self, prompt: str, targets: List[Tuple[str, str]], shell: str, hedge_delay: Optional[float] = None,
+             use_cache: bool = True, environment: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+        result = self._call_or_fallback('race', prompt=prompt, targets=targets, shell=shell,
+                                        hedge_delay=hedge_delay, use_cache=use_cache, environment=environment)
+        return tuple(result)
+
+def connect(config: Config) -> Union[DaemonClient, Translator]:
+    """Use the daemon when one is running, otherwise translate in-process"""
+    client = DaemonClient.connect(fallback=lambda: Translator(config))
+    if client:
+        return client
+    if config.config['daemon']['auto_spawn']:
+        # Start one for the next invocation; this one doesn't wait for it
+        spawn(wait=0)
+    return Translator(config)
+
+if __name__ == '__main__':
+    try:
+        serve()
+    except click.ClickException as e:
+        e.show()
+        sys.exit(e.exit_code)
@@ -0,0 +1,138 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from typing import Any, Dict, Optional
+from .storage import atomic_file
+
+# Re-probe at least this often even if nothing in the cache key changed
+PROBE_TTL = 24 * 3600
+
+# Tools worth telling the model about when they are on PATH
+TOOLS = [
+    "git", "docker", "podman", "kubectl", "rg", "fd", "fzf", "jq", "yq", "curl", "wget",
+    "python3", "node", "brew", "apt", "dnf", "pacman", "gsed", "gawk", "gfind", "systemctl"
+]
+
+COREUTILS = {"gnu": "GNU", "bsd": "BSD", "busybox": "BusyBox"}
+
+_probed: Optional[Dict[str, Any]] = None
+
+def get_cache_file() -> Path:
+    """Get path to the environment probe cache"""
+    return Path.home() / '.config' / 'wtf' / 'environment.json'
+
+def _detect_shell_path() -> str:
+    # First try getting it from SHELL env var
+    shell = os.environ.get('SHELL', '')
+    if shell:
+        return shell
+
+    # Try getting the parent process name
+    try:
+        shell = subprocess.check_output(['ps', '-p', str(os.getppid()), '-o', 'comm=']).decode().strip()
+        if shell:
+            return shell.lstrip('-')
+    except Exception:
+        pass
+
+    # Fallback detection methods
+    if platform.system() == 'Windows':
+        # Check if we're in PowerShell
+        if 'POWERSHELL_VERSION' in os.environ:
+            return 'powershell'
+        return 'cmd'
+
+    # Default to zsh for Unix-like systems
+    return 'zsh'
+
+def _shell_version(shell_path: str) -> Optional[str]:
+    name = os.path.basename(shell_path)
+    if name not in ('bash', 'zsh', 'fish', 'ksh', 'tcsh'):
+        return None
+    try:
+        output = subprocess.run(
+            [shell_path, '--version'], capture_output=True, text=True, timeout=1
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    for word in output.replace(',', ' ').split():
+        if word[:1].isdigit():
+            return word.split('(')[0]
+    return None
+
+def _coreutils(system: str) -> str:
+    if system == 'Darwin' or system.endswith('BSD'):
+        return 'bsd'
+    ls = shutil.which('ls')
+    if ls and os.path.basename(os.path.realpath(ls)) == 'busybox':
+        return 'busybox'
+    return 'gnu' if system == 'Linux' else 'unknown'
+
+def _cache_key() -> str:
+    # Without $SHELL the answer comes from the parent process, so it is per session
+    parts = [
+        os.environ.get('SHELL') or f"ppid:{os.getppid()}",
+        os.environ.get('PATH', ''),
+        platform.system(),
+        platform.release()
+    ]
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()[:16]
+
+def _probe() -> Dict[str, Any]:
+    shell_path = _detect_shell_path()
+    system = platform.system()
+    return {
+        "shell": os.path.basename(shell_path),
+        "shell_version": _shell_version(shell_path),
+        "os": system,
+        "os_release": platform.release(),
+        "coreutils": _coreutils(system),
+        "tools": [tool for tool in TOOLS if shutil.which(tool)],
+        "probed_at": time.time()
+    }
+
+def probe() -> Dict[str, Any]:
+    """Shell, OS and tool facts, probed once and cached on disk per shell/PATH"""
+    global _probed
+    key = _cache_key()
+    if _probed is not None and _probed['key'] == key:
+        return _probed
+
+    cache_file = get_cache_file()
+    try:
+        cache = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        cache = {}
+
+    now = time.time()
+    environment = cache.get(key)
+    if not environment or now - environment.get('probed_at', 0) > PROBE_TTL:
+        environment = _probe()
+        cache = {k: v for k, v in cache.items() if now - v.get('probed_at', 0) <= PROBE_TTL}
+        cache[key] = environment
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_file(cache_file, 'w', sync=False) as f:
+                f.write(json.dumps(cache))
+        except OSError:
+            pass
+
+    _probed = {**environment, "key": key}
+    return _probed
+
+def describe(environment: Dict[str, Any]) -> str:
+    """One-line summary of the environment for the prompt"""
+    shell = environment['shell']
+    if environment.get('shell_version'):
+        shell = f"{shell} {environment['shell_version']}"
+    parts = [f"{shell} on {environment['os']} {environment.get('os_release', '')}".rstrip()]
+    if environment.get('coreutils') in COREUTILS:
+        parts.append(f"{COREUTILS[environment['coreutils']]} coreutils")
+    if environment.get('tools'):
+        parts.append(f"available tools: {', '.join(environment['tools'])}")
+    return "; ".join(parts)
@@ -0,0 +1,142 @@
+"""Run generated commands and measure them: exit status, wall time and the child's resource usage"""
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from .history import percentile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Shells that take the command with -c; anything else gets the platform default
+POSIX_SHELLS = {"sh", "bash", "zsh", "dash", "ksh", "fish"}
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+def _popen(command: str, shell: Optional[str]) -> subprocess.Popen:
+    """Start command in the shell it was generated for, sharing our terminal so output streams as it comes"""
+    path = shutil.which(shell) if shell in POSIX_SHELLS else None
+    if path:
+        return subprocess.Popen([path, '-c', command])
+    return subprocess.Popen(command, shell=True)
+
+def _usage(rusage) -> Dict[str, Any]:
+    return {
+        "user_time": round(rusage.ru_utime, 4),
+        "system_time": round(rusage.ru_stime, 4),
+        "max_rss": rusage.ru_maxrss * MAXRSS_UNIT,
+        "read_blocks": rusage.ru_inblock,
+        "write_blocks": rusage.ru_oublock,
+    }
+
+def run(command: str, shell: Optional[str] = None) -> Dict[str, Any]:
+    """Run command and return its exit code, duration and resource usage, for history metadata.
+
+    Like os.system, wtf ignores Ctrl-C and Ctrl-\\ while the command runs, so the
+    command is interrupted but wtf is still around to record how it ended. A
+    command killed by a signal has the negative signal number as its exit code.
+    """
+    start = time.perf_counter()
+    # Start the command before ignoring anything: ignored signals stay ignored across exec
+    process = _popen(command, shell)
+    ignored = {}
+    for name in ('SIGINT', 'SIGQUIT'):
+        if hasattr(signal, name):
+            try:
+                ignored[name] = signal.signal(getattr(signal, name), signal.SIG_IGN)
+            except ValueError:  # Not the main thread
+                pass
+    try:
+        if hasattr(os, 'wait4'):
+            # Usage of this child alone, unlike getrusage(RUSAGE_CHILDREN) which adds up every child reaped
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        else:
+            process.wait()
+            rusage = None
+    finally:
+        for name, handler in ignored.items():
+            signal.signal(getattr(signal, name), handler)
+    duration = time.perf_counter() - start
+
+    result = {"exit_code": process.returncode, "duration": round(duration, 4)}
+    if rusage is not None:
+        result.update(_usage(rusage))
+    logger.info(f"Command exited with {process.returncode} after {duration:.2f}s")
+    return result
+
+def summarize(entries: Iterable[Dict], top: int = 10) -> List[Dict]:
+    """Aggregate executed commands, slowest first by p95 duration"""
+    groups: Dict[str, List[Dict]] = {}
+    for entry in entries:
+        execution = entry.get('metadata', {}).get('execution')
+        if execution:
+            groups.setdefault(entry['command'], []).append(execution)
+
+    rows = []
+    for command, runs in groups.items():
+        durations = [run['duration'] for run in runs]
+        cpu = [run['user_time'] + run['system_time'] for run in runs if 'user_time' in run]
+        rss = [run['max_rss'] for run in runs if 'max_rss' in run]
+        rows.append({
+            "command": command,
+            "runs": len(runs),
+            "failures": sum(1 for run in runs if run['exit_code'] != 0),
+            "last_exit_code": runs[0]['exit_code'],
+            "duration": {p: percentile(durations, p) for p in (50, 95)},
+            "cpu": percentile(cpu, 50) if cpu else None,
+            "max_rss": max(rss) if rss else None,
+            "io_blocks": sum(run.get('read_blocks', 0) + run.get('write_blocks', 0) for run in runs) / len(runs),
+        })
+    rows.sort(key=lambda row: row['duration'][95], reverse=True)
+    return rows[:top]
+
+def format_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024 or unit == "GiB":
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+
+def show(rows: List[Dict], console=None):
+    """Display execution aggregates in a rich table"""
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+
+    if not rows:
+        return
+    console = console or Console()
+    table = Table(box=box.ROUNDED, title="Executed Commands (slowest first)")
+    table.add_column("Command", style="yellow")
+    table.add_column("Runs", justify="right")
+    table.add_column("Failed", style="red", justify="right")
+    table.add_column("Last exit", justify="right")
+    table.add_column("p50", style="cyan", justify="right")
+    table.add_column("p95", style="cyan", justify="right")
+    table.add_column("CPU p50", justify="right")
+    table.add_column("Max RSS", justify="right")
+    table.add_column("I/O blocks", justify="right")
+    for row in rows:
+        table.add_row(
+            row['command'],
+            str(row['runs']),
+            str(row['failures']),
+            str(row['last_exit_code']),
+            f"{row['duration'][50]:.2f}s",
+            f"{row['duration'][95]:.2f}s",
+            f"{row['cpu']:.2f}s" if row['cpu'] is not None else "-",
+            format_bytes(row['max_rss']),
+            f"{row['io_blocks']:.0f}",
+        )
+    console.print(table)
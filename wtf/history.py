@@ -1,44 +1,716 @@
 from pathlib import Path
+import gzip
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
-from rich.console import Console
-from rich.table import Table
-from rich import box
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
+import click
+from .config import get_config
+from .similar import PromptIndex, get_index_file
+from .storage import ANY_VERSION, VersionConflict, atomic_file, file_lock, reverse_lines, version
+
+logger = logging.getLogger(__name__)
+
+# Entries returned by History.load()
+MAX_ENTRIES = 1000
+# Compaction is considered each time the log grows across one of these boundaries
+COMPACT_EVERY_BYTES = 64 * 1024
+COMPACT_EVERY_ROWS = 1000
+# Automatic compaction waits until a limit is exceeded by this much, so it runs now and then
+HEADROOM = 1.1
+AGE_HEADROOM = timedelta(days=1)
+# Archive segment names embed the time span they cover
+SEGMENT_TIME = '%Y%m%dT%H%M%S%f'
+# Entries are stamped when a command finishes but appended later by a background worker, so
+# concurrent commands can land slightly out of order; scans keep going this far past a boundary
+ORDER_SLACK = timedelta(minutes=10)
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO date/time or a relative age such as 30m, 12h, 7d or 2w"""
+    match = re.fullmatch(r'(\d+)([smhdw])', value.strip())
+    if match:
+        unit = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}[match.group(2)]
+        return datetime.now() - timedelta(**{unit: int(match.group(1))})
+    return datetime.fromisoformat(value)
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+def _field(value) -> str:
+    """Keep a value on one line and free of tabs"""
+    return ' '.join(str(value).split())
+
+def format_line(entry: Dict, output: str = 'tsv') -> str:
+    """One history entry as a line for grep or fzf.
+
+    tsv:   timestamp, ok/failed, provider, model, latency, prompt, command
+    plain: command  # prompt
+    """
+    if output == 'plain':
+        return f"{_field(entry['command'])}  # {_field(entry['prompt'])}"
+    metadata = entry.get('metadata', {})
+    latency = metadata.get('latency')
+    return '\t'.join([
+        entry['timestamp'],
+        'ok' if entry.get('success', True) else 'failed',
+        _field(metadata.get('provider') or '-'),
+        _field(metadata.get('model') or '-'),
+        f"{latency:.2f}" if isinstance(latency, (int, float)) else '-',
+        _field(entry['prompt']),
+        _field(entry['command']),
+    ])
+
+def filter_entries(entries: Iterable[Dict], text: Optional[str] = None, provider: Optional[str] = None,
+                   model: Optional[str] = None, success: Optional[bool] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None) -> Iterator[Dict]:
+    """Matching entries from a newest-first stream, stopping once they are ORDER_SLACK older than since"""
+    terms = text.lower().split() if text else []
+    for entry in entries:
+        metadata = entry.get('metadata', {})
+        if provider and metadata.get('provider') != provider:
+            continue
+        if model and metadata.get('model') != model:
+            continue
+        if success is not None and entry.get('success', True) != success:
+            continue
+        if since or until:
+            when = datetime.fromisoformat(entry['timestamp'])
+            if since and when < since:
+                # Entries are appended in nearly time order; everything further back is older
+                if when < since - ORDER_SLACK:
+                    return
+                continue
+            if until and when > until:
+                continue
+        if terms:
+            haystack = f"{entry['prompt']} {entry['command']}".lower()
+            if not all(term in haystack for term in terms):
+                continue
+        yield entry
+
+class Retention:
+    """How much history to keep: the newest max_entries, nothing older than max_age, at most max_bytes"""
+
+    def __init__(self, max_entries: Optional[int] = None, max_age: Optional[str] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_entries = max_entries or 0
+        self.max_age = max_age or None
+        self.max_bytes = max_bytes or 0
+        if self.max_age:
+            try:
+                parse_time(self.max_age)
+            except ValueError:
+                raise click.ClickException(f"Invalid history.max_age '{self.max_age}', expected e.g. 365d")
+
+    @classmethod
+    def from_config(cls, settings: Dict) -> 'Retention':
+        return cls(settings.get('max_entries'), settings.get('max_age'), settings.get('max_bytes'))
+
+    def cutoff(self) -> Optional[datetime]:
+        return parse_time(self.max_age) if self.max_age else None
+
+    def exceeded(self, count: int, size: int, oldest: Optional[str]) -> bool:
+        """Whether a store has outgrown the policy by enough to be worth compacting"""
+        cutoff = self.cutoff()
+        return bool(
+            (self.max_entries and count > self.max_entries * HEADROOM)
+            or (self.max_bytes and size > self.max_bytes * HEADROOM)
+            or (cutoff and oldest and datetime.fromisoformat(oldest) < cutoff - AGE_HEADROOM)
+        )
+
+    def evictions(self, records: List[Tuple[str, int]]) -> int:
+        """How many of the oldest (timestamp, size) records to drop so the rest fit the policy"""
+        count = max(0, len(records) - self.max_entries) if self.max_entries else 0
+        cutoff = self.cutoff()
+        if cutoff:
+            while count < len(records) and datetime.fromisoformat(records[count][0]) < cutoff:
+                count += 1
+        if self.max_bytes:
+            size = sum(record_size for _, record_size in records[count:])
+            while count < len(records) and size > self.max_bytes:
+                size -= records[count][1]
+                count += 1
+        return count
+
+class Archive:
+    """Entries evicted by compaction, kept as gzip-compressed JSONL segments"""
+
+    def __init__(self, history_dir: Path):
+        self.path = history_dir / 'archive'
+
+    def segments(self) -> List[Path]:
+        """Segment files, newest first"""
+        if not self.path.is_dir():
+            return []
+        return sorted(self.path.glob('history-*.jsonl.gz'), reverse=True)
+
+    def span(self, segment: Path) -> Tuple[datetime, datetime]:
+        """Timestamps of the oldest and newest entry in a segment, from its name"""
+        first, last = segment.name[len('history-'):-len('.jsonl.gz')].split('-')
+        return datetime.strptime(first, SEGMENT_TIME), datetime.strptime(last, SEGMENT_TIME)
+
+    def add(self, entries: List[Dict]) -> Path:
+        """Write entries (oldest first) to a new segment"""
+        first, last = (datetime.fromisoformat(entries[i]['timestamp']).strftime(SEGMENT_TIME) for i in (0, -1))
+        self.path.mkdir(parents=True, exist_ok=True)
+        segment = self.path / f'history-{first}-{last}.jsonl.gz'
+        with atomic_file(segment) as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as archive:
+                for entry in entries:
+                    archive.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+        return segment
+
+    def newest_first(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[Dict]:
+        """Archived entries from newest to oldest, skipping segments outside [since, until]"""
+        for segment in self.segments():
+            first, last = self.span(segment)
+            if since and last < since - ORDER_SLACK:
+                return
+            if until and first > until + ORDER_SLACK:
+                continue
+            with gzip.open(segment, 'rt') as f:
+                lines = f.readlines()
+            for line in reversed(lines):
+                if line.strip():
+                    yield json.loads(line)
+
+class JsonlStore:
+    """Append-only log with one JSON record per line"""
+
+    def __init__(self, history_dir: Path):
+        self.path = history_dir / 'history.jsonl'
+        self.legacy_file = history_dir / 'history.json'
+        self.lock_file = history_dir / 'history.lock'
+        if self.legacy_file.exists():
+            self._migrate()
+
+    def _lock(self, exclusive: bool = False):
+        """Hold an advisory lock; appends share it, rewrites take it exclusively"""
+        return file_lock(self.lock_file, exclusive)
+
+    def version(self) -> Any:
+        """Changes whenever the log is appended to or rewritten"""
+        return version(self.path)
+
+    def append(self, entry: Dict):
+        self.append_many([entry])
+
+    def append_many(self, entries: List[Dict]) -> bool:
+        """Append entries; True when the log has grown enough that compaction should be considered"""
+        data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode()
+
+        # A single O_APPEND write keeps concurrent writers from clobbering each other
+        with self._lock():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+
+        return (size - len(data)) // COMPACT_EVERY_BYTES != size // COMPACT_EVERY_BYTES
+
+    def read(self, limit: Optional[int] = None) -> List[Dict]:
+        if limit:
+            entries = list(islice(self.newest_first(), limit))
+            entries.reverse()
+            return entries
+        if not self.path.exists():
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def newest_first(self) -> Iterator[Dict]:
+        """Entries from the end of the log backwards, reading only as many blocks as are consumed"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb') as f:
+            for line in reverse_lines(f):
+                if line.strip():
+                    yield json.loads(line)
+
+    def oldest(self) -> Optional[str]:
+        """Timestamp of the first entry in the log"""
+        if not self.path.exists():
+            return None
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    return json.loads(line)['timestamp']
+        return None
+
+    def write(self, history: List[Dict], expected: Any = ANY_VERSION):
+        """Replace the whole log with the given entries, unless it changed since version() was expected"""
+        with self._lock(exclusive=True):
+            if expected is not ANY_VERSION and self.version() != expected:
+                raise VersionConflict(self.path)
+            self._write(history)
+
+    def compact(self, retention: Retention, archive: Optional[Archive] = None, force: bool = False) -> int:
+        """Drop (and optionally archive) the oldest entries beyond the retention policy; returns how many"""
+        if not self.path.exists():
+            return 0
+        if not force and not retention.exceeded(*self._estimate(retention)):
+            return 0
+        # Parse a snapshot without the lock so appends carry on meanwhile
+        with open(self.path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            data = f.read()
+        entries, records, ends, position = [], [], [], 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            position += len(line)
+            if line.strip():
+                entry = json.loads(line)
+                entries.append(entry)
+                records.append((entry['timestamp'], len(line)))
+                ends.append(position)
+        oldest = entries[0]['timestamp'] if entries else None
+        if not force and not retention.exceeded(len(entries), position, oldest):
+            return 0
+        evict = retention.evictions(records)
+        if not evict:
+            return 0
+
+        segment = archive.add(entries[:evict]) if archive else None
+        # Only the byte copy of what's kept, plus anything appended since the snapshot, blocks writers
+        with self._lock(exclusive=True):
+            if not self.path.exists() or os.stat(self.path).st_ino != inode:
+                # Rewritten by someone else meanwhile; start over next time
+                if segment:
+                    segment.unlink()
+                return 0
+            with open(self.path, 'rb') as source, atomic_file(self.path) as dest:
+                source.seek(ends[evict - 1])
+                shutil.copyfileobj(source, dest)
+        return evict
+
+    def _estimate(self, retention: Retention) -> Tuple[int, int, Optional[str]]:
+        """Upper bounds on the entry count and size, and the first timestamp, without parsing the log.
+
+        Lines are only counted when the policy limits entries.
+        """
+        size = os.path.getsize(self.path)
+        count = 0
+        if retention.max_entries:
+            with open(self.path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    count += block.count(b'\n')
+        return count, size, self.oldest()
+
+    def search(self, text: Optional[str] = None, provider: Optional[str] = None, model: Optional[str] = None,
+               success: Optional[bool] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               limit: Optional[int] = 20, offset: int = 0) -> List[Dict]:
+        """Return the newest matching entries first"""
+        return list(self.iter_search(text, provider, model, success, since, until, limit, offset))
+
+    def iter_search(self, text: Optional[str] = None, provider: Optional[str] = None, model: Optional[str] = None,
+                    success: Optional[bool] = None, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, limit: Optional[int] = None,
+                    offset: int = 0) -> Iterator[Dict]:
+        """Yield matching entries newest first, scanning the log backwards only as far as needed"""
+        entries = filter_entries(self.newest_first(), text, provider, model, success, since, until)
+        yield from islice(entries, offset, offset + limit if limit else None)
+
+    def _write(self, history: List[Dict]):
+        with atomic_file(self.path, 'w') as f:
+            for entry in history:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+    def _migrate(self):
+        """Convert a legacy history.json array into the append-only log"""
+        with self._lock(exclusive=True):
+            if not self.legacy_file.exists():
+                return
+            try:
+                legacy = json.loads(self.legacy_file.read_text())
+            except ValueError:
+                legacy = []
+            self._write(legacy + self.read())
+            self.legacy_file.rename(self.legacy_file.with_suffix('.json.bak'))
+
+class SqliteStore:
+    """SQLite database with indexed columns and an FTS5 index over prompts and commands"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            command TEXT NOT NULL,
+            success INTEGER NOT NULL,
+            provider TEXT,
+            model TEXT,
+            metadata TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+        CREATE INDEX IF NOT EXISTS history_provider ON history (provider, timestamp);
+        CREATE INDEX IF NOT EXISTS history_model ON history (model, timestamp);
+    """
+
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            prompt, command, content='history', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, prompt, command) VALUES (new.id, new.prompt, new.command);
+        END;
+        CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+            INSERT INTO history_fts (history_fts, rowid, prompt, command)
+            VALUES ('delete', old.id, old.prompt, old.command);
+        END;
+    """
+
+    def __init__(self, history_dir: Path):
+        self.path = history_dir / 'history.db'
+        is_new = not self.path.exists()
+        self.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        try:
+            self.conn.executescript(self.FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; fall back to LIKE scans
+            self.fts = False
+        legacy = [history_dir / 'history.jsonl', history_dir / 'history.json']
+        if is_new and any(path.exists() for path in legacy):
+            self.write(JsonlStore(history_dir).read())
+
+    def close(self):
+        self.conn.close()
+
+    def _row(self, entry: Dict) -> tuple:
+        metadata = entry.get('metadata') or {}
+        return (
+            entry['timestamp'], entry['prompt'], entry['command'], int(entry.get('success', True)),
+            metadata.get('provider'), metadata.get('model'), json.dumps(metadata)
+        )
+
+    def _entry(self, row: sqlite3.Row) -> Dict:
+        return {
+            "timestamp": row['timestamp'],
+            "prompt": row['prompt'],
+            "command": row['command'],
+            "success": bool(row['success']),
+            "metadata": json.loads(row['metadata'])
+        }
+
+    def append(self, entry: Dict):
+        self.append_many([entry])
+
+    def append_many(self, entries: List[Dict]) -> bool:
+        """Insert entries; True when the table has grown enough that compaction should be considered"""
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.executemany(
+                'INSERT INTO history (timestamp, prompt, command, success, provider, model, metadata) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [self._row(entry) for entry in entries]
+            )
+            last = self.conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return (last - len(entries)) // COMPACT_EVERY_ROWS != last // COMPACT_EVERY_ROWS
+
+    def read(self, limit: Optional[int] = None) -> List[Dict]:
+        rows = self.conn.execute(
+            'SELECT * FROM (SELECT * FROM history ORDER BY id DESC LIMIT ?) ORDER BY id',
+            (limit or -1,)
+        )
+        return [self._entry(row) for row in rows]
+
+    def version(self) -> Any:
+        """Changes whenever rows are added or removed"""
+        return tuple(self.conn.execute('SELECT count(*), coalesce(max(id), 0) FROM history').fetchone())
+
+    def oldest(self) -> Optional[str]:
+        """Timestamp of the oldest row"""
+        return self.conn.execute('SELECT min(timestamp) FROM history').fetchone()[0]
+
+    def write(self, history: List[Dict], expected: Any = ANY_VERSION):
+        """Replace the whole table with the given entries, unless it changed since version() was expected"""
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if expected is not ANY_VERSION and self.version() != expected:
+                raise VersionConflict(self.path)
+            self.conn.execute('DELETE FROM history')
+            self.conn.executemany(
+                'INSERT INTO history (timestamp, prompt, command, success, provider, model, metadata) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [self._row(entry) for entry in history]
+            )
+
+    def compact(self, retention: Retention, archive: Optional[Archive] = None, force: bool = False) -> int:
+        """Delete (and optionally archive) the oldest rows beyond the retention policy; returns how many"""
+        size = 'length(prompt) + length(command) + length(metadata)'
+        count, total, oldest = self.conn.execute(
+            f'SELECT count(*), coalesce(sum({size}), 0), min(timestamp) FROM history'
+        ).fetchone()
+        if not force and not retention.exceeded(count, total, oldest):
+            return 0
+        records = self.conn.execute(f'SELECT id, timestamp, {size} FROM history ORDER BY id').fetchall()
+        evict = retention.evictions([(timestamp, record_size) for _, timestamp, record_size in records])
+        if not evict:
+            return 0
+
+        last_id = records[evict - 1][0]
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if archive:
+                rows = self.conn.execute('SELECT * FROM history WHERE id <= ? ORDER BY id', (last_id,))
+                archive.add([self._entry(row) for row in rows])
+            self.conn.execute('DELETE FROM history WHERE id <= ?', (last_id,))
+        return evict
+
+    def search(self, text: Optional[str] = None, provider: Optional[str] = None, model: Optional[str] = None,
+               success: Optional[bool] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               limit: Optional[int] = 20, offset: int = 0) -> List[Dict]:
+        """Return the newest matching entries first using the indexes"""
+        return list(self.iter_search(text, provider, model, success, since, until, limit, offset))
+
+    def iter_search(self, text: Optional[str] = None, provider: Optional[str] = None, model: Optional[str] = None,
+                    success: Optional[bool] = None, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, limit: Optional[int] = None,
+                    offset: int = 0) -> Iterator[Dict]:
+        """Yield matching entries newest first, fetching rows from the cursor as they are consumed"""
+        clauses, params = [], []
+        source, order = 'history', 'history.timestamp DESC, history.id DESC'
+        if text and self.fts:
+            # Walking the FTS index in rowid order lets LIMIT stop early on broad matches
+            source, order = 'history_fts JOIN history ON history.id = history_fts.rowid', 'history_fts.rowid DESC'
+            clauses.append('history_fts MATCH ?')
+            # Quote each term so user input can't inject FTS syntax; match as prefixes
+            params.append(' '.join('"{}"*'.format(term.replace('"', '""')) for term in text.split()))
+        elif text:
+            for term in text.split():
+                clauses.append("(history.prompt LIKE ? OR history.command LIKE ?)")
+                params.extend([f'%{term}%'] * 2)
+        if provider:
+            clauses.append('history.provider = ?')
+            params.append(provider)
+        if model:
+            clauses.append('history.model = ?')
+            params.append(model)
+        if success is not None:
+            clauses.append('history.success = ?')
+            params.append(int(success))
+        if since:
+            clauses.append('history.timestamp >= ?')
+            params.append(since.isoformat())
+        if until:
+            clauses.append('history.timestamp <= ?')
+            params.append(until.isoformat())
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self.conn.execute(
+            f'SELECT history.* FROM {source} {where} ORDER BY {order} LIMIT ? OFFSET ?',
+            (*params, limit or -1, offset)
+        )
+        for row in rows:
+            yield self._entry(row)
+
+BACKENDS = {
+    "jsonl": JsonlStore,
+    "sqlite": SqliteStore
+}
+
+def compact_in_background():
+    """Check the retention policy in a detached process so the current command doesn't wait for it"""
+    try:
+        subprocess.Popen(
+            [sys.executable, '-m', 'wtf.history'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+    except OSError as e:
+        logger.debug(f"Failed to start history compaction: {e}")
 
 class History:
-    def __init__(self):
-        self.history_file = Path.home() / '.config' / 'wtf' / 'history.json'
-        self.history_file.parent.mkdir(parents=True, exist_ok=True)
-        self.console = Console()
-        
+    def __init__(self, backend: Optional[str] = None):
+        self.history_dir = Path.home() / '.config' / 'wtf'
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        config = get_config().config
+        backend = backend or config['history']['backend']
+        store_class = BACKENDS.get(backend)
+        if not store_class:
+            available = ", ".join(BACKENDS.keys())
+            raise click.ClickException(f"Unknown history backend '{backend}'. Available backends: {available}")
+        self.store = store_class(self.history_dir)
+        self.history_file = self.store.path
+        settings = config['history']
+        self.retention = Retention.from_config(settings)
+        self.archive = Archive(self.history_dir)
+        self.archive_evicted = settings['archive']
+        self.auto_compact = settings['auto_compact']
+        self.index_enabled = config['similar']['enabled']
+        self._console = None
+
+    @property
+    def console(self):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
+
     def add(self, prompt: str, command: str, success: bool = True, metadata: Optional[Dict] = None):
         """Add a command to history with metadata"""
-        history = self.load()
-        history.append({
-            "timestamp": datetime.now().isoformat(),
-            "prompt": prompt,
-            "command": command,
-            "success": success,
-            "metadata": metadata or {}
-        })
-        self.save(history[-1000:])  # Keep last 1000 commands
-        
+        self.add_many([{"prompt": prompt, "command": command, "success": success, "metadata": metadata}])
+
+    def add_many(self, entries: List[Dict]):
+        """Add several entries (prompt, command, success, metadata) in one write"""
+        timestamp = datetime.now().isoformat()
+        entries = [
+            {
+                "timestamp": entry.get('timestamp', timestamp),
+                "prompt": entry['prompt'],
+                "command": entry['command'],
+                "success": entry.get('success', True),
+                "metadata": entry.get('metadata') or {}
+            }
+            for entry in entries
+        ]
+        if not entries:
+            return
+        if self.store.append_many(entries) and self.auto_compact:
+            compact_in_background()
+        if self.index_enabled and any(entry['success'] and entry['command'] for entry in entries):
+            try:
+                with self.index() as index:
+                    index.add_entries(entries)
+            except sqlite3.Error as e:
+                logger.debug(f"Failed to update prompt index: {e}")
+
+    def index(self) -> PromptIndex:
+        """Open the similar-prompt index, seeding a new one from existing history; close it when done"""
+        index = PromptIndex()
+        if index.is_new:
+            try:
+                index.add_entries(self.store.read())
+            except sqlite3.Error:
+                index.close()
+                raise
+        return index
+
+    def _sync_index(self, entries: Optional[List[Dict]] = None):
+        """Drop indexed prompts that are no longer in history: all but entries if given, else evicted ones"""
+        if not get_index_file().exists():
+            return
+        try:
+            with self.index() as index:
+                if entries is not None:
+                    index.add_entries(entries, replace=True)
+                    return
+                oldest = self.store.oldest()
+                if oldest is None:
+                    index.add_entries([], replace=True)
+                else:
+                    # Entries can be stamped slightly out of order; keep the prompts of any that might remain
+                    index.prune((datetime.fromisoformat(oldest) - ORDER_SLACK).isoformat())
+        except sqlite3.Error as e:
+            logger.debug(f"Failed to update prompt index: {e}")
+
     def load(self) -> List[Dict]:
-        if self.history_file.exists():
-            return json.loads(self.history_file.read_text())
-        return []
-        
-    def save(self, history: List[Dict]):
-        self.history_file.write_text(json.dumps(history, indent=2))
+        return self.store.read(limit=MAX_ENTRIES)
+
+    def version(self) -> Any:
+        """Pass to save() to refuse overwriting entries added since"""
+        return self.store.version()
+
+    def save(self, history: List[Dict], expected: Any = ANY_VERSION):
+        self.store.write(history, expected)
+        self._sync_index(history)
+
+    def _compacting(self):
+        """Yield whether this process may compact; only one compaction runs at a time"""
+        return file_lock(self.history_dir / 'history.compact.lock', blocking=False)
+
+    def compact(self, force: bool = True) -> int:
+        """Apply the retention policy, archiving evicted entries if enabled; returns how many were evicted.
+
+        Without force, nothing happens until a limit is exceeded by HEADROOM.
+        """
+        with self._compacting() as allowed:
+            if not allowed:
+                logger.debug("History compaction already running")
+                return 0
+            archive = self.archive if self.archive_evicted else None
+            evicted = self.store.compact(self.retention, archive, force)
+        if evicted:
+            logger.info(f"History compacted: {evicted} entries {'archived' if archive else 'dropped'}")
+            self._sync_index()
+        return evicted
+
+    def search(self, limit: Optional[int] = 20, **filters) -> List[Dict]:
+        """Find entries by text, provider, model, outcome or date range, newest first"""
+        return list(self.iter_search(limit=limit, **filters))
+
+    def latency_percentile(self, provider: str, model: str, p: float, samples: int = 200) -> Optional[float]:
+        """Latency percentile of recent provider calls, or None without enough samples"""
+        latencies = [
+            entry['metadata']['latency']
+            for entry in self.search(provider=provider, model=model, success=True, limit=samples)
+            if 'latency' in entry['metadata'] and not entry['metadata'].get('cache_hit')
+        ]
+        if len(latencies) < 20:
+            return None
+        return percentile(latencies, p)
 
-    def show(self, limit: int = 10):
-        """Display history in a rich table"""
-        history = self.load()
+    def iter_search(self, limit: Optional[int] = None, offset: int = 0, **filters) -> Iterator[Dict]:
+        """Like search, but yields entries lazily, continuing into archived segments; no limit by default"""
+        if not self.archive.segments():
+            return self.store.iter_search(limit=limit, offset=offset, **filters)
+        archived = filter_entries(self.archive.newest_first(filters.get('since'), filters.get('until')), **filters)
+        entries = chain(self.store.iter_search(**filters), archived)
+        return islice(entries, offset, offset + limit if limit else None)
+
+    def show(self, limit: Optional[int] = 10, offset: int = 0, output: str = 'table', **filters):
+        """Display history as a rich table, or stream it as plain or tab-separated lines"""
+        entries = self.iter_search(limit=limit or None, offset=offset, **filters)
+        if output == 'table':
+            self.console.print(self._table(entries))
+            return
+        for entry in entries:
+            click.echo(format_line(entry, output))
+
+    def page(self, page_size: int = 10, offset: int = 0, **filters):
+        """Interactive pager that fetches one page of entries at a time"""
+        while True:
+            # One extra row tells us whether there is a next page
+            entries = self.search(limit=page_size + 1, offset=offset, **filters)
+            more = len(entries) > page_size
+            self.console.clear()
+            self.console.print(self._table(entries[:page_size],
+                                           f"Command History ({offset + 1}-{offset + len(entries[:page_size])})"))
+            keys = ["[b]n[/]ext" if more else None, "[b]p[/]revious" if offset else None, "[b]q[/]uit"]
+            self.console.print("  ".join(key for key in keys if key), style="dim")
+            key = click.getchar()
+            if key in ('n', ' ', 'j') and more:
+                offset += page_size
+            elif key in ('p', 'b', 'k') and offset:
+                offset = max(0, offset - page_size)
+            elif key in ('q', '\x1b', '\x03', '\x04'):
+                return
+
+    def _table(self, entries: Iterable[Dict], title: str = "Command History"):
+        """Build a rich table of entries"""
+        from rich.table import Table
+        from rich import box
         
         table = Table(
             box=box.ROUNDED,
-            title="Command History",
+            title=title,
             show_lines=True
         )
         
@@ -48,11 +720,9 @@ class History:
         table.add_column("Provider", style="blue", width=10)
         table.add_column("Model", style="magenta", width=15)
         table.add_column("Latency", style="cyan", width=8)
-        table.add_column("Status", justify="center", width=8)
-        
-        # Get the last 'limit' entries and reverse them
-        entries = list(reversed(history[-limit:]))
-        
+        table.add_column("Status", justify="center", width=10)
+
+        runs = []
         for entry in entries:
             # Format timestamp
             dt = datetime.fromisoformat(entry['timestamp'])
@@ -67,6 +737,12 @@ class History:
             # Format status with color
             success = entry.get('success', True)
             status = f"[{'green' if success else 'red'}]{'✓' if success else '✗'}[/]"
+            execution = metadata.get('execution')
+            if execution:
+                # Executed with -e: show how it exited and how long it ran
+                runs.append(execution)
+                code = f" {execution['exit_code']}" if execution['exit_code'] else ""
+                status += f"{code} {execution['duration']:.1f}s"
             
             table.add_row(
                 when,
@@ -77,8 +753,13 @@ class History:
                 latency,
                 status
             )
-        
-        self.console.print(table)
+
+        if runs:
+            durations = [run['duration'] for run in runs]
+            failed = sum(1 for run in runs if run['exit_code'] != 0)
+            table.caption = (f"{len(runs)} executed, {failed} failed; duration p50 {percentile(durations, 50):.2f}s, "
+                             f"p95 {percentile(durations, 95):.2f}s, total {sum(durations):.1f}s")
+        return table
 
     def _format_time(self, dt: datetime) -> str:
         """Format timestamp in a human-readable way"""
@@ -95,4 +776,11 @@ class History:
             return "yesterday"
         if delta.days < 7:
             return f"{delta.days}d ago"
-        return dt.strftime("%Y-%m-%d") 
\ No newline at end of file
+        return dt.strftime("%Y-%m-%d") 
+
+if __name__ == '__main__':
+    from .setup import ensure_directories, setup_logging
+
+    _, log_dir = ensure_directories()
+    setup_logging(log_dir, get_config().config.get('logging'))
+    History().compact(force=False)
@@ -0,0 +1,238 @@
+from pathlib import Path
+from datetime import datetime
+import ctypes
+import ctypes.util
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import shutil
+import re
+import select
+import time
+from typing import Callable, Iterator, List, Optional
+from .storage import BLOCK_SIZE, reverse_lines
+
+# Matches the header of a record written with setup_logging's format
+RECORD_HEADER = re.compile(r'^\d{4}-\d\d-\d\d [\d:,]+ - (?P<name>\S+) - (?P<level>[A-Z]+) - ')
+
+# Time-based rotation periods, as the strftime key of the period a file belongs to
+ROTATE_PERIODS = {"hourly": "%Y-%m-%d %H", "daily": "%Y-%m-%d", "weekly": "%G-%V"}
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x002
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+def record_filter(level: Optional[str] = None, logger_name: Optional[str] = None) -> Optional[Callable[[str, str], bool]]:
+    """Build a predicate on (logger name, level) for log records, or None to keep everything"""
+    if not level and not logger_name:
+        return None
+    min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+
+    def matches(name: str, record_level: str) -> bool:
+        if logger_name and name != logger_name and not name.startswith(logger_name + '.'):
+            return False
+        value = logging.getLevelName(record_level)
+        # Unknown level names map to a string; keep those records
+        return not isinstance(value, int) or value >= min_level
+
+    return matches
+
+def _header(line: str):
+    if line.startswith('{'):
+        # A record written by JsonFormatter
+        try:
+            record = json.loads(line)
+            return record['name'], record['level']
+        except (ValueError, KeyError, TypeError):
+            return None
+    match = RECORD_HEADER.match(line)
+    return (match.group('name'), match.group('level')) if match else None
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as a single JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+def _compress(source: str, dest: str):
+    if not os.path.exists(source):
+        return
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """Rotate the log when it grows past max_bytes or a new period (hourly, daily, weekly) starts.
+
+    Rotated files are gzipped when compress is set. If another process already
+    rotated the file, the handler reopens it instead of rotating again.
+    """
+
+    def __init__(self, filename, max_bytes: int = 0, backup_count: int = 0,
+                 rotate: Optional[str] = None, compress: bool = False):
+        if rotate and rotate not in ROTATE_PERIODS:
+            raise ValueError(f"Unknown rotation period: {rotate}")
+        super().__init__(filename, maxBytes=max_bytes or 0, backupCount=backup_count, delay=True)
+        self.period_format = ROTATE_PERIODS.get(rotate) if rotate else None
+        try:
+            started = os.stat(self.baseFilename).st_mtime
+        except OSError:
+            started = time.time()
+        self.period = self._period(started)
+        if compress:
+            self.namer = lambda name: name + '.gz'
+            self.rotator = _compress
+
+    def _period(self, timestamp: float) -> Optional[str]:
+        return time.strftime(self.period_format, time.localtime(timestamp)) if self.period_format else None
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        new_period = self.period is not None and self._period(record.created) != self.period
+        if not new_period and not super().shouldRollover(record):
+            return False
+        if self.stream is not None:
+            try:
+                rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+            except OSError:
+                rotated = True
+            if rotated:
+                self.stream.close()
+                self.stream = self._open()
+                self.period = self._period(record.created)
+                return super().shouldRollover(record)
+        return True
+
+    def doRollover(self):
+        super().doRollover()
+        self.period = self._period(time.time())
+
+def tail_lines(path: Path, n: int, predicate: Optional[Callable[[str, str], bool]] = None,
+               block_size: int = BLOCK_SIZE) -> List[str]:
+    """Return the last n lines (of matching records, if a predicate is given) without reading the whole file.
+
+    Lines without a record header, such as traceback lines, belong to the record above them.
+    """
+    if n <= 0:
+        return []
+    result: List[str] = []
+    continuation: List[str] = []
+    with open(path, 'rb') as f:
+        for line in reverse_lines(f, block_size):
+            header = _header(line)
+            if predicate and header is None:
+                continuation.insert(0, line)
+                continue
+            record = [line] + continuation
+            continuation = []
+            if predicate is None or predicate(*header):
+                result[:0] = record
+                if len(result) >= n:
+                    break
+    return result[-n:]
+
+class Inotify:
+    """Minimal inotify watcher for a directory, via libc"""
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, str(directory).encode(), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout: float):
+        """Block until something in the directory changes or the timeout passes"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+def _watcher(directory: Path) -> Optional[Inotify]:
+    try:
+        return Inotify(directory)
+    except (OSError, AttributeError):
+        # Not Linux (or no inotify): fall back to polling
+        return None
+
+def follow(path: Path, predicate: Optional[Callable[[str, str], bool]] = None, poll_interval: float = 0.5,
+           from_start: bool = False) -> Iterator[str]:
+    """Yield lines appended to path, reopening it when it is rotated or truncated"""
+    watcher = _watcher(path.parent)
+
+    def wait():
+        if watcher:
+            watcher.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+
+    f = None
+    inode = None
+    partial = ''
+    keep = True
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'r', errors='replace')
+                except FileNotFoundError:
+                    wait()
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                # Any later reopen is a new file, read from its start
+                from_start = True
+
+            line = f.readline()
+            if line:
+                partial += line
+                if not partial.endswith('\n'):
+                    continue
+                line, partial = partial.rstrip('\n'), ''
+                if predicate:
+                    header = _header(line)
+                    if header:
+                        keep = predicate(*header)
+                if keep:
+                    yield line
+                continue
+
+            try:
+                stat = os.stat(path)
+                rotated = stat.st_ino != inode or stat.st_size < f.tell()
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                f.close()
+                f = None
+                continue
+            wait()
+    finally:
+        if f:
+            f.close()
+        if watcher:
+            watcher.close()
@@ -0,0 +1,254 @@
+"""Speculative translation of `wtf ...` lines while they are still being typed, for the shell widgets"""
+from pathlib import Path
+from typing import Any, Dict, Optional
+import logging
+import os
+import shlex
+import time
+import click
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# How often a process waiting on another's request checks whether it is done
+POLL_INTERVAL = 0.05
+
+def get_slot_dir() -> Path:
+    """Get path to the directory of lock files naming translations currently being requested"""
+    return Path.home() / '.config' / 'wtf' / 'inflight'
+
+def _inode(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+class InFlight:
+    """A lock file per translation being requested right now, shared by every wtf process.
+
+    A prefetch claims the prompt's slot before asking the provider. A foreground
+    run for the same prompt then waits for that answer to land in the cache
+    instead of sending a second request. A prefetch for a prompt that's already
+    being requested also waits, then finds the answer cached. Different prompts
+    never wait on each other.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = directory or get_slot_dir()
+        self.path: Optional[Path] = None
+        self.fd = None
+
+    def acquire(self, key: str, wait: float) -> bool:
+        """Claim the slot for key. If another process holds it, wait up to `wait` seconds
+        for it to finish and return False; the caller should check the cache again."""
+        if fcntl is None:
+            return False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{key}.lock'
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                self._wait(path, wait)
+                return False
+            # The previous holder may have removed the file after we opened it; lock a fresh one
+            if os.fstat(fd).st_ino == _inode(path):
+                break
+            os.close(fd)
+        self.path, self.fd = path, fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        # Removed while still locked, so finished slots don't pile up
+        self.path.unlink(missing_ok=True)
+        os.close(self.fd)
+        self.path, self.fd = None, None
+
+    def _wait(self, path: Path, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                return
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                pass
+            finally:
+                os.close(fd)
+            time.sleep(POLL_INTERVAL)
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """Split a typed command line into wtf's arguments.
+
+    A line starting with `wtf` is parsed like wtf's own command line, so -p and -m apply.
+    Any other line is taken as the description itself.
+    """
+    try:
+        words = shlex.split(line)
+    except ValueError:
+        # An unclosed quote, still being typed
+        words = line.split()
+    if not words:
+        return None
+    if words[0] != 'wtf':
+        return {"command": tuple(words), "provider": None, "model": None}
+
+    from .cli import cli
+    try:
+        ctx = cli.make_context('wtf', words[1:], resilient_parsing=True)
+    except click.ClickException:
+        return None
+    if not ctx.params.get('command'):
+        return None
+    return {key: ctx.params.get(key) for key in ("command", "provider", "model")}
+
+def prefetch(line: str):
+    """Translate a line into the response cache without printing or recording anything"""
+    from .cache import ResponseCache
+    from .config import get_config
+    from .environment import probe
+    from . import daemon
+
+    params = parse_line(line)
+    if not params:
+        return
+    config = get_config()
+    if not config.config['cache']['enabled']:
+        return
+    provider = params['provider'] or config.config['default_provider']
+    model = params['model'] or config.get_provider_config(provider)['default_model']
+    prompt = ' '.join(params['command'])
+    environment = probe()
+    shell = environment['shell']
+    workdir = None
+    if config.config['context']['enabled']:
+        from .context import collect
+        workdir = collect(config.config['context'])
+        environment = {**environment, "context": workdir}
+
+    slot = InFlight()
+    if not slot.acquire(ResponseCache.make_key(prompt, shell, provider, model, workdir),
+                        wait=config.config['resilience']['deadline'] or 10):
+        return
+    try:
+        backend = daemon.connect(config)
+        if backend.cached(prompt, provider, model, shell, workdir) is None:
+            logger.debug(f"Prefetching: {prompt}")
+            backend.generate(prompt, provider, model, shell, use_cache=True, environment=environment)
+    finally:
+        slot.release()
+
+ZSH_INIT = r'''
+# wtf shell widget: {key} translates the current line in place.
+# `wtf ...` lines are translated in the background while you type.
+_wtf_prefetch_pid=
+_wtf_prefetch_line=
+
+_wtf_cancel_prefetch() {
+  [[ -n $_wtf_prefetch_pid ]] && kill $_wtf_prefetch_pid 2>/dev/null
+  _wtf_prefetch_pid=
+}
+
+_wtf_prefetch() {
+  [[ $BUFFER == "$_wtf_prefetch_line" ]] && return
+  _wtf_prefetch_line=$BUFFER
+  # A newer line makes the previous prefetch stale
+  _wtf_cancel_prefetch
+  [[ $BUFFER == wtf\ * && ${#${(z)BUFFER}} -gt {min_words} ]] || return
+  (sleep {debounce} && exec wtf --prefetch "$_wtf_prefetch_line") </dev/null >/dev/null 2>&1 &!
+  _wtf_prefetch_pid=$!
+}
+
+_wtf_widget() {
+  [[ -z $BUFFER ]] && return
+  local result
+  zle -R "wtf: thinking..."
+  result=$(command wtf --line "$BUFFER" </dev/null 2>/dev/null)
+  if [[ -n $result ]]; then
+    BUFFER=$result
+    CURSOR=${#BUFFER}
+  else
+    zle -M "wtf: no command (see wtf --logs)"
+  fi
+}
+
+zle -N wtf-widget _wtf_widget
+bindkey '{key}' wtf-widget
+if (( {prefetch} )); then
+  autoload -Uz add-zle-hook-widget
+  add-zle-hook-widget line-pre-redraw _wtf_prefetch
+fi
+'''
+
+BASH_INIT = r'''
+# wtf shell widget: {key} translates the current line in place.
+# With widget.bash_space_prefetch, `wtf ...` lines are also translated in the
+# background at each word while you type; that rebinds the space key.
+_wtf_prefetch_pid=
+_wtf_prefetch_line=
+
+_wtf_cancel_prefetch() {
+  [[ -n $_wtf_prefetch_pid ]] && kill $_wtf_prefetch_pid 2>/dev/null
+  _wtf_prefetch_pid=
+}
+
+_wtf_prefetch() {
+  [[ $READLINE_LINE == "$_wtf_prefetch_line" ]] && return
+  _wtf_prefetch_line=$READLINE_LINE
+  # A newer line makes the previous prefetch stale
+  _wtf_cancel_prefetch
+  local words
+  read -ra words <<< "$READLINE_LINE"
+  [[ $READLINE_LINE == "wtf "* && ${#words[@]} -gt {min_words} ]] || return
+  _wtf_prefetch_pid=$( (sleep {debounce} && exec wtf --prefetch "$_wtf_prefetch_line") </dev/null >/dev/null 2>&1 & echo $!)
+}
+
+# Bash has no hook for every keystroke, so prefetch whenever a word is finished
+_wtf_space() {
+  READLINE_LINE="${READLINE_LINE:0:READLINE_POINT} ${READLINE_LINE:READLINE_POINT}"
+  READLINE_POINT=$((READLINE_POINT + 1))
+  _wtf_prefetch
+}
+
+_wtf_widget() {
+  [[ -z $READLINE_LINE ]] && return
+  local result
+  result=$(command wtf --line "$READLINE_LINE" </dev/null 2>/dev/null)
+  if [[ -n $result ]]; then
+    READLINE_LINE=$result
+    READLINE_POINT=${#READLINE_LINE}
+  fi
+}
+
+bind -x '"{key}": _wtf_widget'
+if (( {prefetch} && {space} )); then
+  bind -x '" ": _wtf_space'
+fi
+'''
+
+SCRIPTS = {"zsh": ZSH_INIT, "bash": BASH_INIT}
+
+def shell_init(shell: str, settings: Dict[str, Any]) -> str:
+    """Shell code defining the widget, for eval "$(wtf --shell-init zsh)" in the shell's rc file"""
+    script = SCRIPTS[shell]
+    values = {
+        "key": settings[f'key_{shell}'],
+        "debounce": float(settings['debounce']),
+        "min_words": int(settings['min_words']),
+        "prefetch": int(bool(settings['prefetch'])),
+        "space": int(bool(settings.get('bash_space_prefetch'))),
+    }
+    for name, value in values.items():
+        script = script.replace('{' + name + '}', str(value))
+    return script.lstrip()
@@ -1,112 +1,265 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Optional
 import click
-from openai import OpenAI
-from anthropic import Anthropic
-from wtf.config import Config
-import os
+from wtf.config import get_api_key
+from wtf.environment import describe, probe
+import importlib
 import logging
-import platform
-import subprocess
+import threading
+import time
 
 logger = logging.getLogger('wtf')
 
+# SDK client classes by module; imported only when a provider is instantiated
+SDK_CLIENTS = {
+    "OpenAI": "openai",
+    "Anthropic": "anthropic"
+}
+
+# Provider settings passed straight to the SDK client
+CLIENT_OPTIONS = ["base_url", "timeout", "max_retries"]
+
+# Provider settings for the HTTP connection pool; unset means the SDK default
+POOL_LIMITS = ["max_connections", "max_keepalive_connections"]
+
+# Output cap when a provider doesn't set max_tokens; commands are short
+DEFAULT_MAX_TOKENS = 100
+
+SYSTEM_PROMPT = "You are a helpful assistant that converts natural language into shell commands. Provide only the command, no explanations."
+
+# Entry point group third-party packages use to add provider types
+ENTRY_POINT_GROUP = "wtf.providers"
+
+def __getattr__(name: str):
+    if name in SDK_CLIENTS:
+        client_class = getattr(importlib.import_module(SDK_CLIENTS[name]), name)
+        globals()[name] = client_class
+        return client_class
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def sdk_client(name: str):
+    """Return an SDK client class, importing its package on first use"""
+    return globals().get(name) or __getattr__(name)
+
+def detect_shell() -> str:
+    """Detect the current shell"""
+    return probe()['shell']
+
 class AIProvider:
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.settings = settings or {}
+        # When the latest request on each thread was sent, its response headers arrived, and its token usage
+        self._marks = threading.local()
+
+    def client_options(self, sdk: str, settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """SDK client keyword arguments from a provider's config.yaml settings"""
+        settings = settings or {}
+        options = {key: settings[key] for key in CLIENT_OPTIONS if settings.get(key) is not None}
+        options['http_client'] = self.http_client(sdk, settings)
+        return options
+
+    def http_client(self, sdk: str, settings: Optional[Dict[str, Any]] = None):
+        """An SDK HTTP client whose event hooks mark when requests are sent and responses start"""
+        def on_request(request):
+            self._marks.sent = time.perf_counter()
+            self._marks.headers = None
+
+        def on_response(response):
+            self._marks.headers = time.perf_counter()
+
+        module = importlib.import_module(SDK_CLIENTS[sdk])
+        options = {"event_hooks": {"request": [on_request], "response": [on_response]}}
+        limits = {key: (settings or {}).get(key) for key in POOL_LIMITS}
+        if any(value is not None for value in limits.values()):
+            # Build the SDK's own Limits type, keeping its defaults for anything not configured
+            defaults = module.DEFAULT_CONNECTION_LIMITS
+            options['limits'] = type(defaults)(
+                max_connections=limits['max_connections'] or defaults.max_connections,
+                max_keepalive_connections=limits['max_keepalive_connections'] or defaults.max_keepalive_connections,
+                keepalive_expiry=defaults.keepalive_expiry
+            )
+        return module.DefaultHttpxClient(**options)
+
+    def request_timings(self, start: float, end: float) -> Dict[str, float]:
+        """Split the latest request made on this thread between start and end into phases"""
+        sent = getattr(self._marks, 'sent', None)
+        headers = getattr(self._marks, 'headers', None)
+        self._marks.sent = self._marks.headers = None
+        if sent is None or headers is None or not start <= sent <= headers <= end:
+            return {"request": end - start}
+        return {"send": sent - start, "ttfb": headers - sent, "completion": end - headers}
+
+    def request_usage(self) -> Optional[Dict[str, int]]:
+        """Token usage of the latest request made on this thread, if the provider reported it"""
+        usage = getattr(self._marks, 'usage', None)
+        self._marks.usage = None
+        return usage
+
+    def record_usage(self, input_tokens, cached_tokens, output_tokens):
+        values = [input_tokens, cached_tokens, output_tokens]
+        # Anything but ints means the response didn't report usage
+        values = [value if isinstance(value, int) else 0 for value in values]
+        self._marks.usage = dict(zip(["input_tokens", "cached_tokens", "output_tokens"], values))
+
     def detect_shell(self) -> str:
         """Detect the current shell"""
-        # First try getting it from SHELL env var
-        shell = os.environ.get('SHELL', '')
-        if shell:
-            return os.path.basename(shell)
-            
-        # Try getting from $0
-        try:
-            shell = subprocess.check_output(['ps', '-p', str(os.getppid()), '-o', 'comm=']).decode().strip()
-            if shell:
-                return os.path.basename(shell)
-        except:
-            pass
-            
-        # Fallback detection methods
-        if platform.system() == 'Windows':
-            # Check if we're in PowerShell
-            if 'POWERSHELL_VERSION' in os.environ:
-                return 'powershell'
-            return 'cmd'
-            
-        # Default to zsh for Unix-like systems
-        return 'zsh'
-
-    def create_prompt(self, command: str) -> str:
-        shell = self.detect_shell()
+        return detect_shell()
+
+    def context_prompt(self, shell: Optional[str] = None, environment: Optional[Dict[str, Any]] = None) -> str:
+        """Instructions that only depend on the machine, so providers can cache them between requests"""
+        environment = environment or probe()
+        shell = shell or environment['shell']
         return f"""Convert this natural language command into a {shell} command. 
 Respond with only the shell command, no explanations or markdown.
 Make sure the command is compatible with {shell}.
+Environment: {describe(environment)}"""
+
+    def user_prompt(self, text: str, environment: Optional[Dict[str, Any]] = None) -> str:
+        """The request itself, after any working-directory context; kept out of the cacheable instructions"""
+        if environment and environment.get('context'):
+            return f"Working directory:\n{environment['context']}\n\nNatural language: {text}"
+        return f"Natural language: {text}"
+
+    def create_prompt(self, command: str, shell: Optional[str] = None,
+                      environment: Optional[Dict[str, Any]] = None) -> str:
+        return f"""{self.context_prompt(shell, environment)}
 
-Natural language: {command}"""
+{self.user_prompt(command, environment)}"""
+
+    def max_tokens(self) -> int:
+        return self.settings.get('max_tokens') or DEFAULT_MAX_TOKENS
 
 class OpenAIProvider(AIProvider):
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+    """OpenAI, or any server speaking its chat-completions API (set base_url)"""
+
+    def __init__(self, api_key: str, settings: Optional[Dict[str, Any]] = None):
+        super().__init__(settings)
+        self.client = sdk_client('OpenAI')(api_key=api_key, **self.client_options('OpenAI', settings))
 
-    def get_shell_command(self, text: str, model: str) -> str:
-        response = self.client.chat.completions.create(
+    def get_shell_command(self, text: str, model: str, on_token: Optional[Callable[[str], None]] = None,
+                          shell: Optional[str] = None, environment: Optional[Dict[str, Any]] = None) -> str:
+        request = dict(
             model=model,
+            # The static instructions come first so the provider can reuse its cached prefix
             messages=[
-                {"role": "system", "content": "You are a helpful assistant that converts natural language into shell commands. Provide only the command, no explanations."},
-                {"role": "user", "content": self.create_prompt(text)}
+                {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{self.context_prompt(shell, environment)}"},
+                {"role": "user", "content": self.user_prompt(text, environment)}
             ],
-            temperature=0.1
+            temperature=0.1,
+            max_tokens=self.max_tokens()
         )
-        return response.choices[0].message.content.strip()
+        if self.settings.get('stop'):
+            request['stop'] = self.settings['stop']
+        if on_token is None:
+            response = self.client.chat.completions.create(**request)
+            self.record_openai_usage(response.usage)
+            return response.choices[0].message.content.strip()
+
+        chunks = []
+        # Closes the response if on_token raises to give up on the answer
+        with self.client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True}) as stream:
+            for chunk in stream:
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    chunks.append(token)
+                    on_token(token)
+                elif not chunk.choices and getattr(chunk, 'usage', None):
+                    self.record_openai_usage(chunk.usage)
+        return ''.join(chunks).strip()
+
+    def record_openai_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        self.record_usage(usage.prompt_tokens, getattr(details, 'cached_tokens', 0), usage.completion_tokens)
 
 class AnthropicProvider(AIProvider):
-    def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
+    def __init__(self, api_key: str, settings: Optional[Dict[str, Any]] = None):
+        super().__init__(settings)
+        self.client = sdk_client('Anthropic')(api_key=api_key, **self.client_options('Anthropic', settings))
 
-    def get_shell_command(self, text: str, model: str) -> str:
-        response = self.client.messages.create(
+    def get_shell_command(self, text: str, model: str, on_token: Optional[Callable[[str], None]] = None,
+                          shell: Optional[str] = None, environment: Optional[Dict[str, Any]] = None) -> str:
+        system = {"type": "text", "text": f"{SYSTEM_PROMPT}\n\n{self.context_prompt(shell, environment)}"}
+        if self.settings.get('prompt_cache', True):
+            system["cache_control"] = {"type": "ephemeral"}
+        request = dict(
             model=model,
-            max_tokens=100,
+            max_tokens=self.max_tokens(),
             messages=[{
                 "role": "user",
-                "content": self.create_prompt(text)
+                "content": self.user_prompt(text, environment)
             }],
-            system="You are a helpful assistant that converts natural language into shell commands. Provide only the command, no explanations."
+            system=[system]
         )
-        return response.content[0].text.strip()
+        if self.settings.get('stop'):
+            request['stop_sequences'] = self.settings['stop']
+        if on_token is None:
+            response = self.client.messages.create(**request)
+            self.record_anthropic_usage(response.usage)
+            return response.content[0].text.strip()
+
+        chunks = []
+        with self.client.messages.stream(**request) as stream:
+            for token in stream.text_stream:
+                chunks.append(token)
+                on_token(token)
+            self.record_anthropic_usage(stream.get_final_message().usage)
+        return ''.join(chunks).strip()
+
+    def record_anthropic_usage(self, usage):
+        if usage is None:
+            return
+        # input_tokens only counts what was neither read from nor written to the cache
+        cached = getattr(usage, 'cache_read_input_tokens', None)
+        created = getattr(usage, 'cache_creation_input_tokens', None)
+        parts = [value for value in (usage.input_tokens, cached, created) if isinstance(value, int)]
+        self.record_usage(sum(parts) if parts else None, cached, usage.output_tokens)
+
+# Built-in provider types; others come from the wtf.providers entry point group
+PROVIDER_TYPES = {
+    "openai": OpenAIProvider,
+    "anthropic": AnthropicProvider
+}
+
+def provider_type(name: str) -> Optional[type]:
+    """Look up a provider class by type name, loading an entry point only when it isn't built in"""
+    if name in PROVIDER_TYPES:
+        return PROVIDER_TYPES[name]
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name == name:
+            PROVIDER_TYPES[name] = entry_point.load()
+            return PROVIDER_TYPES[name]
+    return None
 
 def get_provider(name: str, config: Dict[str, Any]) -> AIProvider:
-    providers = {
-        "openai": OpenAIProvider,
-        "anthropic": AnthropicProvider
-    }
-    
-    provider_class = providers.get(name)
-    if not provider_class:
-        available = ", ".join(providers.keys())
+    providers = config.get('providers', {})
+    settings = providers.get(name)
+    if settings is None:
+        available = ", ".join(providers)
         raise click.ClickException(f"Unknown provider '{name}'. Available providers: {available}")
-    
-    config_obj = Config()
-    api_key = config_obj.get_api_key(name)
+
+    # wtf retries and enforces deadlines itself, so by default the SDK does neither on its own
+    deadline = (config.get('resilience') or {}).get('deadline')
+    settings = {"max_retries": 0, **({"timeout": deadline} if deadline else {}), **settings}
+
+    type_name = settings.get('type') or name
+    provider_class = provider_type(type_name)
+    if not provider_class:
+        from importlib.metadata import entry_points
+        available = ", ".join([*PROVIDER_TYPES, *(ep.name for ep in entry_points(group=ENTRY_POINT_GROUP))])
+        raise click.ClickException(f"Unknown provider type '{type_name}' for {name}. Available types: {available}")
+
+    api_key = get_api_key(config, name)
+    if not api_key and settings.get('base_url'):
+        # Self-hosted OpenAI-compatible servers usually don't check keys, but the SDKs insist on one
+        api_key = "none"
     if not api_key:
-        env_key = config_obj.config['providers'][name]['env_key']
+        env_key = settings.get('env_key') or f"{name.upper()}_API_KEY"
         raise click.ClickException(
             f"\nNo API key found for {name}. You can set it by either:\n"
             f"1. Setting environment variable: export {env_key}=sk-...\n"
             f"2. Using config command: wtf-config set-key {name} sk-...\n"
         )
-    
-    return provider_class(api_key) 
-
-def get_api_key(self, provider: str) -> Optional[str]:
-    provider_config = self.config['providers'][provider]
-    # First check environment variable
-    if env_key := provider_config.get('env_key'):
-        api_key = os.getenv(env_key)
-        logger.debug(f"Checking env var {env_key}: {'found' if api_key else 'not found'}")
-        if api_key:
-            return api_key
-    # Fall back to config file
-    config_key = provider_config.get('api_key')
-    logger.debug(f"Checking config file: {'found' if config_key else 'not found'}")
-    return config_key 
\ No newline at end of file
+
+    return provider_class(api_key, settings)
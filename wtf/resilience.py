@@ -0,0 +1,144 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import click
+from .storage import atomic_file, file_lock
+
+logger = logging.getLogger('wtf')
+
+# SDK exception names that mean the request never got an answer
+TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "ConnectTimeout"}
+
+class DeadlineExceeded(TimeoutError):
+    """An attempt took longer than its deadline"""
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error is worth retrying: timeouts, dropped connections, 408/409/429 and 5xx responses"""
+    if isinstance(error, TimeoutError) or type(error).__name__ in TRANSIENT_ERRORS:
+        return True
+    status = getattr(error, 'status_code', None)
+    return isinstance(status, int) and (status in (408, 409, 429) or status >= 500)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from a Retry-After header"""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+def backoff_delay(retry: int, base: float, cap: float, error: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff, or the provider's Retry-After if that is shorter than the cap"""
+    asked = retry_after(error) if error is not None else None
+    if asked is not None and 0 <= asked <= cap:
+        return asked
+    return random.uniform(0, min(cap, base * 2 ** retry))
+
+def parse_target(config: Dict[str, Any], target: str) -> Tuple[str, str]:
+    """Split a "provider:model" target, defaulting to the provider's default model"""
+    name, _, model = target.partition(':')
+    if name not in config['providers']:
+        raise click.ClickException(f"Unknown provider '{name}' in {target!r}")
+    return name, model or config['providers'][name]['default_model']
+
+def call_with_deadline(fn: Callable[[Optional[Callable[[str], None]]], Any], deadline: Optional[float],
+                       on_token: Optional[Callable[[str], None]] = None) -> Any:
+    """Run fn(on_token) on a worker thread and give up on it after deadline seconds.
+
+    An abandoned call finishes in the background (bounded by the SDK timeout)
+    and its result is dropped; a streamed one is closed at its next token.
+    """
+    if not deadline:
+        return fn(on_token)
+
+    results = queue.Queue()
+    live = threading.Event()
+    live.set()
+
+    def forward(token: str):
+        if not live.is_set():
+            raise DeadlineExceeded("Abandoned after the deadline")
+        on_token(token)
+
+    def run():
+        try:
+            results.put((fn(forward if on_token else None), None))
+        except BaseException as e:
+            results.put((None, e))
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        result, error = results.get(timeout=deadline)
+    except queue.Empty:
+        live.clear()
+        raise DeadlineExceeded(f"No answer within {deadline:g}s")
+    if error:
+        raise error
+    return result
+
+def get_breaker_file() -> Path:
+    """Get path to the persisted circuit breaker state"""
+    return Path.home() / '.config' / 'wtf' / 'breakers.json'
+
+class CircuitBreaker:
+    """Per-provider circuit breaker whose state is shared by every wtf process.
+
+    After threshold consecutive failures a provider is skipped for cooldown
+    seconds. Then it is tried again (half-open): one success closes the
+    circuit, one failure opens it for another cooldown.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 60, path: Optional[Path] = None):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.path = path or get_breaker_file()
+        self.lock_file = self.path.with_suffix('.lock')
+
+    def _lock(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return file_lock(self.lock_file)
+
+    def _read(self) -> Dict[str, Dict[str, float]]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, state: Dict[str, Dict[str, float]]):
+        # Losing this on a crash only resets the breakers, so skip the fsync
+        with atomic_file(self.path, 'w', sync=False) as f:
+            f.write(json.dumps(state))
+
+    def state(self, provider: str) -> str:
+        """closed, open or half-open"""
+        entry = self._read().get(provider)
+        if not entry or entry['failures'] < self.threshold:
+            return 'closed'
+        return 'open' if time.time() - entry['opened_at'] < self.cooldown else 'half-open'
+
+    def allow(self, provider: str) -> bool:
+        return self.state(provider) != 'open'
+
+    def record_success(self, provider: str):
+        if provider not in self._read():
+            return
+        with self._lock():
+            state = self._read()
+            if state.pop(provider, None) is not None:
+                self._write(state)
+
+    def record_failure(self, provider: str):
+        with self._lock():
+            state = self._read()
+            entry = state.setdefault(provider, {"failures": 0, "opened_at": 0})
+            entry['failures'] += 1
+            if entry['failures'] >= self.threshold:
+                if entry['failures'] == self.threshold:
+                    logger.warning(f"Circuit opened for {provider} after {entry['failures']} failures")
+                entry['opened_at'] = time.time()
+            self._write(state)
@@ -1,7 +1,31 @@
 from pathlib import Path
+from typing import Any, Dict, Optional
+import atexit
 import logging
-from rich.logging import RichHandler
-from .config import Config
+import logging.handlers
+import queue
+import click
+from .config import DEFAULT_CONFIG, get_config
+from .logs import JsonFormatter, RotatingLogHandler
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# The background thread writing queued records to the log file
+_listener: Optional[logging.handlers.QueueListener] = None
+_handlers = []
+
+class ConsoleErrorHandler(logging.Handler):
+    """Show errors on the console through rich, importing it only once an error is logged"""
+
+    def __init__(self, level: int = logging.ERROR):
+        super().__init__(level)
+        self._handler = None
+
+    def emit(self, record: logging.LogRecord):
+        if self._handler is None:
+            from rich.logging import RichHandler
+            self._handler = RichHandler(level=self.level, show_time=False, show_path=False)
+        self._handler.handle(record)
 
 def ensure_directories():
     """Ensure all required directories exist"""
@@ -14,31 +38,68 @@ def ensure_directories():
     
     return wtf_dir, log_dir
 
-def setup_logging(log_dir: Path):
-    """Configure logging"""
+def setup_logging(log_dir: Path, settings: Optional[Dict[str, Any]] = None):
+    """Configure logging: records are queued and written to a rotating file by a background thread"""
+    global _listener
     log_file = log_dir / 'wtf.log'
-    
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            RichHandler(level=logging.ERROR, show_time=False, show_path=False)
-        ]
-    )
-    
+    if _listener is not None:
+        return log_file
+    settings = {**DEFAULT_CONFIG['logging'], **(settings or {})}
+
+    root = logging.getLogger()
+    try:
+        root.setLevel(str(settings['level']).upper())
+        for name, level in (settings.get('levels') or {}).items():
+            logging.getLogger(name).setLevel(str(level).upper())
+        file_handler = RotatingLogHandler(
+            log_file,
+            max_bytes=settings['max_bytes'],
+            backup_count=settings['backup_count'],
+            rotate=settings['rotate'],
+            compress=settings['compress'],
+        )
+    except ValueError as e:
+        raise click.ClickException(f"Invalid logging configuration: {e}")
+    file_handler.setFormatter(JsonFormatter() if settings['format'] == 'json' else logging.Formatter(LOG_FORMAT))
+
+    _listener = logging.handlers.QueueListener(queue.SimpleQueue(), file_handler, respect_handler_level=True)
+    _handlers[:] = [
+        logging.handlers.QueueHandler(_listener.queue),
+        # Errors still reach the console right away, not through the queue
+        ConsoleErrorHandler(level=logging.ERROR),
+    ]
+    for handler in _handlers:
+        root.addHandler(handler)
+    _listener.start()
+    atexit.unregister(shutdown_logging)
+    atexit.register(shutdown_logging)
+
     return log_file
 
+def shutdown_logging():
+    """Flush queued records to the log file and stop the background writer"""
+    global _listener
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    for handler in _handlers:
+        root.removeHandler(handler)
+    _handlers.clear()
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
 def initialize():
     """Initialize WTF environment"""
     # Create directories
     wtf_dir, log_dir = ensure_directories()
     
-    # Setup logging
-    log_file = setup_logging(log_dir)
-    
     # Initialize config (this will create default config if it doesn't exist)
-    config = Config()
+    config = get_config()
+    
+    # Setup logging
+    log_file = setup_logging(log_dir, config.config.get('logging'))
     
     # Show first run message if needed
     config.check_first_run()
@@ -0,0 +1,139 @@
+from datetime import datetime
+from pathlib import Path
+import re
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+class Match(NamedTuple):
+    prompt: str
+    command: str
+    score: float
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each word, padded so short words still contribute"""
+    grams = set()
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def get_index_file() -> Path:
+    """Get path to the similar-prompt index"""
+    return Path.home() / '.config' / 'wtf' / 'prompts.db'
+
+class PromptIndex:
+    """Incrementally maintained trigram index over successful prompts.
+
+    Each prompt remembers when it was last seen, so prompts whose history
+    entries were all evicted can be pruned. Use it as a context manager to
+    close the connection.
+    """
+
+    def __init__(self):
+        self.index_file = get_index_file()
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        self.is_new = not self.index_file.exists()
+        self.conn = sqlite3.connect(self.index_file, timeout=5, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(prompts)')]
+        if columns and 'seen' not in columns:
+            # Indexes from before pruning can't tell which prompts are still in history; rebuild them
+            self.conn.executescript('DROP TABLE prompts; DROP TABLE grams;')
+            self.is_new = True
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS prompts (
+                id INTEGER PRIMARY KEY,
+                prompt TEXT NOT NULL,
+                shell TEXT NOT NULL,
+                command TEXT NOT NULL,
+                gram_count INTEGER NOT NULL,
+                seen TEXT NOT NULL,
+                UNIQUE (prompt, shell)
+            );
+            CREATE TABLE IF NOT EXISTS grams (
+                gram TEXT NOT NULL,
+                prompt_id INTEGER NOT NULL,
+                PRIMARY KEY (gram, prompt_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS prompts_seen ON prompts (seen);
+        """)
+
+    def __enter__(self) -> 'PromptIndex':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, prompt: str, command: str, shell: str = '', seen: Optional[str] = None):
+        """Index a prompt, replacing the command of an identical earlier prompt"""
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._add(prompt, command, shell, seen or datetime.now().isoformat())
+
+    def _add(self, prompt: str, command: str, shell: str, seen: str):
+        grams = trigrams(prompt)
+        if not grams or not command:
+            return
+        row = self.conn.execute(
+            'SELECT id FROM prompts WHERE prompt = ? AND shell = ?', (prompt, shell)
+        ).fetchone()
+        if row:
+            self.conn.execute('UPDATE prompts SET command = ?, seen = max(seen, ?) WHERE id = ?',
+                              (command, seen, row[0]))
+            return
+        prompt_id = self.conn.execute(
+            'INSERT INTO prompts (prompt, shell, command, gram_count, seen) VALUES (?, ?, ?, ?, ?)',
+            (prompt, shell, command, len(grams), seen)
+        ).lastrowid
+        self.conn.executemany(
+            'INSERT INTO grams (gram, prompt_id) VALUES (?, ?)',
+            [(gram, prompt_id) for gram in grams]
+        )
+
+    def add_entries(self, entries: Iterable[Dict], replace: bool = False):
+        """Index successful history entries in one transaction, first forgetting everything else if replace"""
+        now = datetime.now().isoformat()
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if replace:
+                self.conn.execute('DELETE FROM grams')
+                self.conn.execute('DELETE FROM prompts')
+            for entry in entries:
+                if entry.get('success', True) and entry.get('command'):
+                    self._add(entry['prompt'], entry['command'], entry.get('metadata', {}).get('shell', ''),
+                              entry.get('timestamp') or now)
+
+    def prune(self, before: str) -> int:
+        """Forget prompts last seen before an ISO timestamp, e.g. after their history was evicted"""
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute('DELETE FROM grams WHERE prompt_id IN (SELECT id FROM prompts WHERE seen < ?)',
+                              (before,))
+            return self.conn.execute('DELETE FROM prompts WHERE seen < ?', (before,)).rowcount
+
+    def lookup(self, prompt: str, shell: str = '', threshold: float = 0.7, limit: int = 1) -> List[Match]:
+        """Return the most similar indexed prompts scoring at least threshold (Dice coefficient)"""
+        grams = trigrams(prompt)
+        if not grams:
+            return []
+        placeholders = ', '.join('?' * len(grams))
+        # Entries without a recorded shell predate shell tracking and match any shell
+        rows = self.conn.execute(
+            f"""SELECT p.prompt, p.command, p.gram_count, COUNT(*) AS shared
+                FROM grams g JOIN prompts p ON p.id = g.prompt_id
+                WHERE g.gram IN ({placeholders}) AND p.shell IN (?, '')
+                GROUP BY g.prompt_id
+                ORDER BY shared DESC
+                LIMIT 50""",
+            (*grams, shell)
+        )
+        matches = [
+            Match(row[0], row[1], 2 * row[3] / (len(grams) + row[2]))
+            for row in rows
+        ]
+        matches = sorted((m for m in matches if m.score >= threshold), key=lambda m: m.score, reverse=True)
+        return matches[:limit]
+
+    def close(self):
+        self.conn.close()
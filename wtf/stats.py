@@ -0,0 +1,135 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import time
+from .history import percentile
+
+# Order in which translate_command's phases happen, for display; clipboard is timed by the worker
+PHASES = ["config", "environment", "connect", "cache", "prefetch", "similar", "context", "provider_init", "send", "ttfb",
+          "completion", "request", "cache_write", "dispatch", "output", "clipboard"]
+
+# Percentiles reported by --stats
+PERCENTILES = [50, 90, 99]
+
+# Newest history entries considered by --stats
+MAX_SAMPLES = 100000
+
+class PhaseTimer:
+    """Records how long each consecutive phase of a command takes"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str) -> float:
+        """End the current phase, adding its duration to any earlier time spent in the same phase"""
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.timings[phase] = self.timings.get(phase, 0.0) + elapsed
+        self.last = now
+        return elapsed
+
+    def split(self, phase: str, parts: Dict[str, float]):
+        """End the current phase, attributing it to parts measured elsewhere and the remainder to phase"""
+        elapsed = self.lap(phase)
+        self.timings[phase] -= min(sum(parts.values()), elapsed)
+        for name, value in parts.items():
+            self.timings[name] = self.timings.get(name, 0.0) + value
+        if self.timings[phase] <= 0:
+            del self.timings[phase]
+
+    def rounded(self) -> Dict[str, float]:
+        """Timings rounded to a tenth of a millisecond, for history metadata"""
+        return {phase: round(value, 4) for phase, value in self.timings.items()}
+
+def translated(entry: Dict) -> bool:
+    """Whether the provider answered; an executed command that failed afterwards still counts"""
+    return entry.get('success', True) or 'execution' in entry.get('metadata', {})
+
+def summarize(entries: Iterable[Dict], since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> List[Dict]:
+    """Aggregate history entries per provider and model"""
+    groups: Dict[tuple, List[Dict]] = {}
+    oldest = None
+    for entry in entries:
+        metadata = entry.get('metadata', {})
+        key = (metadata.get('provider') or '-', metadata.get('model') or '-')
+        groups.setdefault(key, []).append(entry)
+        when = datetime.fromisoformat(entry['timestamp'])
+        oldest = when if oldest is None or when < oldest else oldest
+
+    start = since or oldest
+    window = max(((until or datetime.now()) - start).total_seconds(), 1.0) if start else 1.0
+
+    rows = []
+    for (provider, model), group in sorted(groups.items()):
+        errors = sum(1 for entry in group if not translated(entry))
+        cache_hits = sum(1 for entry in group if entry.get('metadata', {}).get('cache_hit'))
+        latencies = [
+            entry['metadata']['latency'] for entry in group
+            if translated(entry) and 'latency' in entry.get('metadata', {})
+            and not entry['metadata'].get('cache_hit')
+        ]
+        phases: Dict[str, List[float]] = {}
+        for entry in group:
+            for phase, value in entry.get('metadata', {}).get('timings', {}).items():
+                phases.setdefault(phase, []).append(value)
+        rows.append({
+            "provider": provider,
+            "model": model,
+            "count": len(group),
+            "throughput": len(group) / window * 3600,
+            "error_rate": errors / len(group),
+            "cache_hit_rate": cache_hits / len(group),
+            "latency": {p: percentile(latencies, p) for p in PERCENTILES} if latencies else {},
+            "phases": {phase: percentile(values, 50) for phase, values in phases.items()},
+        })
+    return rows
+
+def show(rows: List[Dict], console=None):
+    """Display per-provider statistics and median phase timings in rich tables"""
+    from rich.console import Console
+    from rich.table import Table
+    from rich import box
+
+    console = console or Console()
+    if not rows:
+        console.print("[yellow]No history in this window[/]")
+        return
+
+    table = Table(box=box.ROUNDED, title="Latency by Provider and Model")
+    table.add_column("Provider", style="blue")
+    table.add_column("Model", style="magenta")
+    table.add_column("Requests", justify="right")
+    for p in PERCENTILES:
+        table.add_column(f"p{p}", style="cyan", justify="right")
+    table.add_column("Req/h", justify="right")
+    table.add_column("Errors", style="red", justify="right")
+    table.add_column("Cache hits", style="green", justify="right")
+    for row in rows:
+        table.add_row(
+            row['provider'],
+            row['model'],
+            str(row['count']),
+            *(f"{row['latency'][p]:.2f}s" if row['latency'] else "-" for p in PERCENTILES),
+            f"{row['throughput']:.1f}",
+            f"{row['error_rate']:.0%}",
+            f"{row['cache_hit_rate']:.0%}",
+        )
+    console.print(table)
+
+    phases = [name for name in PHASES if any(name in row['phases'] for row in rows)]
+    phases += sorted({name for row in rows for name in row['phases']} - set(phases))
+    if not phases:
+        return
+    table = Table(box=box.ROUNDED, title="Median Phase Timings (ms)")
+    table.add_column("Provider", style="blue")
+    table.add_column("Model", style="magenta")
+    for phase in phases:
+        table.add_column(phase, justify="right")
+    for row in rows:
+        table.add_row(
+            row['provider'],
+            row['model'],
+            *(f"{row['phases'][phase] * 1000:.0f}" if phase in row['phases'] else "-" for phase in phases),
+        )
+    console.print(table)
@@ -0,0 +1,140 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, Optional, Tuple, Union
+import os
+import threading
+import click
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+Version = Tuple[int, int, int]
+
+# Bytes read at a time when scanning a file backwards
+BLOCK_SIZE = 8192
+
+# Passed as `expected` to skip the version check
+ANY_VERSION = object()
+
+class VersionConflict(click.ClickException):
+    """The file changed on disk since it was read"""
+
+    def __init__(self, path: Path):
+        super().__init__(f"{path} was changed by another wtf process; try again")
+        self.path = path
+
+def version(path: Path) -> Optional[Version]:
+    """(mtime, size, inode) of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def lock_path(path: Path) -> Path:
+    return path.with_name(path.name + '.lock')
+
+@contextmanager
+def file_lock(path: Path, exclusive: bool = True, blocking: bool = True) -> Iterator[bool]:
+    """Hold an advisory lock on path, creating it if needed.
+
+    Yields False instead of waiting when blocking is off and someone else holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+def try_lock(path: Path) -> Optional[int]:
+    """Open path and lock it exclusively without waiting; the fd, or None if someone else holds it.
+
+    The lock lasts until every copy of the fd is closed, including copies
+    inherited by child processes.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+def _sync_dir(path: Path):
+    """Persist a rename in path"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextmanager
+def atomic_file(path: Path, mode: str = 'wb', sync: bool = True):
+    """Write to a temp file next to path that replaces it only if the block completes.
+
+    Readers see either the old file or the new one, never a partial write.
+    With sync, the data and the rename are flushed to disk first.
+    """
+    tmp_file = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp_file, mode) as f:
+            yield f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    if sync:
+        _sync_dir(path.parent)
+
+def atomic_write(path: Path, data: Union[str, bytes], expected: Any = ANY_VERSION,
+                 lock: Optional[Path] = None, sync: bool = True) -> Optional[Version]:
+    """Replace path with data under an exclusive lock; returns the new file's version.
+
+    With expected (a version, or None for "must not exist"), raise VersionConflict
+    instead of overwriting a file someone else changed since it was read.
+    """
+    with file_lock(lock or lock_path(path)):
+        if expected is not ANY_VERSION and version(path) != expected:
+            raise VersionConflict(path)
+        with atomic_file(path, 'w' if isinstance(data, str) else 'wb', sync) as f:
+            f.write(data)
+        return version(path)
+
+def reverse_lines(f: BinaryIO, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """Yield the lines of a file from last to first, reading fixed-size blocks from the end"""
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    buffer = b''
+    while position > 0:
+        read = min(block_size, position)
+        position -= read
+        f.seek(position)
+        buffer = f.read(read) + buffer
+        lines = buffer.split(b'\n')
+        buffer = lines.pop(0)
+        for line in reversed(lines):
+            if line:
+                yield line.decode('utf-8', errors='replace')
+    if buffer:
+        yield buffer.decode('utf-8', errors='replace')
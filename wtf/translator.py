@@ -0,0 +1,251 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .cache import ResponseCache
+from .config import Config, get_config
+from .providers import AIProvider, get_provider
+from .resilience import CircuitBreaker, backoff_delay, call_with_deadline, is_retryable, parse_target
+
+logger = logging.getLogger('wtf')
+
+class RaceLost(Exception):
+    """Raised from a losing race attempt's token callback to close its stream"""
+
+class Translator:
+    """Turns prompts into commands via the response cache and provider clients it keeps warm"""
+
+    def __init__(self, config: Optional[Config] = None):
+        self.config = config or get_config()
+        self._providers: Dict[str, AIProvider] = {}
+        self._lock = threading.Lock()
+
+    def provider(self, name: str) -> AIProvider:
+        """Return a provider, reusing its client (and connection pool) across calls"""
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = get_provider(name, self.config.config)
+            return self._providers[name]
+
+    def _cache(self) -> ResponseCache:
+        settings = self.config.config['cache']
+        return ResponseCache(ttl=settings['ttl'], max_entries=settings['max_entries'])
+
+    def record(self, job: Dict[str, Any]) -> bool:
+        """Finish post-response bookkeeping in a detached worker"""
+        from . import worker
+        settings = self.config.config['worker']
+        worker.submit(job, detached=settings['detach'], limit=settings['max_detached'])
+        return True
+
+    def cached(self, prompt: str, provider: str, model: str, shell: str,
+               context: Optional[str] = None) -> Optional[str]:
+        cache = self._cache()
+        try:
+            return cache.get(cache.make_key(prompt, shell, provider, model, context))
+        finally:
+            cache.close()
+
+    def generate(self, prompt: str, provider: str, model: str, shell: str, use_cache: bool = True,
+                 on_token: Optional[Callable[[str], None]] = None,
+                 environment: Optional[Dict[str, Any]] = None,
+                 timings: Optional[Dict[str, float]] = None,
+                 usage: Optional[Dict[str, int]] = None,
+                 route: Optional[Dict[str, Any]] = None,
+                 throttle: Optional[Callable[[str], None]] = None) -> str:
+        """Ask the provider for a command and remember it in the response cache.
+
+        Each attempt gets a deadline; transient errors are retried with jittered
+        backoff, then the configured failover targets are tried in turn, skipping
+        providers whose circuit is open. If a timings dict is given, the seconds
+        spent on each phase of the answering attempt are added to it; a usage dict
+        receives the token counts the provider reported, and a route dict the
+        provider and model that answered plus every attempt made. throttle is
+        called with the provider's name before each attempt, e.g. to rate-limit it.
+        """
+        settings = self.config.config['resilience']
+        breaker = CircuitBreaker(settings['breaker_threshold'], settings['breaker_cooldown'])
+        targets = [(provider, model)]
+        for target in settings['failover']:
+            target = parse_target(self.config.config, target)
+            if target not in targets:
+                targets.append(target)
+
+        route = route if route is not None else {}
+        route['attempts'] = attempts = []
+        start = time.monotonic()
+        error = None
+        for target_provider, target_model in targets:
+            if not breaker.allow(target_provider):
+                attempts.append({"provider": target_provider, "model": target_model, "status": "skipped",
+                                 "error": "circuit open"})
+                continue
+            for retry in range(settings['retries'] + 1):
+                if retry:
+                    time.sleep(backoff_delay(retry - 1, settings['backoff'], settings['max_backoff'], error))
+                if throttle:
+                    throttle(target_provider)
+                attempt = {"provider": target_provider, "model": target_model,
+                           "started": round(time.monotonic() - start, 4)}
+                attempts.append(attempt)
+                try:
+                    command = self._attempt(prompt, target_provider, target_model, shell, settings['deadline'],
+                                            on_token, environment, timings, usage)
+                except Exception as e:
+                    error = e
+                    attempt.update(status="error", error=str(e),
+                                   latency=round(time.monotonic() - start - attempt['started'], 4))
+                    logger.warning(f"{target_provider}:{target_model} attempt failed: {e}")
+                    if not is_retryable(e):
+                        break
+                    breaker.record_failure(target_provider)
+                    if not breaker.allow(target_provider):
+                        break
+                    continue
+                attempt.update(status="ok", latency=round(time.monotonic() - start - attempt['started'], 4))
+                breaker.record_success(target_provider)
+                route.update(provider=target_provider, model=target_model)
+                if use_cache and command:
+                    done = time.perf_counter()
+                    cache = self._cache()
+                    try:
+                        cache.put(cache.make_key(prompt, shell, target_provider, target_model,
+                                                 (environment or {}).get('context')), command)
+                    finally:
+                        cache.close()
+                    if timings is not None:
+                        timings['cache_write'] = time.perf_counter() - done
+                return command
+        raise error or RuntimeError("Every provider's circuit is open; try again later")
+
+    def _attempt(self, prompt: str, provider: str, model: str, shell: str, deadline: Optional[float],
+                 on_token: Optional[Callable[[str], None]], environment: Optional[Dict[str, Any]],
+                 timings: Optional[Dict[str, float]], usage: Optional[Dict[str, int]]) -> str:
+        def run(on_token):
+            # Runs on the deadline's worker thread, where the provider records its per-thread marks
+            start = time.perf_counter()
+            client = self.provider(provider)
+            sent = time.perf_counter()
+            command = client.get_shell_command(prompt, model, on_token=on_token, shell=shell, environment=environment)
+            done = time.perf_counter()
+            phases = {"provider_init": sent - start}
+            if isinstance(client, AIProvider):
+                phases.update(client.request_timings(sent, done))
+                return command, phases, client.request_usage()
+            phases['request'] = done - sent
+            return command, phases, None
+
+        command, phases, reported = call_with_deadline(run, deadline, on_token)
+        if not command:
+            raise RuntimeError("Empty response")
+        if timings is not None:
+            timings.update(phases)
+        if usage is not None and reported:
+            usage.update(reported)
+        return command
+
+    def race(self, prompt: str, targets: List[Tuple[str, str]], shell: str, hedge_delay: Optional[float] = None,
+             use_cache: bool = True, environment: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Ask several provider/model targets and return the first non-empty command.
+
+        With no hedge_delay all targets start at once. Otherwise each further
+        target starts hedge_delay seconds after the previous one, or as soon as
+        every running attempt has failed. Like generate, each attempt has a
+        deadline, providers whose circuit is open are skipped and failures count
+        towards the breaker. Attempts stream, so those still running when a
+        winner arrives are closed at their next token. Finished attempts carry
+        the token usage their provider reported.
+        """
+        settings = self.config.config['resilience']
+        breaker = CircuitBreaker(settings['breaker_threshold'], settings['breaker_cooldown'])
+        closed = {provider for provider, _ in targets if breaker.allow(provider)}
+        skipped = [{"provider": provider, "model": model, "status": "skipped", "error": "circuit open"}
+                   for provider, model in targets if provider not in closed]
+        targets = [(provider, model) for provider, model in targets if provider in closed]
+        if not targets:
+            raise RuntimeError("Every provider's circuit is open; try again later")
+
+        results = queue.Queue()
+        decided = threading.Event()
+        attempts = []
+        start = time.monotonic()
+
+        def cancel(token: str):
+            if decided.is_set():
+                raise RaceLost()
+
+        def run(attempt: Dict[str, Any]):
+            usage = {}
+            try:
+                command = self._attempt(prompt, attempt['provider'], attempt['model'], shell, settings['deadline'],
+                                        cancel, environment, None, usage)
+                results.put((attempt, command, None, usage))
+            except Exception as e:
+                results.put((attempt, None, e, usage))
+
+        def launch():
+            provider, model = targets[len(attempts)]
+            attempt = {"provider": provider, "model": model, "started": time.monotonic() - start}
+            attempts.append(attempt)
+            threading.Thread(target=run, args=(attempt,), daemon=True).start()
+
+        try:
+            launch()
+            while hedge_delay is None and len(attempts) < len(targets):
+                launch()
+
+            pending = len(attempts)
+            winner, error = None, None
+            while pending or len(attempts) < len(targets):
+                if not pending:
+                    launch()
+                    pending += 1
+                    continue
+                timeout = None
+                if len(attempts) < len(targets):
+                    timeout = max(0.0, start + hedge_delay * len(attempts) - time.monotonic())
+                try:
+                    attempt, command, error, usage = results.get(timeout=timeout)
+                except queue.Empty:
+                    launch()
+                    pending += 1
+                    continue
+                pending -= 1
+                attempt['latency'] = time.monotonic() - start - attempt['started']
+                if usage:
+                    attempt['usage'] = usage
+                if command:
+                    attempt['status'] = 'won'
+                    breaker.record_success(attempt['provider'])
+                    winner = attempt
+                    break
+                attempt['status'] = 'error'
+                attempt['error'] = str(error)
+                logger.warning(f"{attempt['provider']}:{attempt['model']} race attempt failed: {error}")
+                if is_retryable(error):
+                    breaker.record_failure(attempt['provider'])
+        finally:
+            decided.set()
+
+        elapsed = time.monotonic() - start
+        for attempt in attempts:
+            if 'status' not in attempt:
+                attempt['status'] = 'cancelled'
+                attempt['latency'] = elapsed - attempt['started']
+        attempts.extend(skipped)
+
+        if winner is None:
+            raise error or RuntimeError("No provider returned a command")
+        if use_cache:
+            cache = self._cache()
+            try:
+                cache.put(cache.make_key(prompt, shell, winner['provider'], winner['model'],
+                                         (environment or {}).get('context')), command)
+            finally:
+                cache.close()
+        return command, {
+            "mode": "race" if hedge_delay is None else "hedge",
+            "winner": f"{winner['provider']}:{winner['model']}",
+            "attempts": attempts
+        }
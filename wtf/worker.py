@@ -0,0 +1,198 @@
+"""Bookkeeping done after the command is on stdout: clipboard, history and telemetry"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+# Environment the clipboard tools need; sent along so the daemon copies to the caller's display
+CLIPBOARD_ENV = ["DISPLAY", "WAYLAND_DISPLAY", "XAUTHORITY", "XDG_RUNTIME_DIR"]
+
+# Detached workers allowed to run at once; past this the caller does the bookkeeping itself
+MAX_DETACHED = 4
+
+# Detached workers started by this process that may still be running, for wait()
+_children: List[subprocess.Popen] = []
+
+def get_slot_dir() -> Path:
+    """Get the directory of lock files, one per running detached worker"""
+    return Path.home() / '.config' / 'wtf' / 'workers'
+
+def _claim_slot(limit: int) -> Optional[int]:
+    """Lock a free worker slot; the locked fd, or None if all `limit` slots are busy"""
+    directory = get_slot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    for slot in range(limit):
+        fd = storage.try_lock(directory / f'{slot}.lock')
+        if fd is not None:
+            return fd
+    return None
+
+def clipboard_command(environ: Dict[str, str]) -> Optional[List[str]]:
+    """The clipboard tool to pipe text into for a caller with this environment, if there is one"""
+    if sys.platform == 'darwin':
+        return ['pbcopy']
+    if environ.get('WAYLAND_DISPLAY') and shutil.which('wl-copy'):
+        return ['wl-copy']
+    if environ.get('DISPLAY'):
+        if shutil.which('xclip'):
+            return ['xclip', '-selection', 'clipboard']
+        if shutil.which('xsel'):
+            return ['xsel', '--clipboard', '--input']
+    # WSL can reach the Windows clipboard
+    if shutil.which('clip.exe'):
+        return ['clip.exe']
+    return None
+
+def clipboard_available() -> bool:
+    """Whether a clipboard can be reached, checked before promising a copy that happens later"""
+    if sys.platform in ('win32', 'cygwin'):
+        return True
+    return clipboard_command(dict(os.environ)) is not None
+
+def copy(text: str, environ: Dict[str, str]):
+    """Copy text to the clipboard of the caller whose CLIPBOARD_ENV is environ.
+
+    The tool gets the caller's display variables in its own environment, so a
+    long-lived daemon never takes on one client's DISPLAY for the next.
+    """
+    if sys.platform in ('win32', 'cygwin'):
+        import pyperclip
+        pyperclip.copy(text)
+        return
+    env = {name: value for name, value in os.environ.items() if name not in CLIPBOARD_ENV}
+    env.update(environ)
+    command = clipboard_command(env)
+    if command is None:
+        raise RuntimeError("no clipboard tool found")
+    # The tools may fork to keep serving the selection, so don't wait on their output
+    subprocess.run(command, input=text.encode(), env=env, check=True, timeout=5,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def make_job(clipboard: Optional[str] = None, entries: Optional[List[Dict[str, Any]]] = None,
+             log: Optional[List[List[str]]] = None) -> Dict[str, Any]:
+    """Describe the work left after the command is printed; it must be JSON-serializable for the daemon"""
+    return {
+        "clipboard": clipboard,
+        "history": entries or [],
+        "log": log or [],
+        "environ": {name: os.environ[name] for name in CLIPBOARD_ENV if name in os.environ},
+    }
+
+def run_job(job: Dict[str, Any]):
+    """Copy to the clipboard, write the log lines and record history with the copy's timing"""
+    start = time.perf_counter()
+    for level, message in job.get('log', []):
+        logger.log(logging.getLevelName(level), message)
+    if job.get('clipboard') is not None:
+        copy_start = time.perf_counter()
+        try:
+            copy(job['clipboard'], job.get('environ') or {})
+        except Exception as e:
+            logger.debug(f"Failed to copy to clipboard: {e}")
+        # Recorded with the run's other phase timings, for --stats
+        elapsed = round(time.perf_counter() - copy_start, 4)
+        for entry in job.get('history', []):
+            entry.setdefault('metadata', {}).setdefault('timings', {})['clipboard'] = elapsed
+    if job.get('history'):
+        from .history import History
+        History().add_many(job['history'])
+    logger.debug(f"Bookkeeping took {(time.perf_counter() - start) * 1000:.1f}ms")
+
+def detach(job: Dict[str, Any], limit: int = MAX_DETACHED) -> bool:
+    """Run job in a new `python -m wtf.worker` process that outlives this one.
+
+    Returns False if it can't start, or if `limit` workers are already running.
+    The job goes over stdin, and the worker starts its own session without our
+    stdout, so a shell reading our output sees EOF as soon as we exit. It
+    inherits the lock on its slot and holds it until it exits.
+    """
+    _children[:] = [child for child in _children if child.poll() is None]
+    try:
+        slot = _claim_slot(limit)
+    except OSError as e:
+        logger.debug(f"Failed to claim a bookkeeping worker slot: {e}")
+        return False
+    if slot is None:
+        logger.debug(f"{limit} bookkeeping workers already running; finishing the job here")
+        return False
+    try:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'wtf.worker'],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True, pass_fds=(slot,) if storage.fcntl else ()
+        )
+        with process.stdin:
+            process.stdin.write(json.dumps(job).encode())
+    except OSError as e:
+        logger.debug(f"Failed to start bookkeeping worker: {e}")
+        return False
+    finally:
+        os.close(slot)
+    _children.append(process)
+    return True
+
+def submit(job: Dict[str, Any], detached: bool = True, limit: int = MAX_DETACHED):
+    """Finish job in a detached worker, or right here if that isn't possible"""
+    if not (detached and detach(job, limit)):
+        run_job(job)
+
+def wait(timeout: float = 10):
+    """Wait for the workers this process started, e.g. before reading the history they write"""
+    deadline = time.monotonic() + timeout
+    while _children:
+        _children[0].wait(max(deadline - time.monotonic(), 0))
+        _children.pop(0)
+
+class Worker:
+    """Runs jobs one at a time on a background thread, for the daemon.
+
+    At most `size` jobs wait; submit returns False when full so the caller
+    does the work itself. stop() finishes every queued job before returning.
+    """
+
+    def __init__(self, size: int = 100):
+        self.queue = queue.Queue(maxsize=size)
+        self.thread = threading.Thread(target=self._run, name='wtf-worker', daemon=True)
+
+    def start(self) -> 'Worker':
+        self.thread.start()
+        return self
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                run_job(job)
+            except Exception:
+                logger.exception("Bookkeeping job failed")
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+if __name__ == '__main__':
+    from .config import get_config
+    from .setup import ensure_directories, setup_logging
+
+    _, log_dir = ensure_directories()
+    setup_logging(log_dir, get_config().config.get('logging'))
+    run_job(json.loads(sys.stdin.buffer.read()))